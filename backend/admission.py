@@ -0,0 +1,212 @@
+# admission.py
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import jwt
+from config import CONFIG, JWT_ALGORITHM, JWT_SECRET, logger
+from metrics import Counter, Gauge, Histogram
+from starlette.responses import JSONResponse
+
+ADMISSION_QUEUE_DEPTH = Gauge("walmate_admission_queue_depth", "Chat requests waiting for a slot")
+ADMISSION_IN_FLIGHT = Gauge("walmate_admission_in_flight", "Chat requests currently being served")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "walmate_admission_wait_seconds", "Time chat requests spent queued before admission",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+)
+ADMISSION_REJECTED = Counter("walmate_admission_rejected_total", "Chat requests shed by admission control")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take one token; returns (admitted, seconds until a token is available)"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, 0.0
+            return False, (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def refund(self):
+        """Give back a token taken by a request that was then rejected"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class AdmissionController:
+    """Bounds in-flight chat work with token buckets and a bounded FIFO queue.
+
+    A request is first charged against its user's bucket (429 when empty)
+    and the global bucket (503 when empty). It then takes one of
+    `max_concurrent` slots, or waits in a queue of at most `max_queue`
+    entries for up to `queue_timeout` seconds before being shed with 503.
+    Tokens taken by a request that is then shed are refunded, so a client
+    retrying after a 503 isn't also rate limited for it.
+    """
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout, user_rate, user_burst,
+                 global_rate, global_burst, max_tracked_users=10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.user_buckets = OrderedDict()
+        self.max_tracked_users = max_tracked_users
+        self.in_flight = 0
+        self.waiters = deque()
+
+    def _user_bucket(self, user_key):
+        bucket = self.user_buckets.get(user_key)
+        if bucket is None:
+            bucket = self.user_buckets[user_key] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self.user_buckets) > self.max_tracked_users:
+                self.user_buckets.popitem(last=False)
+        else:
+            self.user_buckets.move_to_end(user_key)
+        return bucket
+
+    def _reject(self, reason, status_code, detail, retry_after):
+        ADMISSION_REJECTED.inc(reason=reason)
+        raise AdmissionRejected(status_code, detail, max(1, math.ceil(retry_after)))
+
+    def _update_gauges(self):
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters))
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    async def acquire(self, user_key):
+        user_bucket = self._user_bucket(user_key)
+        admitted, retry_after = user_bucket.try_acquire()
+        if not admitted:
+            self._reject("user_rate", 429, "Too many chat requests, please slow down", retry_after)
+
+        admitted, retry_after = self.global_bucket.try_acquire()
+        if not admitted:
+            user_bucket.refund()
+            self._reject("global_rate", 503, "Chat assistant is busy, please retry shortly", retry_after)
+
+        try:
+            await self._take_slot()
+        except (AdmissionRejected, asyncio.CancelledError):
+            user_bucket.refund()
+            self.global_bucket.refund()
+            raise
+
+    async def _take_slot(self):
+        """Take a concurrency slot, queueing for one if they are all in use"""
+        if self.in_flight < self.max_concurrent and not self.waiters:
+            self.in_flight += 1
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            self._reject("queue_full", 503, "Chat assistant is busy, please retry shortly",
+                         CONFIG["ADMISSION_RETRY_AFTER_SECONDS"])
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._update_gauges()
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            disconnected = isinstance(e, asyncio.CancelledError)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up on it
+                if disconnected:
+                    self.release()
+                    raise
+                ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+                return
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            self._update_gauges()
+            if disconnected:
+                raise
+            self._reject("queue_timeout", 503, "Chat assistant is busy, please retry shortly",
+                         CONFIG["ADMISSION_RETRY_AFTER_SECONDS"])
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter so queued requests keep FIFO order
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+
+def request_user_key(scope):
+    """Identify the caller by JWT subject, falling back to the client address"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            token = value.decode().partition(" ")[2]
+            try:
+                payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+                if payload.get("sub"):
+                    return f"user:{payload['sub']}"
+            except jwt.PyJWTError:
+                pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "anonymous"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission control to expensive endpoints only.
+
+    Cheap endpoints (catalog, auth, preferences) are never queued behind
+    chat traffic, so they keep responding while chat is being shed.
+    """
+
+    def __init__(self, app, controller, expensive_routes):
+        self.app = app
+        self.controller = controller
+        self.expensive_routes = expensive_routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.expensive_routes:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(request_user_key(scope))
+        except AdmissionRejected as e:
+            logger.warning(f"Shedding {scope['path']} with {e.status_code}: {e.detail}")
+            response = JSONResponse(
+                {"detail": e.detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
@@ -1,15 +1,30 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
+from admission import AdmissionController, AdmissionMiddleware
 from auth import (AuthSystem, create_access_token, get_user_preferences,
-                  verify_token)
-from chat import (ChatSystem, generate_chat_id, get_user_chat_ids,
-                  load_products_data, save_user_chat_id)
+                  user_record_buffer, verify_token)
+from catalog import get_product_store, is_indexed_key, read_product
+from chat import (ChatSystem, chat_history_lock, delete_chat_summary,
+                  generate_chat_id, get_chat_summaries, get_user_chat_ids,
+                  save_user_chat_id)
 from config import CONFIG, logger
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import (APIRouter, Depends, FastAPI, HTTPException, Query,
+                     WebSocket, status)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from models import (ChatHistoryItem, ChatMessage, ChatResponse,
+from fastapi.responses import PlainTextResponse
+from mailer import close_mailer, start_mailer
+from metrics import MetricsMiddleware, render_metrics, span
+from models import (AutocompleteResponse, AutocompleteSuggestion,
+                    ChatHistoryItem, ChatMessage, ChatResponse,
+                    ChatSessionSummaries, ChatSessionSummary,
                     MessageResponse, PasswordReset, PasswordResetConfirm,
-                    Preferences, TokenResponse, UserLogin, UserRegister)
+                    Preferences, ProductSearchResponse, TokenResponse,
+                    UserLogin, UserRegister)
+from passwords import password_hasher
+from profiling import ProfilingMiddleware
+from similar_products import similar_rows
+from ws_chat import serve_chat_connection
 
 # FastAPI app initialization
 app = FastAPI(
@@ -18,20 +33,52 @@ app = FastAPI(
     version="2.0.0"
 )
 
-# CORS middleware
+# Admission control: bounds in-flight chat work and sheds excess load early.
+# Shared by POST /api/chat and each /ws/chat turn.
+chat_admission = AdmissionController(
+    max_concurrent=CONFIG["ADMISSION_MAX_CONCURRENT_CHATS"],
+    max_queue=CONFIG["ADMISSION_MAX_QUEUE"],
+    queue_timeout=CONFIG["ADMISSION_QUEUE_TIMEOUT_SECONDS"],
+    user_rate=CONFIG["ADMISSION_USER_RATE"],
+    user_burst=CONFIG["ADMISSION_USER_BURST"],
+    global_rate=CONFIG["ADMISSION_GLOBAL_RATE"],
+    global_burst=CONFIG["ADMISSION_GLOBAL_BURST"]
+)
+if CONFIG["APP_MODE"] != "lite":
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=chat_admission,
+        expensive_routes={("POST", "/api/chat")}
+    )
+
+# Outside admission control so shed requests are counted too
+app.add_middleware(MetricsMiddleware, server_timing=CONFIG["SERVER_TIMING_ENABLED"])
+
+# Opt-in per-request profiling (signed header or PROFILING_SAMPLE_RATE)
+app.add_middleware(ProfilingMiddleware)
+
+# CORS middleware, added last so it is outermost: browsers can only read
+# shed (429/503) responses and their Retry-After if these carry CORS headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 
-# API Routes
-@app.post("/api/register", response_model=MessageResponse)
+# API Routes, grouped so lite workers can mount only the cheap ones
+auth_router = APIRouter()
+preferences_router = APIRouter()
+catalog_router = APIRouter()
+chat_router = APIRouter()
+
+
+@auth_router.post("/api/register", response_model=MessageResponse)
 async def register(user: UserRegister):
-    success, message = AuthSystem.register_user(user.username, user.email, user.password)
+    success, message = await password_hasher.run(AuthSystem.register_user, user.username, user.email, user.password)
     if not success:
         raise HTTPException(status_code=400, detail=message)
 
@@ -41,9 +88,9 @@ async def register(user: UserRegister):
 
 
 
-@app.post("/api/login", response_model=TokenResponse)
+@auth_router.post("/api/login", response_model=TokenResponse)
 async def login(user: UserLogin):
-    success, message = AuthSystem.authenticate_user(user.username, user.password)
+    success, message = await password_hasher.run(AuthSystem.authenticate_user, user.username, user.password)
     if not success:
         raise HTTPException(status_code=401, detail=message)
 
@@ -51,7 +98,7 @@ async def login(user: UserLogin):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.post("/api/forgot-password", response_model=MessageResponse)
+@auth_router.post("/api/forgot-password", response_model=MessageResponse)
 async def forgot_password(request: PasswordReset):
     success, message = AuthSystem.initiate_password_reset(request.email)
     if not success:
@@ -59,41 +106,35 @@ async def forgot_password(request: PasswordReset):
     return MessageResponse(message=message, success=True)
 
 
-@app.post("/api/reset-password", response_model=MessageResponse)
+@auth_router.post("/api/reset-password", response_model=MessageResponse)
 async def reset_password(request: PasswordResetConfirm):
-    success, message = AuthSystem.reset_password(request.token, request.new_password)
+    success, message = await password_hasher.run(AuthSystem.reset_password, request.token, request.new_password)
     if not success:
         raise HTTPException(status_code=400, detail=message)
     return MessageResponse(message=message, success=True)
 
 
-@app.get("/api/verify-email/{token}", response_model=MessageResponse)
+@auth_router.get("/api/verify-email/{token}", response_model=MessageResponse)
 async def verify_email(token: str):
-    success, message = AuthSystem.verify_token_auth(token)
+    success, message = await run_in_threadpool(AuthSystem.verify_token_auth, token)
     if not success:
         raise HTTPException(status_code=400, detail=message)
     return MessageResponse(message=message, success=True)
 
 
-@app.post("/api/preferences", response_model=MessageResponse)
+@preferences_router.post("/api/preferences", response_model=MessageResponse)
 async def save_preferences(
     prefs: Preferences,
     username: str = Depends(verify_token)
 ):
-    # Load users
-    users = AuthSystem.load_db(CONFIG["USER_DB_FILE"])
-    user = users.get(username)
-    if not user:
+    # Takes user_db_lock, which a write-behind flush may hold; keep it off the event loop
+    if not await run_in_threadpool(AuthSystem.save_preferences, username, prefs.dict()):
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Save preferences in user record
-    user['preferences'] = prefs.dict()
-    AuthSystem.save_db(CONFIG["USER_DB_FILE"], users)
-
     return MessageResponse(message="Preferences saved successfully", success=True)
 
 
-@app.get("/api/preferences", response_model=Preferences)
+@preferences_router.get("/api/preferences", response_model=Preferences)
 async def get_preferences(username: str = Depends(verify_token)):
     prefs = get_user_preferences(username)
     if not prefs:
@@ -101,18 +142,22 @@ async def get_preferences(username: str = Depends(verify_token)):
     return prefs
 
 
-@app.post("/api/chat", response_model=ChatResponse)
+@chat_router.post("/api/chat", response_model=ChatResponse)
 async def chat(message: ChatMessage, username: str = Depends(verify_token)):
     chat_id = message.chat_id
     if not chat_id:
         chat_id = generate_chat_id()
-        save_user_chat_id(username, chat_id)
+        with span("session_write"):
+            save_user_chat_id(username, chat_id)
 
-    # Pass username to include preferences in response
-    response = ChatSystem.get_response(message.message, chat_id, username)
+    # Pass username to include preferences in response.
+    # Run off the event loop so slow LLM calls don't stall cheap endpoints.
+    response = await run_in_threadpool(ChatSystem.get_response, message.message, chat_id, username)
 
     # Save to history
-    ChatSystem.add_to_history(chat_id, message.message, response["answer"])
+    with span("history_write"):
+        await run_in_threadpool(ChatSystem.add_to_history, chat_id, message.message, response["answer"],
+                                response["product_ids"], username)
 
     return ChatResponse(
         answer=response["answer"],
@@ -123,30 +168,63 @@ async def chat(message: ChatMessage, username: str = Depends(verify_token)):
     )
 
 
-@app.get("/api/chat-sessions", response_model=List[str])
+@chat_router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, token: Optional[str] = None, chat_id: Optional[str] = None):
+    # Browsers can't set headers on a WebSocket, so the JWT comes as ?token=
+    await serve_chat_connection(websocket, token, chat_id, chat_admission)
+
+
+@chat_router.get("/api/chat-sessions", response_model=List[str])
 async def get_chat_sessions(username: str = Depends(verify_token)):
     return get_user_chat_ids(username)
 
 
-@app.get("/api/chat-history/{chat_id}", response_model=List[ChatHistoryItem])
+@chat_router.get("/api/chat-sessions/summaries", response_model=ChatSessionSummaries)
+async def get_chat_session_summaries(
+    username: str = Depends(verify_token),
+    sort: str = Query("last_message_at", pattern="^(last_message_at|created_at|title|turns)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    summaries = get_chat_summaries(username)
+    if sort == "last_message_at":
+        # Chats without a message yet sort by when they were created
+        def key(summary):
+            return summary.get("last_message_at") or summary.get("created_at") or ""
+    else:
+        def key(summary):
+            return summary.get(sort) or (0 if sort == "turns" else "")
+    summaries.sort(key=key, reverse=order == "desc")
+
+    start = (page - 1) * page_size
+    return ChatSessionSummaries(
+        sessions=[ChatSessionSummary(**summary) for summary in summaries[start:start + page_size]],
+        total=len(summaries),
+        page=page,
+        page_size=page_size
+    )
+
+
+@chat_router.get("/api/chat-history/{chat_id}", response_model=List[ChatHistoryItem])
 async def get_chat_history(chat_id: str, username: str = Depends(verify_token)):
     # Verify user has access to this chat
     user_chats = get_user_chat_ids(username)
     if chat_id not in user_chats:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    history = ChatSystem.load_chat_history(chat_id)
-    return [ChatHistoryItem(prompt=item["prompt"], response=item["response"]) for item in history]
+    history = ChatSystem.hydrate_history(ChatSystem.load_chat_history(chat_id))
+    return [ChatHistoryItem(**item) for item in history]
 
 
-@app.post("/api/new-chat", response_model=dict)
+@chat_router.post("/api/new-chat", response_model=dict)
 async def new_chat(username: str = Depends(verify_token)):
     chat_id = generate_chat_id()
     save_user_chat_id(username, chat_id)
     return {"chat_id": chat_id}
 
 
-@app.delete("/api/chat/{chat_id}", response_model=MessageResponse)
+@chat_router.delete("/api/chat/{chat_id}", response_model=MessageResponse)
 async def delete_chat(chat_id: str, username: str = Depends(verify_token)):
     # Verify user has access to this chat
     user_chats = get_user_chat_ids(username)
@@ -156,20 +234,24 @@ async def delete_chat(chat_id: str, username: str = Depends(verify_token)):
     ChatSystem.clear_history(chat_id)
 
     # Remove from user's chat list
-    sessions = AuthSystem.load_db(CONFIG["CHAT_SESSIONS_FILE"])
-    if username in sessions:
-        sessions[username] = [cid for cid in sessions[username] if cid != chat_id]
-        AuthSystem.save_db(CONFIG["CHAT_SESSIONS_FILE"], sessions)
+    with chat_history_lock:
+        sessions = AuthSystem.load_db(CONFIG["CHAT_SESSIONS_FILE"])
+        if username in sessions:
+            sessions[username] = [cid for cid in sessions[username] if cid != chat_id]
+            AuthSystem.save_db(CONFIG["CHAT_SESSIONS_FILE"], sessions)
+    delete_chat_summary(username, chat_id)
 
     return MessageResponse(message="Chat deleted successfully", success=True)
 
 
-@app.get("/api/user-info")
+@auth_router.get("/api/user-info")
 async def get_user_info(username: str = Depends(verify_token)):
     users = AuthSystem.load_db(CONFIG["USER_DB_FILE"])
     user = users.get(username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    # Include a last_login that hasn't been flushed yet
+    user = user_record_buffer.overlay(username, user)
 
     return {
         "username": username,
@@ -181,35 +263,129 @@ async def get_user_info(username: str = Depends(verify_token)):
 
 
 # Product endpoints
-@app.get("/api/products", response_model=List[Dict[str, Any]])
+@catalog_router.get("/api/products", response_model=List[Dict[str, Any]])
 async def get_all_products():
-    return load_products_data()
+    return get_product_store().to_records()
+
+
+# Declared before /api/products/{product_id} so "search" and "autocomplete" aren't taken as ids
+@catalog_router.get("/api/products/search", response_model=ProductSearchResponse)
+async def search_products(
+    category: Optional[List[str]] = Query(None),
+    material: Optional[List[str]] = Query(None),
+    brand: Optional[List[str]] = Query(None),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    sort: Optional[str] = Query(None, pattern="^(price|id|brand|category|material)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(24, ge=1, le=100)
+):
+    store = get_product_store()
+    try:
+        rows, total, facets = store.facets.search(
+            {"category": category, "material": material, "brand": brand},
+            price_min=price_min, price_max=price_max, sort=sort, descending=order == "desc",
+            offset=(page - 1) * page_size, limit=page_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return ProductSearchResponse(
+        products=store.to_records(rows),
+        total=total,
+        page=page,
+        page_size=page_size,
+        facets=facets
+    )
 
 
-@app.get("/api/products/{product_id}", response_model=Dict[str, Any])
-async def get_product_by_id(product_id: str):
-    products = load_products_data()
+@catalog_router.get("/api/products/autocomplete", response_model=AutocompleteResponse)
+async def autocomplete_products(q: str = Query(..., max_length=100), limit: int = Query(8, ge=1, le=20)):
+    store = get_product_store()
+    index = store.text_index
+    return AutocompleteResponse(
+        query=q,
+        suggestions=[
+            AutocompleteSuggestion(
+                text=index.texts[entry],
+                field=index.fields[entry],
+                count=int(index.counts[entry]),
+                product_id=str(store.value(index.rows[entry], "id"))
+            )
+            for entry in index.complete(q, limit)
+        ]
+    )
 
-    # Try exact match first
-    for product in products:
-        if str(product["id"]) == product_id or str(product.get("product_code", "")).lower() == product_id.lower():
-            return product
 
-    # Try partial matches if needed
-    for product in products:
-        if product_id.lower() in str(product.get("product_code", "")).lower():
-            return product
-        if product_id.lower() in product["name"].lower():
+@catalog_router.get("/api/products/{product_id}", response_model=Dict[str, Any])
+async def get_product_by_id(product_id: str):
+    if not CONFIG["CATALOG_RESIDENT"]:
+        # Ids and codes are served from the NDJSON offset indexes without loading the catalog
+        product = read_product(product_id)
+        if product is not None:
             return product
+        if is_indexed_key(product_id):
+            raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+
+    store = get_product_store()
+
+    # Exact id or product code first, then partial codes, then a typo-tolerant brand/description match
+    row = store.find(product_id)
+    if row is not None:
+        return store.view(row).to_dict()
 
     raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
 
 
+@catalog_router.get("/api/products/{product_id}/similar", response_model=List[Dict[str, Any]])
+async def get_similar_products(product_id: str, limit: int = Query(8, ge=1, le=CONFIG["SIMILAR_PRODUCTS_K"])):
+    store = get_product_store()
+    row = store.row_for_id(product_id)
+    if row is None:
+        row = store.row_for_code(product_id, ignore_case=True)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+
+    try:
+        # Builds the table on the first request after a catalog or index change
+        rows = await run_in_threadpool(similar_rows, store, row, limit)
+    except ValueError as e:
+        logger.warning(f"Similar products unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail="Similar products are not available")
+    return store.to_records(rows)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     return {"message": "Smart Shopping Assistant API is running"}
 
 
+@app.on_event("startup")
+def start_email_delivery():
+    # Deliver mail an earlier run queued but didn't get to send
+    start_mailer()
+
+
+@app.on_event("shutdown")
+def flush_write_behind_buffers():
+    # Buffered last_login updates would otherwise be lost on a clean shutdown
+    user_record_buffer.close()
+    close_mailer()
+
+
+app.include_router(auth_router)
+app.include_router(preferences_router)
+app.include_router(catalog_router)
+if CONFIG["APP_MODE"] != "lite":
+    app.include_router(chat_router)
+
+
 # Run the app
 if __name__ == "__main__":
     import uvicorn
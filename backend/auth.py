@@ -1,10 +1,7 @@
-import hashlib
 import json
-import smtplib
+import threading
 import uuid
 from datetime import datetime, timedelta
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -12,7 +9,11 @@ import jwt
 from config import CONFIG, JWT_ALGORITHM, JWT_SECRET, logger
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from mailer import queue_email
+from metrics import storage_span
 from models import Preferences
+from passwords import password_hasher
+from write_behind import WriteBehindBuffer
 
 security = HTTPBearer()
 
@@ -28,29 +29,22 @@ class AuthSystem:
 
     @staticmethod
     def send_email(to_email, subject, body):
-        msg = MIMIMultipart()
-        msg['From'] = CONFIG["EMAIL_FROM"]
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
+        """Queue an email for background delivery (see mailer.py); True once it is in the outbox"""
         try:
-            with smtplib.SMTP(CONFIG["SMTP_SERVER"], CONFIG["SMTP_PORT"]) as server:
-                server.starttls()
-                server.login(CONFIG["SMTP_USERNAME"], CONFIG["SMTP_PASSWORD"])
-                server.send_message(msg)
+            queue_email(to_email, subject, body)
             return True
         except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
+            logger.error(f"Failed to queue email: {str(e)}")
             return False
 
     @staticmethod
     def load_db(filename):
         try:
-            if not Path(filename).exists():
-                return {}
-            with open(filename, "r") as f:
-                return json.load(f)
+            with storage_span("load_db", filename):
+                if not Path(filename).exists():
+                    return {}
+                with open(filename, "r") as f:
+                    return json.load(f)
         except Exception as e:
             logger.error(f"Error loading {filename}: {str(e)}")
             return {}
@@ -58,17 +52,30 @@ class AuthSystem:
     @staticmethod
     def save_db(filename, data):
         try:
-            with open(filename, "w") as f:
-                json.dump(data, f, indent=2)
+            AuthSystem.write_db(filename, data)
         except Exception as e:
             logger.error(f"Error saving {filename}: {str(e)}")
 
+    @staticmethod
+    def write_db(filename, data):
+        """save_db that raises, for callers that retry failed writes"""
+        with storage_span("save_db", filename), open(filename, "w") as f:
+            json.dump(data, f, indent=2)
+
     @staticmethod
     def hash_password(password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Slow on purpose: callers on the event loop go through password_hasher.run
+        return password_hasher.hash(password)
 
     @classmethod
     def register_user(cls, username, email, password):
+        # Hashed before taking the lock so registrations don't queue behind the KDF
+        password_hash = cls.hash_password(password)
+        with user_db_lock:
+            return cls._register_user(username, email, password, password_hash)
+
+    @classmethod
+    def _register_user(cls, username, email, password, password_hash):
         users = cls.load_db(CONFIG["USER_DB_FILE"])
         tokens = cls.load_db(CONFIG["VERIFICATION_TOKENS_FILE"])
 
@@ -86,7 +93,7 @@ class AuthSystem:
 
         users[username] = {
             "email": email,
-            "password_hash": cls.hash_password(password),
+            "password_hash": password_hash,
             "created_at": datetime.now().isoformat(),
             "verified": True,
             "last_login": datetime.now().isoformat(),
@@ -95,8 +102,25 @@ class AuthSystem:
         cls.save_db(CONFIG["USER_DB_FILE"], users)
         return True, "Account created and verified (DEV MODE)"
 
+    @classmethod
+    def save_preferences(cls, username, preferences):
+        """False if the user doesn't exist"""
+        with user_db_lock:
+            users = cls.load_db(CONFIG["USER_DB_FILE"])
+            user = users.get(username)
+            if not user:
+                return False
+            user["preferences"] = preferences
+            cls.save_db(CONFIG["USER_DB_FILE"], users)
+            return True
+
     @classmethod
     def verify_token_auth(cls, token):
+        with user_db_lock:
+            return cls._verify_token_auth(token)
+
+    @classmethod
+    def _verify_token_auth(cls, token):
         tokens = cls.load_db(CONFIG["VERIFICATION_TOKENS_FILE"])
         users = cls.load_db(CONFIG["USER_DB_FILE"])
 
@@ -132,15 +156,31 @@ class AuthSystem:
             return False, "User not found"
         if not user.get("verified", False):
             return False, "Email not verified. Please check your inbox."
-        if user["password_hash"] != cls.hash_password(password):
+        if not password_hasher.verify(password, user["password_hash"]):
             return False, "Invalid password"
+        if password_hasher.needs_rehash(user["password_hash"]):
+            cls.upgrade_password_hash(username, user["password_hash"], password)
 
-        # Update last login
-        user["last_login"] = datetime.now().isoformat()
-        cls.save_db(CONFIG["USER_DB_FILE"], users)
+        # Not worth a synchronous rewrite of the whole file; flushed in batches
+        user_record_buffer.set(username, last_login=datetime.now().isoformat())
 
         return True, "Login successful"
 
+    @classmethod
+    def upgrade_password_hash(cls, username, old_hash, password):
+        """Replace a legacy or lower-cost hash with one at the current cost"""
+        new_hash = cls.hash_password(password)
+        # Critical write: synchronous, and serialized with write-behind flushes
+        with user_db_lock:
+            users = cls.load_db(CONFIG["USER_DB_FILE"])
+            user = users.get(username)
+            # Skip if the password was changed meanwhile
+            if not user or user["password_hash"] != old_hash:
+                return
+            user["password_hash"] = new_hash
+            cls.save_db(CONFIG["USER_DB_FILE"], users)
+        logger.info(f"Upgraded password hash for {username}")
+
     @classmethod
     def initiate_password_reset(cls, email):
         users = cls.load_db(CONFIG["USER_DB_FILE"])
@@ -170,11 +210,18 @@ This link will expire in {CONFIG['PASSWORD_RESET_EXPIRY_HOURS']} hours.
 If you didn't request this, please ignore this email.
 """
         if cls.send_email(email, "Password Reset Request", email_body):
-            return True, "Password reset email sent"
+            return True, "Password reset email queued"
         return False, "Failed to send reset email"
 
     @classmethod
     def reset_password(cls, token, new_password):
+        password_hash = cls.hash_password(new_password)
+        # Critical write: synchronous, and serialized with write-behind flushes
+        with user_db_lock:
+            return cls._reset_password(token, new_password, password_hash)
+
+    @classmethod
+    def _reset_password(cls, token, new_password, password_hash):
         reset_tokens = cls.load_db(CONFIG["PASSWORD_RESET_TOKENS_FILE"])
         users = cls.load_db(CONFIG["USER_DB_FILE"])
 
@@ -193,7 +240,7 @@ If you didn't request this, please ignore this email.
         if len(new_password) < 8:
             return False, "Password must be at least 8 characters"
 
-        user["password_hash"] = cls.hash_password(new_password)
+        user["password_hash"] = password_hash
         del reset_tokens[token]
 
         cls.save_db(CONFIG["USER_DB_FILE"], users)
@@ -202,6 +249,20 @@ If you didn't request this, please ignore this email.
         return True, "Password reset successfully"
 
 
+# Every read-modify-write of USER_DB_FILE holds this lock, including
+# write-behind flushes, so concurrent writers can't drop each other's changes
+user_db_lock = threading.RLock()
+user_record_buffer = WriteBehindBuffer(
+    "user_records",
+    CONFIG["USER_DB_FILE"],
+    load=AuthSystem.load_db,
+    save=AuthSystem.write_db,
+    lock=user_db_lock,
+    interval=CONFIG["USER_WRITE_BEHIND_SECONDS"],
+    max_pending=CONFIG["USER_WRITE_BEHIND_MAX_PENDING"]
+)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -213,23 +274,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def token_username(token: str) -> Optional[str]:
+    """The username a JWT was issued to, or None if it is invalid or expired"""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return username
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return payload.get("sub")
     except jwt.PyJWTError:
+        return None
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    username = token_username(credentials.credentials)
+    if username is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return username
 
 
 def get_user_preferences(username: str) -> Optional[Preferences]:
@@ -0,0 +1,118 @@
+"""Exact vs HNSW retrieval at catalog scale.
+
+For each catalog size, generates a synthetic catalog (see
+synthetic_catalog.py) with attribute-derived vectors, builds the exact
+numpy index and an HNSW index, and measures recall@k of HNSW against
+exact search plus query latency over a sweep of ef values. Query vectors
+come from held-out synthetic products. The summary shows how latency
+grows relative to catalog size for both backends.
+
+Requires hnswlib. Building the 1M HNSW index takes several minutes and
+~2 GB of RAM at 384 dimensions.
+
+Usage (from backend/):
+    python benchmarks/ann_bench.py
+    python benchmarks/ann_bench.py --sizes 100000 1000000 --m 16 32 --ef 32 64 128 256
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from common import print_table, summarize, write_results
+from synthetic_catalog import generate_products, synthetic_vectors
+
+
+def directory_bytes(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def timed_search(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append({i for i, _ in hits})
+    return results, summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HNSW with exact search at catalog scale")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 300000, 1000000])
+    parser.add_argument("--dim", type=int, default=384, help="embedding size (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    from vector_index import HnswVectorIndex, IndexedDocument, NumpyVectorIndex
+
+    rows = []
+    for size in args.sizes:
+        print(f"Catalog of {size} products...")
+        products = list(generate_products(size + args.queries))
+        vectors = synthetic_vectors(products, args.dim)
+        catalog, queries = vectors[:size], vectors[size:]
+        documents = [IndexedDocument(p["product_code"], {"category": p["category"]}) for p in products[:size]]
+        del products
+
+        exact = NumpyVectorIndex(catalog, documents, {})
+        truth, exact_latency = timed_search(exact, queries, args.k)
+        rows.append({
+            "size": size, "backend": "exact", "m": "-", "ef": "-", "recall_at_k": 1.0,
+            "p50_ms": exact_latency["p50_ms"], "p95_ms": exact_latency["p95_ms"],
+            "build_s": 0, "index_mb": round(catalog.nbytes / 2 ** 20, 1),
+        })
+
+        for m in args.m:
+            index_dir = tempfile.mkdtemp(prefix="walmate-hnsw-")
+            try:
+                start = time.perf_counter()
+                hnsw = HnswVectorIndex.build_from_vectors(catalog, documents, index_dir, m=m,
+                                                          ef_construction=args.ef_construction)
+                build_seconds = time.perf_counter() - start
+                index_mb = round(directory_bytes(index_dir) / 2 ** 20, 1)
+                for ef in args.ef:
+                    hnsw.set_ef(ef)
+                    found, latency = timed_search(hnsw, queries, args.k)
+                    recall = sum(len(f & t) / len(t) for f, t in zip(found, truth)) / len(truth)
+                    rows.append({
+                        "size": size, "backend": "hnsw", "m": m, "ef": ef, "recall_at_k": round(recall, 4),
+                        "p50_ms": latency["p50_ms"], "p95_ms": latency["p95_ms"],
+                        "build_s": round(build_seconds, 1), "index_mb": index_mb,
+                    })
+            finally:
+                shutil.rmtree(index_dir, ignore_errors=True)
+
+    columns = ["size", "backend", "m", "ef", "recall_at_k", "p50_ms", "p95_ms", "build_s", "index_mb"]
+    print_table(rows, columns)
+
+    # Latency growth per backend configuration between the smallest and largest catalog
+    scaling = []
+    smallest, largest = min(args.sizes), max(args.sizes)
+    for row in rows:
+        if row["size"] != largest or largest == smallest:
+            continue
+        base = next(r for r in rows if r["size"] == smallest and r["backend"] == row["backend"]
+                    and r["m"] == row["m"] and r["ef"] == row["ef"])
+        scaling.append({
+            "backend": row["backend"], "m": row["m"], "ef": row["ef"],
+            "catalog_growth": round(largest / smallest, 1),
+            "p50_growth": round(row["p50_ms"] / base["p50_ms"], 2) if base["p50_ms"] else "",
+        })
+    if scaling:
+        print_table(scaling, ["backend", "m", "ef", "catalog_growth", "p50_growth"])
+
+    write_results("ann_bench", {"dim": args.dim, "k": args.k, "queries": args.queries,
+                                "ef_construction": args.ef_construction, "rows": rows,
+                                "scaling": scaling}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Memory and query cost of the product catalog: list of dicts vs ProductStore.
+
+Generates synthetic catalogs (see synthetic_catalog.py) and, for each
+representation, measures the memory it holds (tracemalloc), a price
+filter plus sort, and id/code lookups.
+
+Usage (from backend/):
+    python benchmarks/catalog_bench.py --sizes 100000 1000000
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from common import print_table, summarize, write_results
+from synthetic_catalog import generate_products
+
+
+def measure_memory(build):
+    """Bytes still allocated after build() returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)["p50_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare catalog representations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    from product_store import ProductStore
+
+    rows = []
+    for size in args.sizes:
+        print(f"Catalog of {size} products...")
+        # Round-trip through JSON so the dicts look like a freshly loaded products.json
+        payload = json.dumps(list(generate_products(size)))
+        rng = random.Random(3)
+        codes = [f"PID{rng.randrange(1, size + 1):03d}" for _ in range(1000)]
+        category = "Men's Jeans"
+
+        start = time.perf_counter()
+        dict_bytes, products = measure_memory(lambda: json.loads(payload))
+        dict_load = time.perf_counter() - start
+        by_code = {p["product_code"]: p for p in products}
+
+        def dict_filter_sort():
+            matches = [p for p in products if p["category"] == category and 500 <= p["price"] <= 1500]
+            return sorted(matches, key=lambda p: p["price"])
+
+        rows.append({
+            "size": size, "layout": "dicts", "memory_mb": round(dict_bytes / 2 ** 20, 1),
+            "load_s": round(dict_load, 2),
+            "filter_sort_ms": timed(dict_filter_sort, args.repeat),
+            "1k_lookups_ms": timed(lambda: [by_code[c] for c in codes], args.repeat),
+        })
+
+        start = time.perf_counter()
+        store_bytes, store = measure_memory(lambda: ProductStore(products))
+        store_load = time.perf_counter() - start
+        del products, by_code
+
+        def store_filter_sort():
+            return store.sort_rows(store.filter_rows(500, 1500, category=[category]), "price")
+
+        rows.append({
+            "size": size, "layout": "columnar", "memory_mb": round(store_bytes / 2 ** 20, 1),
+            "load_s": round(store_load, 2),
+            "filter_sort_ms": timed(store_filter_sort, args.repeat),
+            "1k_lookups_ms": timed(lambda: [store.view(store.row_for_code(c)) for c in codes], args.repeat),
+        })
+        del store, payload
+
+    print_table(rows, ["size", "layout", "memory_mb", "load_s", "filter_sort_ms", "1k_lookups_ms"])
+    write_results("catalog_bench", {"rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Startup benchmark: import time, memory and heavy modules loaded by app.py.
+
+Each run imports app.py in a fresh interpreter with -X importtime, once per
+APP_MODE, and records wall time, peak RSS, which heavy chat dependencies
+ended up in sys.modules, and the slowest top-level imports.
+
+Usage (from backend/):
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --modes lite --include-chat-init
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+from common import BACKEND_DIR, print_table, summarize, write_results
+
+HEAVY_MODULES = ["langchain", "langchain_community", "langchain_huggingface", "chromadb",
+                 "sentence_transformers", "torch", "numpy"]
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+chat_init_seconds = None
+if {include_chat_init}:
+    from chat import ChatSystem
+    start = time.perf_counter()
+    ChatSystem.initialize_chat_components()
+    chat_init_seconds = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print("PROBE_RESULT " + json.dumps({{
+    "import_seconds": import_seconds,
+    "chat_init_seconds": chat_init_seconds,
+    "peak_rss_mb": rss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "heavy_modules": [m for m in {heavy} if m in sys.modules],
+    "routes": sorted(r.path for r in app.app.routes),
+}}))
+"""
+
+
+def parse_importtime(stderr, top):
+    """Slowest top-level imports from -X importtime output (cumulative microseconds)"""
+    rows = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(3)) <= 1:
+            rows.append((int(match.group(2)), match.group(4)))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def run_probe(mode, include_chat_init):
+    env = dict(os.environ, APP_MODE=mode)
+    code = PROBE.format(include_chat_init=include_chat_init, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True)
+    result_line = next((l for l in proc.stdout.splitlines() if l.startswith("PROBE_RESULT ")), None)
+    if result_line is None:
+        raise RuntimeError(f"Probe failed for mode {mode}:\n{proc.stderr[-2000:]}")
+    return json.loads(result_line[len("PROBE_RESULT "):]), proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app.py startup cost per APP_MODE")
+    parser.add_argument("--modes", nargs="+", default=["full", "lite"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to report")
+    parser.add_argument("--include-chat-init", action="store_true",
+                        help="also time the first ChatSystem.initialize_chat_components()")
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    results = {}
+    rows = []
+    for mode in args.modes:
+        probes = []
+        stderr = ""
+        for _ in range(args.runs):
+            probe, stderr = run_probe(mode, args.include_chat_init)
+            probes.append(probe)
+        import_stats = summarize([p["import_seconds"] for p in probes])
+        results[mode] = {
+            "import": import_stats,
+            "chat_init": summarize([p["chat_init_seconds"] for p in probes if p["chat_init_seconds"]]),
+            "peak_rss_mb": round(max(p["peak_rss_mb"] for p in probes), 1),
+            "heavy_modules": probes[-1]["heavy_modules"],
+            "routes": probes[-1]["routes"],
+            "slowest_imports": parse_importtime(stderr, args.top),
+        }
+        rows.append({"mode": mode, "import_p50_ms": import_stats["p50_ms"],
+                     "peak_rss_mb": results[mode]["peak_rss_mb"],
+                     "routes": len(probes[-1]["routes"]),
+                     "heavy_modules": ",".join(probes[-1]["heavy_modules"]) or "-"})
+
+    print_table(rows, ["mode", "import_p50_ms", "peak_rss_mb", "routes", "heavy_modules"])
+    write_results("import_time", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
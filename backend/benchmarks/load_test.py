@@ -0,0 +1,292 @@
+"""End-to-end load test for the WalMate API.
+
+Starts backend/app.py under uvicorn against a throwaway data directory with
+the fake LLM backend, seeds synthetic users, then replays the prompts stored
+in data/chat_history.json as a mix of chat, product, history and login calls.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --users 200 --concurrency 32 --duration 60
+    python benchmarks/load_test.py --base-url http://localhost:8000 ...  # existing server
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from common import BACKEND_DIR, print_table, summarize, write_results
+
+DEFAULT_MIX = "chat=0.35,product=0.3,products=0.05,history=0.15,sessions=0.1,login=0.05"
+PASSWORD = "loadtest-password"
+
+
+def load_prompts(history_file):
+    with open(history_file) as f:
+        history = json.load(f)
+    prompts = [turn["prompt"] for turns in history.values() for turn in turns if turn.get("prompt")]
+    return prompts or ["suggest me pants under 500"]
+
+
+def seed_data_dir(data_dir, users):
+    """Copy the catalog and prompt template, and create synthetic users"""
+    source = BACKEND_DIR / "data"
+    for name in ("products.json", "prompt_template.txt"):
+        shutil.copy(source / name, os.path.join(data_dir, name))
+
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    # Current-format hash, so logins don't trigger hash upgrades mid-run
+    from passwords import password_hasher
+    password_hash = password_hasher.hash(PASSWORD)
+    credentials = {
+        f"loaduser{i}": {
+            "email": f"loaduser{i}@example.com",
+            "password_hash": password_hash,
+            "created_at": now,
+            "verified": True,
+            "last_login": now,
+            "preferences": {"size": "M", "colors": ["Black"], "categories": []} if i % 2 else None,
+        }
+        for i in range(users)
+    }
+    with open(os.path.join(data_dir, "user_credentials.json"), "w") as f:
+        json.dump(credentials, f)
+    for name in ("chat_history.json", "chat_sessions.json"):
+        with open(os.path.join(data_dir, name), "w") as f:
+            json.dump({}, f)
+
+
+def start_server(data_dir, port, args):
+    env = dict(
+        os.environ,
+        DATA_DIR=data_dir,
+        TEXT_FILE=str(BACKEND_DIR / "h.txt"),
+        LLM_BACKEND="fake",
+        FAKE_LLM_LATENCY_MS=str(args.fake_latency_ms),
+        FAKE_LLM_TOKENS_PER_SEC=str(args.fake_tokens_per_sec),
+    )
+    if not args.keep_admission_limits:
+        # Per-user buckets would dominate the results with 429s
+        env.setdefault("ADMISSION_USER_RATE", "1000")
+        env.setdefault("ADMISSION_USER_BURST", "1000")
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+class Client:
+    """One keep-alive connection per worker thread"""
+
+    def __init__(self, base_url):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+                return resp.status, data
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def wait_until_ready(base_url, timeout):
+    client = Client(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, _ = client.request("GET", "/")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+class LoadTest:
+    def __init__(self, args, prompts):
+        self.args = args
+        self.prompts = prompts
+        self.mix = [(name, float(weight)) for name, weight in
+                    (item.split("=") for item in args.mix.split(","))]
+        self.results = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+        self.users = [f"loaduser{i}" for i in range(args.users)]
+        self.tokens = {}
+        self.chats = defaultdict(list)
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, "client"):
+            self.local.client = Client(self.args.base_url)
+        return self.local.client
+
+    def timed(self, endpoint, method, path, body=None, token=None):
+        start = time.perf_counter()
+        try:
+            status, data = self.client().request(method, path, body, token)
+        except Exception:
+            status, data = 0, b""
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.results[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+        return status, data
+
+    def login(self, username):
+        status, data = self.timed("login", "POST", "/api/login", {"username": username, "password": PASSWORD})
+        if status == 200:
+            self.tokens[username] = json.loads(data)["access_token"]
+        return self.tokens.get(username)
+
+    def run_operation(self, rng):
+        username = rng.choice(self.users)
+        token = self.tokens.get(username) or self.login(username)
+        operation = rng.choices([name for name, _ in self.mix], weights=[w for _, w in self.mix])[0]
+
+        if operation == "chat":
+            chats = self.chats[username]
+            body = {"message": rng.choice(self.prompts)}
+            if chats and rng.random() < 0.7:
+                body["chat_id"] = rng.choice(chats)
+            status, data = self.timed("chat", "POST", "/api/chat", body, token)
+            if status == 200 and "chat_id" not in body:
+                chats.append(json.loads(data)["chat_id"])
+        elif operation == "product":
+            self.timed("product", "GET", f"/api/products/{rng.randint(1, 100)}")
+        elif operation == "products":
+            self.timed("products", "GET", "/api/products")
+        elif operation == "history":
+            chats = self.chats[username]
+            if chats:
+                self.timed("history", "GET", f"/api/chat-history/{rng.choice(chats)}", token=token)
+            else:
+                self.timed("sessions", "GET", "/api/chat-sessions", token=token)
+        elif operation == "sessions":
+            self.timed("sessions", "GET", "/api/chat-sessions", token=token)
+        elif operation == "login":
+            self.login(username)
+
+    def worker(self, worker_id, deadline, requests_per_worker):
+        rng = random.Random(self.args.seed + worker_id)
+        done = 0
+        while time.time() < deadline and (requests_per_worker is None or done < requests_per_worker):
+            self.run_operation(rng)
+            done += 1
+
+    def run(self):
+        args = self.args
+        requests_per_worker = args.requests // args.concurrency if args.requests else None
+        deadline = time.time() + (args.duration if not args.requests else 10 ** 9)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(self.worker, worker_id, deadline, requests_per_worker)
+                       for worker_id in range(args.concurrency)]
+            for future in futures:
+                future.result()
+        return time.time() - start
+
+    def report(self, elapsed):
+        endpoints = {}
+        total = 0
+        for endpoint, latencies in sorted(self.results.items()):
+            total += len(latencies)
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(count for status, count in statuses.items() if status == 0 or status >= 400)
+            endpoints[endpoint] = dict(
+                summarize(latencies),
+                throughput_rps=round(len(latencies) / elapsed, 2),
+                errors=errors,
+                statuses={str(k): v for k, v in statuses.items()},
+            )
+        return {
+            "config": dict(vars(self.args)),
+            "elapsed_seconds": round(elapsed, 3),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat history against the API under load")
+    parser.add_argument("--users", type=int, default=100, help="number of synthetic users")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="test duration in seconds")
+    parser.add_argument("--requests", type=int, default=0, help="total requests (overrides --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. chat=0.5,product=0.5")
+    parser.add_argument("--history-file", default=str(BACKEND_DIR / "data" / "chat_history.json"))
+    parser.add_argument("--base-url", help="use an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fake-latency-ms", type=float, default=300.0)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--keep-admission-limits", action="store_true",
+                        help="keep the default per-user chat rate limits")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.history_file)
+    server = None
+    data_dir = None
+    try:
+        if not args.base_url:
+            data_dir = tempfile.mkdtemp(prefix="walmate-load-")
+            seed_data_dir(data_dir, args.users)
+            server = start_server(data_dir, args.port, args)
+            args.base_url = f"http://127.0.0.1:{args.port}"
+        wait_until_ready(args.base_url, args.startup_timeout)
+
+        test = LoadTest(args, prompts)
+        # Warm up: the first chat call builds the embedding model and vector store
+        print("Warming up...")
+        token = test.login(test.users[0])
+        test.client().request("POST", "/api/chat", {"message": prompts[0]}, token)
+        test.results.clear()
+        test.statuses.clear()
+
+        print(f"Running {args.concurrency} workers against {args.base_url}...")
+        elapsed = test.run()
+        report = test.report(elapsed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    rows = [dict(endpoint=name, **{k: v for k, v in stats.items() if k != "statuses"})
+            for name, stats in report["endpoints"].items()]
+    print_table(rows, ["endpoint", "count", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors"])
+    print(f"Total: {report['total_requests']} requests in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']} req/s)")
+    write_results("load_test", report, args.output)
+
+
+if __name__ == "__main__":
+    main()
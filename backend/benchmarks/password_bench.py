@@ -0,0 +1,124 @@
+"""Login throughput at each scrypt cost setting.
+
+For every cost (log2 of scrypt's n), writes a user file hashed at that
+cost and drives AuthSystem.authenticate_user from concurrent coroutines,
+the way /api/login does: through the password hashing pool ("pool") or
+directly on the event loop ("inline", the old behavior). Reports logins/s,
+login latency and event loop lag, i.e. how late a 10 ms ticker wakes up
+while logins are running.
+
+Usage (from backend/):
+    python benchmarks/password_bench.py
+    python benchmarks/password_bench.py --costs 12 14 15 16 --workers 4 --logins 400
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from common import BACKEND_DIR, print_table, summarize, write_results
+
+PASSWORD = "bench-password"
+
+
+def write_users(data_dir, hasher, users):
+    now = datetime.now().isoformat()
+    # One hash shared by every user: the benchmark times verification, not setup
+    password_hash = hasher.hash(PASSWORD)
+    credentials = {
+        f"user{i}": {"email": f"user{i}@example.com", "password_hash": password_hash, "created_at": now,
+                     "verified": True, "last_login": now, "preferences": None}
+        for i in range(users)
+    }
+    with open(os.path.join(data_dir, "user_credentials.json"), "w") as f:
+        json.dump(credentials, f, indent=2)
+
+
+async def measure_lag(stop, lags, interval=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run_logins(hasher, mode, logins, concurrency, users):
+    from auth import AuthSystem
+
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    queue = list(range(logins))
+
+    async def client():
+        while queue:
+            username = f"user{queue.pop() % users}"
+            start = time.perf_counter()
+            if mode == "pool":
+                success, _ = await hasher.run(AuthSystem.authenticate_user, username, PASSWORD)
+            else:
+                success, _ = AuthSystem.authenticate_user(username, PASSWORD)
+                await asyncio.sleep(0)
+            assert success
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    return elapsed, latencies, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login throughput per scrypt cost")
+    parser.add_argument("--costs", type=int, nargs="+", default=[12, 14, 15], help="log2 of scrypt n")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="hashing pool size")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", default=["pool", "inline"], choices=["pool", "inline"])
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="password-bench-")
+    os.environ["DATA_DIR"] = data_dir
+    os.chdir(BACKEND_DIR)
+
+    import auth
+    from passwords import PasswordHasher
+
+    rows = []
+    for cost in args.costs:
+        hasher = PasswordHasher(n=2 ** cost, workers=args.workers)
+        auth.password_hasher = hasher
+        write_users(data_dir, hasher, args.users)
+        for mode in args.modes:
+            print(f"n=2^{cost}, {mode}...")
+            elapsed, latencies, lags = asyncio.run(
+                run_logins(hasher, mode, args.logins, args.concurrency, args.users))
+            login = summarize(latencies)
+            lag = summarize(lags)
+            rows.append({
+                "cost": f"2^{cost}",
+                "mode": mode,
+                "workers": args.workers if mode == "pool" else 1,
+                "logins_per_s": round(len(latencies) / elapsed, 1),
+                "login_p50_ms": login["p50_ms"],
+                "login_p95_ms": login["p95_ms"],
+                "loop_lag_p99_ms": lag.get("p99_ms"),
+                "loop_lag_max_ms": lag.get("max_ms"),
+            })
+        hasher.executor.shutdown()
+    auth.user_record_buffer.close()
+
+    print_table(rows, ["cost", "mode", "workers", "logins_per_s", "login_p50_ms", "login_p95_ms",
+                       "loop_lag_p99_ms", "loop_lag_max_ms"])
+    write_results("password_bench", {"args": vars(args), "rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Offline retrieval quality and latency evaluation.
+
+Builds (query -> expected product codes) gold pairs from the products the
+assistant recommended in data/chat_history.json plus the hand-labeled
+queries in benchmarks/gold_queries.json, then sweeps chunking strategy,
+k and retriever type. For every combination it reports recall@k, the
+context size sent to the LLM and retrieval latency.
+
+Usage (from backend/):
+    python benchmarks/retrieval_eval.py
+    python benchmarks/retrieval_eval.py --chunk-sizes 500 1000 --k 2 4 8 --search-types similarity mmr
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+import uuid
+from pathlib import Path
+
+from common import BACKEND_DIR, print_table, summarize, write_results
+
+PID_PATTERN = re.compile(r"\bPID\d{3}\b")
+
+
+def history_gold_pairs(history_file, products):
+    """Gold pairs from chat history.
+
+    Uses the PIDs the assistant cited in its responses, and the stored
+    "recommendations" entries when they still match the current catalog
+    (older history was recorded against a different catalog).
+    """
+    by_id = {p["id"]: p for p in products}
+    with open(history_file) as f:
+        history = json.load(f)
+
+    pairs = {}
+    dropped = 0
+    for turns in history.values():
+        for turn in turns:
+            codes = set(PID_PATTERN.findall(turn.get("response", "")))
+            for rec in turn.get("recommendations", []):
+                product = by_id.get(rec.get("id"))
+                if product and rec.get("name", "").lower() in f"{product['name']} {product['description']}".lower():
+                    codes.add(product["product_code"])
+                else:
+                    dropped += 1
+            if codes:
+                pairs.setdefault(turn["prompt"].strip(), set()).update(codes)
+
+    return [{"query": q, "expected": sorted(c), "source": "history"} for q, c in pairs.items()], dropped
+
+
+def load_gold(args, products):
+    gold, dropped = history_gold_pairs(args.history_file, products)
+    with open(args.gold_file) as f:
+        labeled = json.load(f)
+    gold += [dict(item, source="labeled") for item in labeled]
+    print(f"{len(gold)} gold queries ({len(labeled)} labeled, {dropped} stale history recommendations dropped)")
+    return gold
+
+
+def approx_tokens(text):
+    # ~4 characters per token for English text with MiniLM/Llama-style tokenizers
+    return math.ceil(len(text) / 4)
+
+
+def evaluate(retriever, gold):
+    recalls, latencies, tokens = [], [], []
+    for item in gold:
+        start = time.perf_counter()
+        docs = retriever.invoke(item["query"])
+        latencies.append(time.perf_counter() - start)
+
+        retrieved = set()
+        for doc in docs:
+            retrieved.update(PID_PATTERN.findall(doc.page_content))
+        expected = set(item["expected"])
+        recalls.append(len(expected & retrieved) / len(expected))
+        tokens.append(sum(approx_tokens(doc.page_content) for doc in docs))
+
+    latency = summarize(latencies)
+    return {
+        "recall_at_k": round(sum(recalls) / len(recalls), 4),
+        "context_tokens_mean": round(sum(tokens) / len(tokens), 1),
+        "context_tokens_max": max(tokens),
+        "retrieval_p50_ms": latency["p50_ms"],
+        "retrieval_p95_ms": latency["p95_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking, k and retriever type")
+    parser.add_argument("--history-file", default=str(BACKEND_DIR / "data" / "chat_history.json"))
+    parser.add_argument("--gold-file", default=str(Path(__file__).parent / "gold_queries.json"))
+    parser.add_argument("--text-file", default=str(BACKEND_DIR / "h.txt"))
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--overlap-ratio", type=float, default=0.2)
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--search-types", nargs="+", default=["similarity", "mmr"])
+    parser.add_argument("--no-product-chunks", action="store_true",
+                        help="skip the one-chunk-per-product strategy")
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    args = parser.parse_args()
+
+    from chat import get_retriever, load_embeddings, split_catalog_documents
+    from langchain_community.document_loaders import TextLoader
+    from langchain_community.vectorstores import Chroma
+
+    with open(BACKEND_DIR / "data" / "products.json") as f:
+        products = json.load(f)
+    gold = load_gold(args, products)
+
+    embeddings = load_embeddings()
+    docs = TextLoader(args.text_file).load()
+
+    strategies = [("recursive", size, int(size * args.overlap_ratio)) for size in args.chunk_sizes]
+    if not args.no_product_chunks:
+        strategies.append(("product", None, None))
+
+    rows = []
+    for strategy, chunk_size, overlap in strategies:
+        chunks = split_catalog_documents(docs, strategy, chunk_size, overlap)
+        start = time.perf_counter()
+        store = Chroma.from_documents(chunks, embeddings, collection_name=f"eval_{uuid.uuid4().hex[:8]}")
+        build_seconds = time.perf_counter() - start
+
+        for search_type in args.search_types:
+            for k in args.k:
+                row = {
+                    "strategy": strategy,
+                    "chunk_size": chunk_size or "-",
+                    "overlap": overlap if overlap is not None else "-",
+                    "chunks": len(chunks),
+                    "search_type": search_type,
+                    "k": k,
+                    "index_build_s": round(build_seconds, 2),
+                }
+                row.update(evaluate(get_retriever(store, k=k, search_type=search_type), gold))
+                rows.append(row)
+        store.delete_collection()
+
+    print_table(rows, ["strategy", "chunk_size", "chunks", "search_type", "k", "recall_at_k",
+                       "context_tokens_mean", "retrieval_p50_ms", "retrieval_p95_ms"])
+    write_results("retrieval_eval", {"gold_queries": len(gold), "rows": rows}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Storage-layer microbenchmark.
+
+Generates synthetic user, session and chat-history files at increasing
+sizes and times the JSON storage paths behind login, preference save,
+chat append, history fetch and session listing. Each scenario runs in its
+own process so peak RSS is measured per data size.
+
+Usage (from backend/):
+    python benchmarks/storage_bench.py --users 1000 10000 100000 --turns 10 100 1000
+    python benchmarks/storage_bench.py --users 1000000 --turns 10000 --iterations 3
+    python benchmarks/storage_bench.py --compare results/a.json results/b.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from queue import Empty
+
+from common import BACKEND_DIR, print_table, summarize, write_results
+
+PASSWORD = "bench-password"
+SAMPLE_PROMPTS = [
+    "suggest me pants under 500", "show me black t-shirts", "i need a hoodie for winter",
+    "women's dresses for a party", "cheapest jeans you have", "show shirts",
+]
+
+
+def generate_data(data_dir, users, turns, chats, seed=7):
+    """Write user_credentials/chat_sessions/chat_history files of the requested size"""
+    rng = random.Random(seed)
+    now = datetime.now().isoformat()
+    # Current-format hash, so logins don't trigger hash upgrades mid-run
+    from passwords import password_hasher
+    password_hash = password_hasher.hash(PASSWORD)
+    with open(BACKEND_DIR / "data" / "products.json") as f:
+        products = json.load(f)
+
+    credentials = {
+        f"user{i}": {
+            "email": f"user{i}@example.com",
+            "password_hash": password_hash,
+            "created_at": now,
+            "verified": True,
+            "last_login": now,
+            "preferences": {"size": "M", "colors": ["Black"], "categories": ["T-Shirts"]} if i % 3 == 0 else None,
+        }
+        for i in range(users)
+    }
+
+    # The first `chats` users own one chat each, holding `turns` turns
+    sessions = {f"user{i}": [f"chat_{i:08x}"] for i in range(min(users, chats))}
+    history = {}
+    for i in range(min(users, chats)):
+        chat_turns = []
+        for _ in range(turns):
+            turn = {
+                "prompt": rng.choice(SAMPLE_PROMPTS),
+                "response": "Here are a few options that match what you're looking for. " * 4,
+            }
+            if rng.random() < 0.5:
+                # Same shape as ChatSystem.add_to_history writes
+                turn["product_ids"] = [str(p["id"]) for p in rng.sample(products, 3)]
+                turn["catalog_version"] = "bench"
+            chat_turns.append(turn)
+        history[f"chat_{i:08x}"] = chat_turns
+
+    for name, data in (("user_credentials.json", credentials), ("chat_sessions.json", sessions),
+                       ("chat_history.json", history)):
+        with open(os.path.join(data_dir, name), "w") as f:
+            json.dump(data, f, indent=2)
+
+    return {name: os.path.getsize(os.path.join(data_dir, name))
+            for name in ("user_credentials.json", "chat_sessions.json", "chat_history.json")}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(data_dir, users, turns, chats, iterations, queue):
+    """Runs in a fresh process so peak RSS reflects only the storage operations"""
+    os.environ["DATA_DIR"] = data_dir
+    os.chdir(BACKEND_DIR)
+
+    from auth import AuthSystem
+    from chat import ChatSystem, get_user_chat_ids
+    from config import CONFIG
+
+    rng = random.Random(11)
+    owners = list(range(min(users, chats)))
+    timings = {"login": [], "preference_save": [], "chat_append": [], "history_fetch": [],
+               "session_list": []}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        timings[name].append(time.perf_counter() - start)
+
+    def save_preferences(username):
+        users_db = AuthSystem.load_db(CONFIG["USER_DB_FILE"])
+        users_db[username]["preferences"] = {"size": "L", "colors": ["Blue"], "categories": []}
+        AuthSystem.save_db(CONFIG["USER_DB_FILE"], users_db)
+
+    for _ in range(iterations):
+        username = f"user{rng.randrange(users)}"
+        owner = rng.choice(owners)
+        chat_id = f"chat_{owner:08x}"
+        timed("login", AuthSystem.authenticate_user, username, PASSWORD)
+        timed("preference_save", save_preferences, username)
+        timed("chat_append", ChatSystem.add_to_history, chat_id, "bench prompt", "bench response")
+        timed("history_fetch", ChatSystem.load_chat_history, chat_id)
+        timed("session_list", get_user_chat_ids, f"user{owner}")
+
+    queue.put({
+        "users": users,
+        "turns": turns,
+        "chats": min(users, chats),
+        "iterations": iterations,
+        "peak_rss_mb": peak_rss_mb(),
+        "operations": {name: summarize(values) for name, values in timings.items()},
+    })
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r["users"], r["turns"]): r for r in json.load(f)["results"]["scenarios"]}
+    with open(new_path) as f:
+        new = {(r["users"], r["turns"]): r for r in json.load(f)["results"]["scenarios"]}
+
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        for op, stats in new[key]["operations"].items():
+            before = old[key]["operations"].get(op, {}).get("p50_ms")
+            after = stats.get("p50_ms")
+            rows.append({
+                "users": key[0], "turns": key[1], "operation": op, "old_p50_ms": before,
+                "new_p50_ms": after, "speedup": round(before / after, 2) if before and after else "",
+            })
+    print_table(rows, ["users", "turns", "operation", "old_p50_ms", "new_p50_ms", "speedup"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON storage operations at scale")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000],
+                        help="turns per chat in the generated history")
+    parser.add_argument("--chats", type=int, default=200, help="number of chats in the history file")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--label", default="json", help="storage backend label stored with the results")
+    parser.add_argument("--output", help="result file (defaults to benchmarks/results/)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    scenarios = []
+    for users in args.users:
+        for turns in args.turns:
+            print(f"Scenario: {users} users, {turns} turns per chat...")
+            data_dir = tempfile.mkdtemp(prefix="walmate-storage-")
+            try:
+                file_sizes = generate_data(data_dir, users, turns, args.chats)
+                queue = ctx.Queue()
+                proc = ctx.Process(target=run_scenario,
+                                   args=(data_dir, users, turns, args.chats, args.iterations, queue))
+                proc.start()
+                while True:
+                    try:
+                        result = queue.get(timeout=1)
+                        break
+                    except Empty:
+                        if not proc.is_alive():
+                            raise RuntimeError(f"Scenario {users} users / {turns} turns failed")
+                proc.join()
+            finally:
+                shutil.rmtree(data_dir, ignore_errors=True)
+            result["file_bytes"] = file_sizes
+            scenarios.append(result)
+
+    rows = []
+    for scenario in scenarios:
+        for op, stats in scenario["operations"].items():
+            rows.append({"users": scenario["users"], "turns": scenario["turns"], "operation": op,
+                         "p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"],
+                         "peak_rss_mb": scenario["peak_rss_mb"]})
+    print_table(rows, ["users", "turns", "operation", "p50_ms", "p95_ms", "peak_rss_mb"])
+    write_results("storage_bench", {"backend": args.label, "scenarios": scenarios}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Synthetic catalog generator modeled on data/products.json.
+
+Brands, materials and feature lines are sampled from the real catalog;
+descriptions combine a gender, colour, fit and garment word of one of the
+h.txt categories, and prices follow that category's real price range.
+Each product also gets a `category` field, which products.json lacks.
+
+synthetic_vectors() derives stand-in embeddings from the same attributes
+(category, garment, colour, material, brand plus noise), so the vectors
+cluster the way real ones do without embedding 1M texts.
+
+Usage (from backend/):
+    python benchmarks/synthetic_catalog.py --count 100000 --output /tmp/products_100k.json
+"""
+
+import argparse
+import json
+import random
+
+import numpy as np
+
+from common import BACKEND_DIR
+
+CATEGORIES = {
+    "Men's T-Shirts": ("Men", ["T-Shirt", "Polo T-Shirt", "Henley T-Shirt", "Round Neck T-Shirt"]),
+    "Men's Shirts": ("Men", ["Casual Shirt", "Formal Shirt", "Oxford Shirt", "Linen Shirt"]),
+    "Men's Jeans": ("Men", ["Slim Fit Jeans", "Straight Jeans", "Tapered Jeans", "Skinny Jeans"]),
+    "Men's Pants & Trousers": ("Men", ["Chinos", "Formal Trousers", "Cargo Pants", "Joggers"]),
+    "Men's Jackets & Hoodies": ("Men", ["Bomber Jacket", "Denim Jacket", "Hoodie", "Puffer Jacket"]),
+    "Women's Tops & T-Shirts": ("Women", ["Top", "Crop Top", "T-Shirt", "Blouse"]),
+    "Women's Dresses": ("Women", ["Maxi Dress", "A-Line Dress", "Bodycon Dress", "Shirt Dress"]),
+    "Women's Jeans & Jeggings": ("Women", ["Skinny Jeans", "Jeggings", "Mom Jeans", "Flared Jeans"]),
+    "Women's Kurtas & Ethnic Wear": ("Women", ["Kurta", "Anarkali Kurta", "Kurta Set", "Palazzo Set"]),
+    "Unisex Hoodies & Sweatshirts": ("Unisex", ["Hoodie", "Sweatshirt", "Zip Hoodie", "Oversized Sweatshirt"]),
+}
+COLORS = ["Black", "White", "Navy", "Blue", "Grey", "Olive", "Maroon", "Beige", "Red", "Green",
+          "Pink", "Yellow", "Brown", "Mustard", "Lavender"]
+FITS = ["Slim Fit", "Regular Fit", "Relaxed Fit", "Printed", "Solid", "Striped", "Pure Cotton", "Casual"]
+
+
+def load_vocabulary(products_file=None):
+    with open(products_file or BACKEND_DIR / "data" / "products.json") as f:
+        products = json.load(f)
+    prices = [p["price"] for p in products]
+    return {
+        "brands": sorted({p["name"] for p in products}),
+        "materials": sorted({p["material"].strip() for p in products if p.get("material")}),
+        "features": sorted({p["durability"].strip() for p in products if p.get("durability")}),
+        # products.json lists the h.txt categories in order, ten products each
+        "price_ranges": {
+            category: (min(prices[i * 10:i * 10 + 10]), max(prices[i * 10:i * 10 + 10]))
+            for i, category in enumerate(CATEGORIES)
+        },
+    }
+
+
+def generate_products(count, seed=42, products_file=None):
+    """Yield `count` products with the products.json schema plus a category"""
+    rng = random.Random(seed)
+    vocab = load_vocabulary(products_file)
+    categories = list(CATEGORIES)
+    for i in range(1, count + 1):
+        category = rng.choice(categories)
+        gender, garments = CATEGORIES[category]
+        low, high = vocab["price_ranges"][category]
+        yield {
+            "id": i,
+            "product_code": f"PID{i:03d}",
+            "name": rng.choice(vocab["brands"]),
+            "description": f"{gender} {rng.choice(COLORS)} {rng.choice(FITS)} {rng.choice(garments)}",
+            "price": int(round(rng.uniform(low * 0.8, high * 1.2), -1)) - 1,
+            "material": rng.choice(vocab["materials"]),
+            "durability": rng.choice(vocab["features"]),
+            "category": category,
+            "imageUrl": "https://via.placeholder.com/300x300?text=Product+Image",
+        }
+
+
+def synthetic_vectors(products, dim=384, noise=0.35, seed=42):
+    """Clustered unit vectors: a sum of per-attribute directions plus Gaussian noise"""
+    rng = np.random.default_rng(seed)
+    directions = {}
+
+    def direction(key, weight):
+        if key not in directions:
+            directions[key] = rng.standard_normal(dim).astype(np.float32)
+        return weight * directions[key]
+
+    vectors = np.empty((len(products), dim), dtype=np.float32)
+    for row, product in enumerate(products):
+        words = product["description"].split()
+        vectors[row] = (
+            direction(("category", product["category"]), 1.0)
+            + direction(("garment", words[-1]), 0.6)
+            + direction(("color", words[1]), 0.5)
+            + direction(("material", product["material"]), 0.3)
+            + direction(("brand", product["name"]), 0.2)
+        )
+    vectors += noise * rng.standard_normal(vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic products.json")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    with open(args.output, "w") as f:
+        json.dump(list(generate_products(args.count, args.seed)), f)
+    print(f"Wrote {args.count} products to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Build the numpy or HNSW vector index offline.
+
+Embeds the catalog once and writes the index (embeddings.npy or hnsw.bin),
+documents.json and manifest.json to VECTOR_INDEX_DIR. Workers started with
+VECTOR_INDEX_BACKEND=numpy|hnsw then load it instead of embedding the
+catalog themselves.
+
+Usage (from backend/):
+    python build_index.py                          # h.txt, CHUNK_STRATEGY chunks
+    python build_index.py --source products --dtype float16
+    python build_index.py --output /srv/walmate/index
+    python build_index.py --backend hnsw --m 32 --ef-construction 400
+    python build_index.py --sharded                # one shard per h.txt category
+    python build_index.py --source products --update --dry-run   # show the catalog diff
+    python build_index.py --source products --update             # re-embed only changed products
+
+Every build and update also refreshes the similar products table
+(similar_products.py). Unless the index itself is per-product, that
+embeds one document per product into <output>/products first.
+"""
+
+import argparse
+import json
+import time
+
+from catalog import product_document_text, text_categories
+from config import CONFIG
+from ndjson_catalog import is_ndjson, iter_ndjson
+from vector_index import IndexedDocument
+
+
+def product_documents(products_file, text_file):
+    if is_ndjson(products_file):
+        products = iter_ndjson(products_file)
+    else:
+        with open(products_file) as f:
+            products = json.load(f)
+    categories = text_categories(text_file)
+    return [
+        IndexedDocument(
+            product_document_text(product),
+            {"source": products_file, "product_code": product.get("product_code", ""),
+             "category": product.get("category") or categories.get(product.get("product_code"), "")}
+        )
+        for product in products
+    ]
+
+
+def refresh_similar_products(index_dir):
+    """Precompute the similar products table so the first request doesn't pay for it"""
+    from catalog import get_product_store
+    from similar_products import build_similar_products, ensure_product_vectors
+
+    store = get_product_store()
+    try:
+        table = build_similar_products(store, ensure_product_vectors(store, index_dir))
+    except ValueError as e:
+        print(f"Skipped similar products: {e}")
+        return
+    print(f"Precomputed {table.shape[1]} similar products for {table.shape[0]} products")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the numpy or HNSW vector index")
+    parser.add_argument("--backend", choices=["numpy", "hnsw"],
+                        default="hnsw" if CONFIG["VECTOR_INDEX_BACKEND"] == "hnsw" else "numpy")
+    parser.add_argument("--source", choices=["text", "products"], default="text",
+                        help="embed h.txt chunks or one document per products.json entry")
+    parser.add_argument("--text-file", default=CONFIG["TEXT_FILE"])
+    parser.add_argument("--products-file", default=CONFIG["PRODUCTS_FILE"])
+    parser.add_argument("--chunk-strategy", default=CONFIG["CHUNK_STRATEGY"], choices=["recursive", "product"])
+    parser.add_argument("--dtype", default=CONFIG["VECTOR_INDEX_DTYPE"], choices=["float32", "float16"])
+    parser.add_argument("--m", type=int, default=CONFIG["HNSW_M"], help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=CONFIG["HNSW_EF_CONSTRUCTION"])
+    parser.add_argument("--ef", type=int, default=CONFIG["HNSW_EF"], help="HNSW query beam stored as default")
+    parser.add_argument("--sharded", action="store_true", default=CONFIG["VECTOR_INDEX_SHARDED"],
+                        help="one index per catalog category (text source uses per-product chunks)")
+    parser.add_argument("--update", action="store_true",
+                        help="embed and upsert only products added, changed or removed since the last build")
+    parser.add_argument("--dry-run", action="store_true", help="with --update, only print the diff")
+    parser.add_argument("--output", default=CONFIG["VECTOR_INDEX_DIR"])
+    args = parser.parse_args()
+
+    CONFIG.update({"VECTOR_INDEX_DTYPE": args.dtype, "HNSW_M": args.m,
+                   "HNSW_EF_CONSTRUCTION": args.ef_construction, "HNSW_EF": args.ef,
+                   "PRODUCTS_FILE": args.products_file})
+    from chat import build_vector_index, load_catalog_documents, load_embeddings
+
+    if args.sharded and args.source == "text" and args.chunk_strategy != "product":
+        print("Sharded indexes need category metadata; using the product chunk strategy")
+        args.chunk_strategy = "product"
+
+    if args.source == "text":
+        documents = load_catalog_documents(args.text_file, args.chunk_strategy)
+        extra = {"source": "text", "source_file": args.text_file, "chunk_strategy": args.chunk_strategy}
+    else:
+        documents = product_documents(args.products_file, args.text_file)
+        extra = {"source": "products", "source_file": args.products_file}
+
+    if args.update:
+        from vector_index import update_vector_index
+
+        start = time.perf_counter()
+        summary = update_vector_index(args.output, documents, None if args.dry_run else load_embeddings(),
+                                      dry_run=args.dry_run)
+        for change in ("added", "changed", "removed"):
+            codes = summary[change]
+            print(f"{change:>8}: {len(codes)}  {', '.join(codes[:10])}{' ...' if len(codes) > 10 else ''}")
+        print(f"Index version {summary['version']} ({time.perf_counter() - start:.1f}s)")
+        if not args.dry_run:
+            refresh_similar_products(args.output)
+        return
+
+    start = time.perf_counter()
+    index = build_vector_index(args.backend, documents, load_embeddings(), args.output, extra_manifest=extra,
+                               sharded=args.sharded)
+    shards = f", {len(index.manifest['shards'])} shards" if args.sharded else ""
+    print(f"Indexed {len(index)} documents ({index.manifest['dimension']}-d, {args.backend}{shards}) "
+          f"into {args.output} in {time.perf_counter() - start:.1f}s")
+    refresh_similar_products(args.output)
+
+
+if __name__ == "__main__":
+    main()
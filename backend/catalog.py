@@ -0,0 +1,165 @@
+# catalog.py
+
+import json
+import os
+import re
+from pathlib import Path
+
+from config import CONFIG, logger
+from metrics import record_cache
+from ndjson_catalog import OffsetIndex, is_ndjson, iter_ndjson, write_ndjson
+from product_store import (ProductCodeMap, ProductsById, ProductStore,
+                           normalize_product)
+
+# Both views follow the current ProductStore, so modules importing them see reloads
+product_code_map = ProductCodeMap()  # Maps ids, product codes and PID numbers to ID strings
+products_by_id = ProductsById()  # Maps numeric ID strings to ProductView rows
+products_mtime = None
+offset_index = None  # OffsetIndex over an NDJSON PRODUCTS_FILE, for read_product
+categories_cache = None  # (text file, mtime, categories) for read_product
+PRODUCT_KEY = re.compile(r"\d+|PID\d+", re.IGNORECASE)  # What read_product resolves without the store
+
+
+def text_categories(text_file=None):
+    """Product code -> "###" category heading in h.txt (products.json has no category)"""
+    categories = {}
+    category = ""
+    try:
+        with open(text_file or CONFIG["TEXT_FILE"], encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("###"):
+                    category = line.lstrip("#").strip()
+                for code in re.findall(r"\bPID\d{3}\b", line):
+                    categories.setdefault(code, category)
+    except OSError:
+        pass
+    return categories
+
+
+def cached_text_categories():
+    """text_categories(), parsed again only when the text file changes"""
+    global categories_cache
+    text_file = CONFIG["TEXT_FILE"]
+    try:
+        mtime = os.path.getmtime(text_file)
+    except OSError:
+        mtime = None
+    if categories_cache is None or categories_cache[:2] != (text_file, mtime):
+        categories_cache = (text_file, mtime, text_categories(text_file))
+    return categories_cache[2]
+
+
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/300x300?text=Product+Image"
+
+
+def with_image_urls(products):
+    """Validate product images"""
+    for product in products:
+        if "imageUrl" not in product or not product["imageUrl"]:
+            product["imageUrl"] = PLACEHOLDER_IMAGE_URL
+        yield product
+
+
+def read_products_file():
+    """Products from PRODUCTS_FILE: a JSON array, or an NDJSON catalog streamed line by line"""
+    file_path = CONFIG["PRODUCTS_FILE"]
+    default_products = [
+        {
+            "id": "prod_001",
+            "name": "Sample Product",
+            "description": "This is a sample product",
+            "price": 9.99,
+            "category": "Sample",
+            "stock": 100,
+            "imageUrl": PLACEHOLDER_IMAGE_URL
+        }
+    ]
+
+    try:
+        if not Path(file_path).exists():
+            if is_ndjson(file_path):
+                write_ndjson(default_products, file_path)
+            else:
+                with open(file_path, 'w') as f:
+                    json.dump(default_products, f, indent=2)
+            return default_products
+
+        if is_ndjson(file_path):
+            return with_image_urls(iter_ndjson(file_path))
+
+        with open(file_path, 'r') as f:
+            products = json.load(f)
+        return list(with_image_urls(products))
+    except Exception as e:
+        logger.error(f"Error loading products: {str(e)}")
+        return default_products
+
+
+def read_product(product_id):
+    """One product by id or product code straight from an NDJSON catalog's
+    offset indexes, without loading the catalog; None when it isn't there
+    or the catalog isn't NDJSON.
+
+    "4" and " 4 " are ids, "pid004" is a code in any case and "004" the
+    numeric part of PID004. The record is normalized like a resident
+    catalog's, without building a one-row store.
+    """
+    global offset_index
+    file_path = CONFIG["PRODUCTS_FILE"]
+    if not is_ndjson(file_path):
+        return None
+    key = str(product_id).strip()
+    try:
+        if offset_index is None or offset_index.path != file_path or \
+                offset_index.mtime != os.path.getmtime(file_path):
+            offset_index = OffsetIndex(file_path)
+        product = offset_index.read(key)
+        if product is None and key:
+            product = offset_index.read_code(key)
+        if product is None and key.isdigit():
+            product = offset_index.read_code(f"PID{key}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading product {product_id}: {str(e)}")
+        return None
+    if product is None:
+        return None
+    return normalize_product(next(with_image_urls([product])), cached_text_categories())
+
+
+def is_indexed_key(product_id):
+    """Whether read_product() missing `product_id` means it isn't in the
+    catalog, so the full store needn't be loaded to look for it"""
+    return is_ndjson(CONFIG["PRODUCTS_FILE"]) and PRODUCT_KEY.fullmatch(str(product_id).strip()) is not None
+
+
+def get_product_store():
+    """The columnar catalog, rebuilt only when PRODUCTS_FILE changes"""
+    global products_mtime
+    try:
+        mtime = os.path.getmtime(CONFIG["PRODUCTS_FILE"])
+    except OSError:
+        mtime = None
+
+    hit = products_by_id.store is not None and mtime is not None and mtime == products_mtime
+    record_cache("product_store", hit)
+    if not hit:
+        store = ProductStore(read_products_file(), text_categories())
+        product_code_map.store = products_by_id.store = store
+        products_mtime = mtime
+    return products_by_id.store
+
+
+def load_products_data():
+    """All products as dicts (whitespace-normalized, with their category)"""
+    return get_product_store().to_records()
+
+
+def product_document_text(product):
+    """Render a products.json entry the way h.txt lists it, for embedding"""
+    lines = [f"{product.get('name', '')} {product.get('description', '')} – ₹{product.get('price', '')}".strip()]
+    if product.get("product_code"):
+        lines.append(f"Product ID: {product['product_code']}")
+    for label, key in (("Material", "material"), ("Category", "category"), ("Features", "durability")):
+        if product.get(key):
+            lines.append(f"{label}: {' '.join(str(product[key]).split())}")
+    return "\n".join(lines)
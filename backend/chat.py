@@ -1,29 +1,67 @@
 # chat.py
 
 import json
+import os
 import re
+import textwrap
+import threading
 import time
 import uuid
+from contextlib import closing
+from datetime import datetime
 from pathlib import Path 
 from typing import Any, Dict, List
 
 from auth import AuthSystem, get_user_preferences
+from catalog import get_product_store, product_code_map, products_by_id
 from config import CONFIG, logger
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_community.vectorstores import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings  
-
-# Global variables for chat components
+from intent import PRODUCT_LOOKUP, TEMPLATE_INTENTS, IntentClassifier
+from llm import get_llm_backend
+from metrics import record_cache, span
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCall
+
+# Global variables for chat components. langchain, chromadb and
+# sentence-transformers (torch) are imported on first use, so workers that
+# never serve chat don't pay their import time and memory.
 embeddings = None
 vectors = None
-text_splitter = None
 final_documents = None
-product_code_map = {}  # Maps product codes to numeric IDs
+prompt_template_cache = None  # (mtime, template text)
+vector_index_mtime = None  # manifest mtime of the loaded numpy/hnsw index
+embeddings_lock = threading.Lock()
+
+DEFAULT_PROMPT_TEMPLATE = """You are a smart, friendly shopping assistant for WalMate.
+Follow these rules strictly:
+1. Only recommend products when explicitly asked or when appropriate to answer the question
+2. When recommending products, include them at the end in format: [RECOMMENDED: PID123, PID456]
+3. For greetings or general questions, don't recommend any products
+
+{preferences}
+<context>
+{context}
+</context>
+Current Question: {input}"""
+
+# Every read-modify-write of the chat history, session and summary files
+# holds this lock; turns are written from the threadpool, and concurrent
+# rewrites of a whole file would otherwise drop each other's entries
+chat_history_lock = threading.RLock()
+
+# Deadline, circuit breaker and hedging around the LLM call
+llm_guard = ResilientCall(
+    "llm",
+    timeout=CONFIG["LLM_DEADLINE_SECONDS"],
+    breaker=CircuitBreaker(
+        "llm",
+        failure_threshold=CONFIG["LLM_BREAKER_FAILURE_THRESHOLD"],
+        recovery_timeout=CONFIG["LLM_BREAKER_RECOVERY_SECONDS"]
+    ),
+    max_workers=CONFIG["LLM_MAX_WORKERS"],
+    hedge_enabled=CONFIG["LLM_HEDGE_ENABLED"],
+    hedge_percentile=CONFIG["LLM_HEDGE_PERCENTILE"],
+    hedge_min_samples=CONFIG["LLM_HEDGE_MIN_SAMPLES"],
+    hedge_default_delay=CONFIG["LLM_HEDGE_DEFAULT_DELAY"]
+)
 
 
 def generate_chat_id():
@@ -36,65 +74,258 @@ def get_user_chat_ids(username):
 
 
 def save_user_chat_id(username, chat_id):
-    sessions = AuthSystem.load_db(CONFIG["CHAT_SESSIONS_FILE"])
-    if username not in sessions:
-        sessions[username] = []
-    if chat_id not in sessions[username]:
-        sessions[username].append(chat_id)
-    AuthSystem.save_db(CONFIG["CHAT_SESSIONS_FILE"], sessions)
-
-
-def load_products_data():
-    file_path = CONFIG["PRODUCTS_FILE"]
-    default_products = [
-        {
-            "id": "prod_001",
-            "name": "Sample Product",
-            "description": "This is a sample product",
-            "price": 9.99,
-            "category": "Sample",
-            "stock": 100,
-            "imageUrl": "https://via.placeholder.com/300x300?text=Product+Image"
-        }
-    ]
+    with chat_history_lock:
+        sessions = AuthSystem.load_db(CONFIG["CHAT_SESSIONS_FILE"])
+        if username not in sessions:
+            sessions[username] = []
+        if chat_id not in sessions[username]:
+            sessions[username].append(chat_id)
+        AuthSystem.save_db(CONFIG["CHAT_SESSIONS_FILE"], sessions)
+        update_chat_summary(username, chat_id)
+
+
+def chat_title(prompt):
+    return textwrap.shorten(prompt, width=CONFIG["CHAT_TITLE_LENGTH"], placeholder="...")
+
+
+def summarize_history(chat_id, history):
+    """Summary of a chat that predates the summary index, built from its history"""
+    return {
+        "chat_id": chat_id,
+        "title": chat_title(history[0]["prompt"]) if history else "",
+        "turns": len(history),
+        "created_at": None,
+        "last_message_at": None,
+        "updated_at": datetime.now().isoformat()
+    }
+
+
+def update_chat_summary(username, chat_id, prompt=None):
+    """Record a new chat, or one more turn of an existing one, in the user's summary index"""
+    with chat_history_lock:
+        summaries = AuthSystem.load_db(CONFIG["CHAT_SUMMARIES_FILE"])
+        user_summaries = summaries.setdefault(username, {})
+        now = datetime.now().isoformat()
+        summary = user_summaries.setdefault(chat_id, {
+            "chat_id": chat_id, "title": "", "turns": 0, "created_at": now, "last_message_at": None
+        })
+        if prompt is not None:
+            if not summary["title"]:
+                summary["title"] = chat_title(prompt)
+            summary["turns"] += 1
+            summary["last_message_at"] = now
+        summary["updated_at"] = now
+        AuthSystem.save_db(CONFIG["CHAT_SUMMARIES_FILE"], summaries)
+
+
+def delete_chat_summary(username, chat_id):
+    with chat_history_lock:
+        summaries = AuthSystem.load_db(CONFIG["CHAT_SUMMARIES_FILE"])
+        if summaries.get(username, {}).pop(chat_id, None) is not None:
+            AuthSystem.save_db(CONFIG["CHAT_SUMMARIES_FILE"], summaries)
+
+
+def get_chat_summaries(username):
+    """Summaries of all the user's chats. Chats created before the index existed
+    are summarized from the history file once and saved."""
+    with chat_history_lock:
+        summaries = AuthSystem.load_db(CONFIG["CHAT_SUMMARIES_FILE"])
+        user_summaries = summaries.get(username, {})
+        chat_ids = get_user_chat_ids(username)
+        missing = [chat_id for chat_id in chat_ids if chat_id not in user_summaries]
+        if missing:
+            all_history = AuthSystem.load_db(CONFIG["CHAT_HISTORY_FILE"])
+            user_summaries = summaries.setdefault(username, {})
+            for chat_id in missing:
+                user_summaries[chat_id] = summarize_history(chat_id, all_history.get(chat_id, []))
+            AuthSystem.save_db(CONFIG["CHAT_SUMMARIES_FILE"], summaries)
+        return [user_summaries[chat_id] for chat_id in chat_ids]
+
+
+def split_by_product(docs):
+    """One chunk per numbered product entry, prefixed with its "###" category heading"""
+    from langchain_core.documents import Document
+
+    chunks = []
+    for doc in docs:
+        category = ""
+        entry = []
+
+        def flush():
+            if entry:
+                text = "\n".join(entry).strip()
+                code = re.search(r"\bPID\d{3}\b", text)
+                chunks.append(Document(
+                    page_content=f"### {category}\n{text}" if category else text,
+                    metadata=dict(doc.metadata, category=category,
+                                  product_code=code.group(0) if code else "")
+                ))
+                entry.clear()
+
+        for line in doc.page_content.splitlines():
+            if line.startswith("###"):
+                flush()
+                category = line.lstrip("#").strip()
+            elif re.match(r"^\d+\.\s", line):
+                flush()
+                entry.append(line)
+            elif entry or line.strip():
+                entry.append(line)
+        flush()
+    return chunks
+
+
+def split_catalog_documents(docs, strategy=None, chunk_size=None, chunk_overlap=None):
+    """Split the catalog text according to CONFIG["CHUNK_STRATEGY"] ("recursive" or "product")"""
+    strategy = strategy or CONFIG["CHUNK_STRATEGY"]
+    if strategy == "product":
+        return split_by_product(docs)
+    if strategy != "recursive":
+        raise ValueError(f"Unknown chunk strategy: {strategy}")
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or CONFIG["CHUNK_SIZE"],
+        chunk_overlap=CONFIG["CHUNK_OVERLAP"] if chunk_overlap is None else chunk_overlap
+    )
+    return splitter.split_documents(docs)
+
+
+def load_embeddings():
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=CONFIG["EMBEDDING_MODEL_NAME"],
+        model_kwargs={'device': 'cpu'}
+    )
+
+
+def get_embeddings():
+    """The embedding model, loaded on first use by the intent router or retrieval"""
+    global embeddings
+    if embeddings is None:
+        with embeddings_lock:
+            if embeddings is None:
+                embeddings = load_embeddings()
+    return embeddings
+
+
+def load_catalog_documents(text_file=None, strategy=None):
+    """Load h.txt and split it into the chunks that get embedded"""
+    from langchain_community.document_loaders import TextLoader
+
+    docs = TextLoader(text_file or CONFIG["TEXT_FILE"]).load()
+    return split_catalog_documents(docs, strategy)
+
+
+def build_vector_index(backend, documents, embeddings, index_dir, extra_manifest=None, sharded=None):
+    """Build a numpy or HNSW index (one per category when sharded) with the CONFIG build settings"""
+    from vector_index import VECTOR_INDEXES, ShardedVectorIndex
+
+    if backend == "hnsw":
+        options = {"m": CONFIG["HNSW_M"], "ef_construction": CONFIG["HNSW_EF_CONSTRUCTION"], "ef": CONFIG["HNSW_EF"]}
+    else:
+        options = {"dtype": CONFIG["VECTOR_INDEX_DTYPE"]}
+
+    if CONFIG["VECTOR_INDEX_SHARDED"] if sharded is None else sharded:
+        return ShardedVectorIndex.build(documents, embeddings, index_dir, shard_backend=backend,
+                                        build_options=options, extra_manifest=extra_manifest)
+    return VECTOR_INDEXES[backend].build(documents, embeddings, index_dir, extra_manifest=extra_manifest, **options)
+
+
+def load_vector_index(embeddings, backend=None):
+    """Load the prebuilt numpy, HNSW or sharded index, building it first if it doesn't exist yet"""
+    from vector_index import VECTOR_INDEXES, ShardedVectorIndex
+
+    backend = backend or CONFIG["VECTOR_INDEX_BACKEND"]
+    sharded = CONFIG["VECTOR_INDEX_SHARDED"]
+    index_class = ShardedVectorIndex if sharded else VECTOR_INDEXES[backend]
+    index_dir = CONFIG["VECTOR_INDEX_DIR"]
+
+    if not index_class.exists(index_dir):
+        logger.warning(f"No {backend} vector index in {index_dir}, building one now "
+                       f"(run build_index.py to do this offline)")
+        # Shards are per category, which only the per-product chunks carry
+        strategy = "product" if sharded else CONFIG["CHUNK_STRATEGY"]
+        build_vector_index(backend, load_catalog_documents(strategy=strategy), embeddings, index_dir,
+                           extra_manifest={"source": "text", "chunk_strategy": strategy})
+
+    load_options = {"ef": CONFIG["HNSW_EF"]} if backend == "hnsw" else {}
+    if sharded:
+        return ShardedVectorIndex.load(
+            index_dir, embeddings,
+            cache_bytes=CONFIG["VECTOR_SHARD_CACHE_MB"] * 2 ** 20,
+            min_similarity=CONFIG["SHARD_ROUTING_MIN_SIMILARITY"],
+            margin=CONFIG["SHARD_ROUTING_MARGIN"],
+            load_options=load_options
+        )
+    return index_class.load(index_dir, embeddings, **load_options)
+
+
+def vector_index_manifest_mtime():
+    try:
+        return os.path.getmtime(Path(CONFIG["VECTOR_INDEX_DIR"]) / "manifest.json")
+    except OSError:
+        return None
+
 
+def get_retriever(vector_store, k=None, search_type=None):
+    return vector_store.as_retriever(
+        search_type=search_type or CONFIG["RETRIEVER_SEARCH_TYPE"],
+        search_kwargs={"k": k or CONFIG["RETRIEVER_K"]}
+    )
+
+
+def load_prompt_template():
+    """Read the prompt template, re-reading the file only when it changes"""
+    global prompt_template_cache
+    prompt_file_path = CONFIG["PROMPT_TEMPLATE_FILE"]
     try:
-        if not Path(file_path).exists():
-            with open(file_path, 'w') as f:
-                json.dump(default_products, f, indent=2)
-            return default_products
-
-        with open(file_path, 'r') as f:
-            products = json.load(f)
-
-        # Validate product images
-        for product in products:
-            if "imageUrl" not in product or not product["imageUrl"]:
-                product["imageUrl"] = "https://via.placeholder.com/300x300?text=Product+Image"
-
-        # Build product code map
-        global product_code_map
-        product_code_map = {}  # Reset to ensure no stale data
-        for product in products:
-            # Map both numeric ID and product_code to the same ID string
-            if "id" in product:
-                product_code_map[str(product["id"])] = str(product["id"])
-            if "product_code" in product:
-                product_code_map[product["product_code"]] = str(product["id"])
-            # Add mapping for PID format
-            if "product_code" in product and product["product_code"].startswith("PID"):
-                numeric_part = product["product_code"][3:]
-                product_code_map[numeric_part] = str(product["id"])
-
-        return products
-    except Exception as e:
-        logger.error(f"Error loading products: {str(e)}")
-        return default_products
+        mtime = os.path.getmtime(prompt_file_path)
+    except OSError:
+        logger.error(f"Prompt template file not found: {prompt_file_path}")
+        return DEFAULT_PROMPT_TEMPLATE
+
+    hit = prompt_template_cache is not None and prompt_template_cache[0] == mtime
+    record_cache("prompt_template", hit)
+    if not hit:
+        with open(prompt_file_path, 'r') as f:
+            prompt_template_cache = (mtime, f.read())
+    return prompt_template_cache[1]
+
+
+def parse_recommendations(answer_text):
+    """Split the [RECOMMENDED: ...] section off an answer and map its codes to product IDs"""
+    product_ids = []
+
+    # Only extract product IDs if they're explicitly recommended
+    recommendation_marker = "[RECOMMENDED:"
+    if recommendation_marker in answer_text:
+        try:
+            # Extract the recommended products section
+            start_idx = answer_text.index(recommendation_marker) + len(recommendation_marker)
+            end_idx = answer_text.index("]", start_idx)
+            recommended_ids = answer_text[start_idx:end_idx].strip()
+
+            # Remove the recommendation section from the answer
+            answer_text = answer_text[:answer_text.index(recommendation_marker)].strip()
+
+            # Process the product IDs
+            for pid in [x.strip() for x in recommended_ids.split(",")]:
+                if pid in product_code_map:
+                    product_ids.append(product_code_map[pid])
+                else:
+                    logger.warning(f"Unmapped product ID: {pid}")
+        except Exception as e:
+            logger.error(f"Error parsing recommended products: {str(e)}")
+
+    return answer_text, product_ids
 
 
 def extract_product_ids(context_docs):
-    """Extract product IDs from context documents - FIXED VERSION"""
-    product_ids = set()
+    """Extract product IDs from context documents in order of appearance"""
+    product_ids = {}
     for doc in context_docs:
         content = doc.page_content
         # Robust pattern matching for product IDs
@@ -113,11 +344,42 @@ def extract_product_ids(context_docs):
                 normalized_pid = f"PID{pid}" if pid.isdigit() else pid
                 mapped_id = product_code_map.get(normalized_pid, normalized_pid)
                 if mapped_id:
-                    product_ids.add(mapped_id)
+                    product_ids[mapped_id] = None
 
     return list(product_ids)
 
 
+def legacy_recommendation_current(store, product):
+    """Whether a product dict embedded by an older catalog still describes the
+    product with the same id in `store`; ids were reassigned between catalogs"""
+    row = store.row_for_id(str(product.get("id")))
+    if row is None:
+        return False
+    current = store.to_records([row])[0]
+    return current.get("name") == product.get("name") and current.get("description") == product.get("description")
+
+
+def history_product_ids(item, store=None):
+    """Recommended product ids of a history entry, including entries written before
+    recommendations were stored as references (see migrate_chat_history.py). Legacy
+    products whose id now refers to a different product are left out."""
+    if "product_ids" in item:
+        return item["product_ids"]
+    store = store or get_product_store()
+    return [str(product["id"]) for product in item.get("recommendations", [])
+            if isinstance(product, dict) and "id" in product and legacy_recommendation_current(store, product)]
+
+
+def frozen_recommendations(item, store=None):
+    """Legacy product dicts that no longer match the catalog, shown as recorded"""
+    recommendations = [product for product in item.get("recommendations", []) if isinstance(product, dict)]
+    if "product_ids" in item:
+        # Migrated entries only keep the snapshots that didn't match
+        return recommendations
+    store = store or get_product_store()
+    return [product for product in recommendations if not legacy_recommendation_current(store, product)]
+
+
 class ChatSystem:
     @staticmethod
     def load_chat_history(chat_id):
@@ -126,18 +388,46 @@ class ChatSystem:
 
     @staticmethod
     def save_chat_history(chat_id, history):
-        all_history = AuthSystem.load_db(CONFIG["CHAT_HISTORY_FILE"])
-        all_history[chat_id] = history
-        AuthSystem.save_db(CONFIG["CHAT_HISTORY_FILE"], all_history)
+        with chat_history_lock:
+            all_history = AuthSystem.load_db(CONFIG["CHAT_HISTORY_FILE"])
+            all_history[chat_id] = history
+            AuthSystem.save_db(CONFIG["CHAT_HISTORY_FILE"], all_history)
 
     @staticmethod
-    def add_to_history(chat_id, prompt, response):
-        history = ChatSystem.load_chat_history(chat_id)
-        history.append({
-            "prompt": prompt,
-            "response": response
-        })
-        ChatSystem.save_chat_history(chat_id, history)
+    def add_to_history(chat_id, prompt, response, product_ids=None, username=None):
+        with chat_history_lock:
+            history = ChatSystem.load_chat_history(chat_id)
+            entry = {
+                "prompt": prompt,
+                "response": response
+            }
+            if product_ids:
+                # Only references are stored; hydrate_history looks the products up on read
+                entry["product_ids"] = [str(product_id) for product_id in product_ids]
+                entry["catalog_version"] = get_product_store().version
+            history.append(entry)
+            ChatSystem.save_chat_history(chat_id, history)
+            if username:
+                update_chat_summary(username, chat_id, prompt)
+
+    @staticmethod
+    def hydrate_history(history):
+        """History entries with their recommended products filled in from the current catalog.
+        Products no longer in the catalog are left out; legacy products recorded
+        against an older catalog are shown as recorded."""
+        store = get_product_store()
+        hydrated = []
+        for item in history:
+            product_ids = history_product_ids(item, store)
+            rows = [store.row_for_id(product_id) for product_id in product_ids]
+            hydrated.append({
+                "prompt": item["prompt"],
+                "response": item["response"],
+                "product_ids": product_ids,
+                "recommendations": store.to_records(row for row in rows if row is not None)
+                + frozen_recommendations(item, store)
+            })
+        return hydrated
 
     @staticmethod
     def clear_history(chat_id):
@@ -145,134 +435,186 @@ class ChatSystem:
 
     @staticmethod
     def initialize_chat_components():
-        global embeddings, vectors, text_splitter, final_documents
+        global embeddings, vectors, final_documents, vector_index_mtime
+
+        prebuilt = CONFIG["VECTOR_INDEX_BACKEND"] in ("numpy", "hnsw")
+        # build_index.py --update rewrites the manifest last; pick up the new version
+        if vectors is not None and prebuilt and vector_index_manifest_mtime() != vector_index_mtime:
+            logger.info("Vector index changed on disk, reloading")
+            vectors = None
 
         if vectors is None:
             try:
                 # Preload products to build mapping
-                load_products_data()
+                get_product_store()
 
-                model_name = "sentence-transformers/all-MiniLM-L6-v2"
-                embeddings = HuggingFaceEmbeddings(
-                    model_name=model_name,
-                    model_kwargs={'device': 'cpu'}
-                )
+                embeddings = get_embeddings()
 
-                # Load from h.txt file
-                txt_path = CONFIG["TEXT_FILE"]
-                loader = TextLoader(txt_path)
-                docs = loader.load()
+                if prebuilt:
+                    vectors = load_vector_index(embeddings)
+                    vector_index_mtime = vector_index_manifest_mtime()
+                    # Sharded indexes open their shards (and documents) lazily
+                    final_documents = getattr(vectors, "documents", None)
+                    logger.info(f"{CONFIG['VECTOR_INDEX_BACKEND']} vector index loaded "
+                                f"from {CONFIG['VECTOR_INDEX_DIR']}")
+                elif CONFIG["VECTOR_INDEX_BACKEND"] == "chroma":
+                    from langchain_community.vectorstores import Chroma
 
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=200
-                )
-                final_documents = text_splitter.split_documents(docs)
+                    final_documents = load_catalog_documents()
 
-                # Create vector store from text content
-                vectors = Chroma.from_documents(final_documents, embeddings)
+                    # Create vector store from text content
+                    vectors = Chroma.from_documents(final_documents, embeddings)
 
-                logger.info("Vector store initialized from h.txt")
+                    logger.info("Vector store initialized from h.txt")
+                else:
+                    raise ValueError(f"Unknown vector index backend: {CONFIG['VECTOR_INDEX_BACKEND']}")
             except Exception as e:
                 logger.error(f"Error initializing chat components: {str(e)}")
                 raise RuntimeError("Failed to initialize chat components") from e
 
     @staticmethod
-    def get_response(prompt_input: str, chat_id: str, username: str):
-        try:
-            ChatSystem.initialize_chat_components()
+    def route_intent(prompt_input: str):
+        """Answer greetings and direct product lookups without the LLM.
+
+        Returns a response dict, or None when the message should go through
+        retrieval and the LLM.
+        """
+        start = time.time()
+        # Embeddings are only loaded if the rules don't settle it; a failed load
+        # leaves the message to the LLM path
+        intent, confidence, codes = IntentClassifier.classify(prompt_input, get_embeddings)
+
+        if intent in TEMPLATE_INTENTS:
+            answer_text = IntentClassifier.template_answer(intent)
+            product_ids = []
+        elif intent == PRODUCT_LOOKUP:
+            get_product_store()
+            product_ids = [product_code_map[code] for code in codes if code in product_code_map]
+            if not product_ids:
+                answer_text = f"I couldn't find {', '.join(codes)} in our catalog. Could you check the product code?"
+            else:
+                lines = []
+                for pid in product_ids:
+                    product = products_by_id.get(pid, {})
+                    lines.append(
+                        f"{product.get('product_code', pid)}: {product.get('name', '')} "
+                        f"{product.get('description', '')} - ₹{product.get('price', '')}".strip()
+                    )
+                answer_text = "Here's what I found:\n" + "\n".join(lines)
+        else:
+            return None
+
+        logger.info(f"Intent router answered '{intent}' (confidence {confidence:.2f}) without LLM")
+        return {
+            "answer": answer_text,
+            "context": [],
+            "product_ids": product_ids,
+            "response_time": time.time() - start
+        }
 
-            llm = ChatGroq(
-                groq_api_key=CONFIG["GROQ_API_KEY"],
-                model_name="Llama3-8b-8192"
+    @staticmethod
+    def fallback_response(context_docs, response_time):
+        """Retrieval-only answer used when the LLM is slow, failing or circuit-broken"""
+        product_ids = [
+            pid for pid in extract_product_ids(context_docs) if pid in products_by_id
+        ][:CONFIG["LLM_FALLBACK_MAX_PRODUCTS"]]
+
+        if product_ids:
+            lines = [
+                f"- {products_by_id[pid]['name']} {products_by_id[pid].get('description', '')}".rstrip()
+                for pid in product_ids
+            ]
+            answer_text = (
+                "I'm having trouble putting together a detailed answer right now, "
+                "but these products match your search:\n" + "\n".join(lines)
             )
+        else:
+            answer_text = "I'm having trouble answering right now. Please try again in a moment."
+
+        return {
+            "answer": answer_text,
+            "context": [{"page_content": doc.page_content} for doc in context_docs],
+            "product_ids": product_ids,
+            "response_time": response_time
+        }
 
-            # Get user preferences
-            preferences = get_user_preferences(username)
-            prefs_text = ""
-
-            if preferences:
-                prefs_text = (
-                    f"User Preferences:\n"
-                    f"- Size: {preferences.size}\n"
-                    f"- Colors: {', '.join(preferences.colors) or 'Any'}\n"
-                    f"- Categories: {', '.join(preferences.categories) or 'All'}\n\n"
-                )
-
-            # --- START: Changes here to load prompt from file ---
-            prompt_file_path = CONFIG["PROMPT_TEMPLATE_FILE"]
-            try:
-                with open(prompt_file_path, 'r') as f:
-                    template_content = f.read()
-            except FileNotFoundError:
-                logger.error(f"Prompt template file not found: {prompt_file_path}")
-                # Fallback to a default or raise an error
-                template_content = """You are a smart, friendly shopping assistant for WalMate.
-Follow these rules strictly:
-1. Only recommend products when explicitly asked or when appropriate to answer the question
-2. When recommending products, include them at the end in format: [RECOMMENDED: PID123, PID456]
-3. For greetings or general questions, don't recommend any products
+    @staticmethod
+    def prepare_prompt(prompt_input: str, preferences):
+        """The LLM backend, rendered prompt and retrieved documents for a question"""
+        with span("components_init"):
+            record_cache("vector_store", vectors is not None)
+            ChatSystem.initialize_chat_components()
+            llm = get_llm_backend()
+
+        prefs_text = ""
+        if preferences:
+            prefs_text = (
+                f"User Preferences:\n"
+                f"- Size: {preferences.size}\n"
+                f"- Colors: {', '.join(preferences.colors) or 'Any'}\n"
+                f"- Categories: {', '.join(preferences.categories) or 'All'}\n\n"
+            )
 
-{preferences}
-<context>
-{context}
-</context>
-Current Question: {input}"""
+        with span("template_read"):
+            template_content = load_prompt_template()
 
+        with span("retrieval"):
+            retriever = get_retriever(vectors)
+            context_docs = retriever.invoke(prompt_input)
 
-            prompt = ChatPromptTemplate.from_template(template_content)
-            # --- END: Changes here ---
+        # Same document formatting as the stuff-documents chain
+        with span("prompt_render"):
+            prompt_text = template_content.format(
+                preferences=prefs_text,
+                context="\n\n".join(doc.page_content for doc in context_docs),
+                input=prompt_input
+            )
+        return llm, prompt_text, context_docs
 
-            document_chain = create_stuff_documents_chain(llm, prompt)
-            retriever = vectors.as_retriever()
-            retrieval_chain = create_retrieval_chain(retriever, document_chain)
+    @staticmethod
+    def finish_response(answer_text, context_docs, response_time):
+        with span("product_id_parse"):
+            answer_text, product_ids = parse_recommendations(answer_text)
 
-            input_data = {
-                "input": prompt_input,
-                "context": "",
-                "preferences": prefs_text
-            }
+        # Clean up the response text
+        answer_text = answer_text.replace("Answer:", "").strip()
 
-            start = time.time()
-            response = retrieval_chain.invoke(input_data)
-            response_time = time.time() - start
+        if not answer_text.strip():
+            answer_text = "I couldn't find information about that. Could you try asking in a different way?"
 
-            answer_text = response['answer']
-            product_ids = []
+        return {
+            "answer": answer_text,
+            "context": [{"page_content": doc.page_content} for doc in context_docs],
+            "product_ids": product_ids,
+            "response_time": response_time
+        }
 
-            # Only extract product IDs if they're explicitly recommended
-            recommendation_marker = "[RECOMMENDED:"
-            if recommendation_marker in answer_text:
-                try:
-                    # Extract the recommended products section
-                    start_idx = answer_text.index(recommendation_marker) + len(recommendation_marker)
-                    end_idx = answer_text.index("]", start_idx)
-                    recommended_ids = answer_text[start_idx:end_idx].strip()
-
-                    # Remove the recommendation section from the answer
-                    answer_text = answer_text[:answer_text.index(recommendation_marker)].strip()
-
-                    # Process the product IDs
-                    for pid in [x.strip() for x in recommended_ids.split(",")]:
-                        if pid in product_code_map:
-                            product_ids.append(product_code_map[pid])
-                        else:
-                            logger.warning(f"Unmapped product ID: {pid}")
-                except Exception as e:
-                    logger.error(f"Error parsing recommended products: {str(e)}")
-
-            # Clean up the response text
-            answer_text = answer_text.replace("Answer:", "").strip()
-
-            if not answer_text.strip():
-                answer_text = "I couldn't find information about that. Could you try asking in a different way?"
+    @staticmethod
+    def get_response(prompt_input: str, chat_id: str, username: str):
+        try:
+            if CONFIG["INTENT_ROUTER_ENABLED"]:
+                with span("intent_routing"):
+                    routed = ChatSystem.route_intent(prompt_input)
+                if routed:
+                    return routed
 
-            return {
-                "answer": answer_text,
-                "context": [{"page_content": doc.page_content} for doc in response["context"]],
-                "product_ids": product_ids,
-                "response_time": response_time
-            }
+            # Get user preferences
+            with span("preferences_load"):
+                preferences = get_user_preferences(username)
+
+            start = time.time()
+            llm, prompt_text, context_docs = ChatSystem.prepare_prompt(prompt_input, preferences)
+            try:
+                with span("llm"):
+                    answer_text = llm_guard.call(llm.generate, prompt_text)
+            except Exception as e:
+                if isinstance(e, CircuitOpenError):
+                    logger.warning("LLM circuit open, answering from retrieval only")
+                else:
+                    logger.error(f"LLM call failed, answering from retrieval only: {str(e)}")
+                return ChatSystem.fallback_response(context_docs, time.time() - start)
+
+            return ChatSystem.finish_response(answer_text, context_docs, time.time() - start)
         except Exception as e:
             logger.error(f"Error getting response: {str(e)}")
             return {
@@ -281,3 +623,58 @@ Current Question: {input}"""
                 "product_ids": [],
                 "response_time": 0.0
             }
+
+    @staticmethod
+    def stream_response(prompt_input: str, preferences):
+        """get_response for callers that already hold the user's preferences.
+
+        Yields ("token", text) while the LLM writes the answer, then ("done",
+        response) with the same response dict get_response returns. The
+        streamed text stops short of anything from the first "[" on, which
+        may be the recommendation marker; the final answer in "done" is the
+        authoritative text. The LLM gets the same deadline and circuit
+        breaker as get_response through llm_guard.stream, which cuts off a
+        stalled stream even between tokens. It is never hedged, since a
+        second stream would interleave tokens.
+        """
+        try:
+            if CONFIG["INTENT_ROUTER_ENABLED"]:
+                with span("intent_routing"):
+                    routed = ChatSystem.route_intent(prompt_input)
+                if routed:
+                    yield "done", routed
+                    return
+
+            start = time.time()
+            llm, prompt_text, context_docs = ChatSystem.prepare_prompt(prompt_input, preferences)
+            answer_text = ""
+            streamed = 0
+            held_back = False
+            try:
+                with span("llm"), closing(llm_guard.stream(llm.stream, prompt_text)) as tokens:
+                    for token in tokens:
+                        answer_text += token
+                        if not held_back:
+                            marker = answer_text.find("[", streamed)
+                            held_back = marker >= 0
+                            visible = marker if held_back else len(answer_text)
+                            if visible > streamed:
+                                yield "token", answer_text[streamed:visible]
+                                streamed = visible
+            except Exception as e:
+                if isinstance(e, CircuitOpenError):
+                    logger.warning("LLM circuit open, answering from retrieval only")
+                else:
+                    logger.error(f"LLM stream failed, answering from retrieval only: {str(e)}")
+                yield "done", ChatSystem.fallback_response(context_docs, time.time() - start)
+                return
+
+            yield "done", ChatSystem.finish_response(answer_text, context_docs, time.time() - start)
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield "done", {
+                "answer": "I encountered an error processing your request. Please try again.",
+                "context": [],
+                "product_ids": [],
+                "response_time": 0.0
+            }
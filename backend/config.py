@@ -12,27 +12,128 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# All JSON storage lives under DATA_DIR (overridable for load tests and benchmarks)
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
 # Configuration
 CONFIG = {
-    "USER_DB_FILE": "data/user_credentials.json",
-    "CHAT_HISTORY_FILE": "data/chat_history.json",
-    "VERIFICATION_TOKENS_FILE": "data/verification_tokens.json",
-    "PASSWORD_RESET_TOKENS_FILE": "data/password_reset_tokens.json",
-    "CHAT_SESSIONS_FILE": "data/chat_sessions.json",
+    "USER_DB_FILE": f"{DATA_DIR}/user_credentials.json",
+    "CHAT_HISTORY_FILE": f"{DATA_DIR}/chat_history.json",
+    "VERIFICATION_TOKENS_FILE": f"{DATA_DIR}/verification_tokens.json",
+    "PASSWORD_RESET_TOKENS_FILE": f"{DATA_DIR}/password_reset_tokens.json",
+    "CHAT_SESSIONS_FILE": f"{DATA_DIR}/chat_sessions.json",
+    "CHAT_SUMMARIES_FILE": f"{DATA_DIR}/chat_summaries.json",
     "EMAIL_REGEX": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
     "TOKEN_EXPIRY_HOURS": 24,
     "PASSWORD_RESET_EXPIRY_HOURS": 1,
+    # scrypt cost (see benchmarks/password_bench.py); raising it rehashes
+    # each password at its owner's next login
+    "PASSWORD_SCRYPT_N": int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14)),
+    "PASSWORD_SCRYPT_R": int(os.getenv('PASSWORD_SCRYPT_R', 8)),
+    "PASSWORD_SCRYPT_P": int(os.getenv('PASSWORD_SCRYPT_P', 1)),
+    "PASSWORD_HASH_WORKERS": int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))),
+    "CHAT_TITLE_LENGTH": 60,  # Session titles are the first prompt, shortened
+    # last_login and other low-value user fields are buffered and written in
+    # batches this often; 0 writes them through on every update
+    "USER_WRITE_BEHIND_SECONDS": float(os.getenv('USER_WRITE_BEHIND_SECONDS', 5)),
+    "USER_WRITE_BEHIND_MAX_PENDING": int(os.getenv('USER_WRITE_BEHIND_MAX_PENDING', 1000)),
     "SMTP_SERVER": os.getenv('SMTP_SERVER'),
     "SMTP_PORT": int(os.getenv('SMTP_PORT', 587)),
     "SMTP_USERNAME": os.getenv('SMTP_USERNAME'),
     "SMTP_PASSWORD": os.getenv('SMTP_PASSWORD'),
     "EMAIL_FROM": os.getenv('EMAIL_FROM', os.getenv('SMTP_USERNAME')),
+    # false for local stand-ins such as aiosmtpd that don't speak TLS
+    "SMTP_STARTTLS": os.getenv('SMTP_STARTTLS', 'true').lower() == 'true',
+    "SMTP_POOL_SIZE": int(os.getenv('SMTP_POOL_SIZE', 2)),
+    "SMTP_TIMEOUT_SECONDS": float(os.getenv('SMTP_TIMEOUT_SECONDS', 10)),
+    "SMTP_IDLE_SECONDS": float(os.getenv('SMTP_IDLE_SECONDS', 60)),
+    # Outgoing mail is queued here and sent by a background thread (see mailer.py)
+    "EMAIL_OUTBOX_FILE": f"{DATA_DIR}/email_outbox.json",
+    "EMAIL_MAX_ATTEMPTS": int(os.getenv('EMAIL_MAX_ATTEMPTS', 6)),
+    "EMAIL_RETRY_BASE_SECONDS": float(os.getenv('EMAIL_RETRY_BASE_SECONDS', 5)),
+    "EMAIL_RETRY_MAX_SECONDS": float(os.getenv('EMAIL_RETRY_MAX_SECONDS', 600)),
+    "EMAIL_LEASE_SECONDS": float(os.getenv('EMAIL_LEASE_SECONDS', 120)),
+    "EMAIL_POLL_SECONDS": float(os.getenv('EMAIL_POLL_SECONDS', 5)),
     "APP_URL": os.getenv('APP_URL', 'http://localhost:3000'),
     "GROQ_API_KEY": os.getenv('GROQ_API_KEY'),
-    "DATA_DIR": "data",
-    "PRODUCTS_FILE": "data/products.json",
-    "TEXT_FILE": "h.txt",
-    "PROMPT_TEMPLATE_FILE": "data/prompt_template.txt"
+    "DATA_DIR": DATA_DIR,
+    # A .ndjson/.jsonl catalog is streamed on load and indexed by byte offset
+    "PRODUCTS_FILE": os.getenv('PRODUCTS_FILE', f"{DATA_DIR}/products.json"),
+    # false: single-product reads go through the NDJSON offset index instead
+    # of loading the whole catalog into memory
+    "CATALOG_RESIDENT": os.getenv('CATALOG_RESIDENT', 'true').lower() == 'true',
+    "TEXT_FILE": os.getenv('TEXT_FILE', 'h.txt'),
+    "PROMPT_TEMPLATE_FILE": f"{DATA_DIR}/prompt_template.txt",
+    "INTENT_ROUTER_ENABLED": os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true',
+    "INTENT_CONFIDENCE_THRESHOLD": float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', 0.85)),
+    "INTENT_MAX_MODEL_WORDS": 8,
+    "INTENT_TRAINING_STEPS": 300,
+    "INTENT_LEARNING_RATE": 2.0,
+    "LLM_BACKEND": os.getenv('LLM_BACKEND', 'groq'),
+    "LLM_MODEL_NAME": os.getenv('LLM_MODEL_NAME', 'Llama3-8b-8192'),
+    "LLM_BASE_URL": os.getenv('LLM_BASE_URL', 'http://localhost:8080/v1'),
+    "LLM_API_KEY": os.getenv('LLM_API_KEY'),
+    "LLM_REQUEST_TIMEOUT": float(os.getenv('LLM_REQUEST_TIMEOUT', 30)),
+    "FAKE_LLM_LATENCY_MS": float(os.getenv('FAKE_LLM_LATENCY_MS', 300)),
+    "FAKE_LLM_TOKENS_PER_SEC": float(os.getenv('FAKE_LLM_TOKENS_PER_SEC', 200)),
+    "FAKE_LLM_RECOMMEND_COUNT": int(os.getenv('FAKE_LLM_RECOMMEND_COUNT', 3)),
+    "LLM_DEADLINE_SECONDS": float(os.getenv('LLM_DEADLINE_SECONDS', 15)),
+    "LLM_MAX_WORKERS": int(os.getenv('LLM_MAX_WORKERS', 16)),
+    "LLM_BREAKER_FAILURE_THRESHOLD": int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', 5)),
+    "LLM_BREAKER_RECOVERY_SECONDS": float(os.getenv('LLM_BREAKER_RECOVERY_SECONDS', 30)),
+    "LLM_HEDGE_ENABLED": os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true',
+    "LLM_HEDGE_PERCENTILE": float(os.getenv('LLM_HEDGE_PERCENTILE', 95)),
+    "LLM_HEDGE_MIN_SAMPLES": 20,
+    "LLM_HEDGE_DEFAULT_DELAY": float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', 5)),
+    "LLM_FALLBACK_MAX_PRODUCTS": 4,
+    "ADMISSION_MAX_CONCURRENT_CHATS": int(os.getenv('ADMISSION_MAX_CONCURRENT_CHATS', 8)),
+    "ADMISSION_MAX_QUEUE": int(os.getenv('ADMISSION_MAX_QUEUE', 32)),
+    "ADMISSION_QUEUE_TIMEOUT_SECONDS": float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', 5)),
+    "ADMISSION_USER_RATE": float(os.getenv('ADMISSION_USER_RATE', 0.5)),
+    "ADMISSION_USER_BURST": float(os.getenv('ADMISSION_USER_BURST', 5)),
+    "ADMISSION_GLOBAL_RATE": float(os.getenv('ADMISSION_GLOBAL_RATE', 50)),
+    "ADMISSION_GLOBAL_BURST": float(os.getenv('ADMISSION_GLOBAL_BURST', 100)),
+    "ADMISSION_RETRY_AFTER_SECONDS": 2,
+    # /ws/chat: turns kept in memory per connection, frames buffered for a
+    # slow client before the LLM stream is paused, and heartbeat timing
+    "WS_CHAT_HISTORY_TURNS": int(os.getenv('WS_CHAT_HISTORY_TURNS', 20)),
+    "WS_SEND_QUEUE_SIZE": int(os.getenv('WS_SEND_QUEUE_SIZE', 64)),
+    "WS_SEND_TIMEOUT_SECONDS": float(os.getenv('WS_SEND_TIMEOUT_SECONDS', 30)),
+    "WS_HEARTBEAT_SECONDS": float(os.getenv('WS_HEARTBEAT_SECONDS', 20)),
+    "WS_HEARTBEAT_TIMEOUT_SECONDS": float(os.getenv('WS_HEARTBEAT_TIMEOUT_SECONDS', 60)),
+    "SERVER_TIMING_ENABLED": os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true',
+    "CHUNK_STRATEGY": os.getenv('CHUNK_STRATEGY', 'recursive'),
+    "CHUNK_SIZE": int(os.getenv('CHUNK_SIZE', 1000)),
+    "CHUNK_OVERLAP": int(os.getenv('CHUNK_OVERLAP', 200)),
+    "RETRIEVER_K": int(os.getenv('RETRIEVER_K', 4)),
+    "RETRIEVER_SEARCH_TYPE": os.getenv('RETRIEVER_SEARCH_TYPE', 'similarity'),
+    "EMBEDDING_MODEL_NAME": os.getenv('EMBEDDING_MODEL_NAME', 'sentence-transformers/all-MiniLM-L6-v2'),
+    # "chroma" builds an in-memory Chroma store per worker; "numpy" (exact) and
+    # "hnsw" (approximate, needs hnswlib) load the prebuilt index from
+    # VECTOR_INDEX_DIR (see build_index.py)
+    "VECTOR_INDEX_BACKEND": os.getenv('VECTOR_INDEX_BACKEND', 'chroma'),
+    "VECTOR_INDEX_DIR": os.getenv('VECTOR_INDEX_DIR', 'index'),
+    "VECTOR_INDEX_DTYPE": os.getenv('VECTOR_INDEX_DTYPE', 'float32'),
+    "HNSW_M": int(os.getenv('HNSW_M', 16)),
+    "HNSW_EF_CONSTRUCTION": int(os.getenv('HNSW_EF_CONSTRUCTION', 200)),
+    "HNSW_EF": int(os.getenv('HNSW_EF', 64)),
+    # One index per h.txt category; queries search only the matching shards
+    "VECTOR_INDEX_SHARDED": os.getenv('VECTOR_INDEX_SHARDED', 'false').lower() == 'true',
+    "VECTOR_SHARD_CACHE_MB": float(os.getenv('VECTOR_SHARD_CACHE_MB', 256)),
+    "SHARD_ROUTING_MIN_SIMILARITY": float(os.getenv('SHARD_ROUTING_MIN_SIMILARITY', 0.25)),
+    "SHARD_ROUTING_MARGIN": float(os.getenv('SHARD_ROUTING_MARGIN', 0.05)),
+    # Neighbors precomputed per product for /api/products/{id}/similar
+    "SIMILAR_PRODUCTS_K": int(os.getenv('SIMILAR_PRODUCTS_K', 12)),
+    "PROFILING_SECRET": os.getenv('PROFILING_SECRET'),
+    "PROFILING_SAMPLE_RATE": float(os.getenv('PROFILING_SAMPLE_RATE', 0)),
+    "PROFILING_DIR": os.getenv('PROFILING_DIR', 'profiles'),
+    "PROFILING_INTERVAL_MS": float(os.getenv('PROFILING_INTERVAL_MS', 5)),
+    "PROFILING_MAX_SECONDS": float(os.getenv('PROFILING_MAX_SECONDS', 60)),
+    # Oldest profiles beyond this many are deleted
+    "PROFILING_MAX_FILES": int(os.getenv('PROFILING_MAX_FILES', 200)),
+    "PROFILING_SIGNATURE_TTL_SECONDS": 300,
+    # "full" serves every route; "lite" mounts only auth, preferences and catalog
+    "APP_MODE": os.getenv('APP_MODE', 'full')
 
 }
 
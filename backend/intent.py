@@ -0,0 +1,200 @@
+# intent.py
+
+import random
+import re
+from typing import Callable, List, Optional, Tuple
+
+from config import CONFIG, logger
+
+# Intent labels
+GREETING = "greeting"
+THANKS = "thanks"
+FAREWELL = "farewell"
+PRODUCT_LOOKUP = "product_lookup"
+SHOPPING = "shopping"
+
+# Intents that can be answered from templates without calling the LLM
+TEMPLATE_INTENTS = (GREETING, THANKS, FAREWELL)
+
+GREETING_PATTERN = re.compile(
+    r"^(hi+|hello+|hey+|hiya|howdy|yo|namaste|hola|greetings|"
+    r"good (morning|afternoon|evening|day))"
+    r"( there| walmate| buddy| friend)?[\s!.,?]*$"
+)
+# "ok" or "great" alone is an acknowledgement, not thanks; only counts in front of one
+THANKS_PATTERN = re.compile(
+    r"^((ok|okay|great|cool|awesome|perfect)[\s!.,]*)?"
+    r"(thanks|thank you|thx|ty|tysm|thanks a lot|thank you so much|much appreciated)"
+    r"( walmate| buddy| so much)?[\s!.,]*$"
+)
+FAREWELL_PATTERN = re.compile(
+    r"^(bye+|goodbye|good bye|see you|see ya|cya|take care|good night)"
+    r"( walmate| buddy| for now)?[\s!.,]*$"
+)
+PRODUCT_CODE_PATTERN = re.compile(r"\bPID\s*-?\s*(\d{1,3})\b", re.IGNORECASE)
+# Words that may surround a product code without turning it into a shopping question
+LOOKUP_FILLER_WORDS = {
+    "show", "me", "the", "a", "product", "item", "details", "detail", "of", "for",
+    "about", "what", "is", "whats", "tell", "open", "find", "get", "view", "see",
+    "and", "please", "pls", "info", "information", "on", "can", "you", "i", "want",
+    "to", "give", "display",
+}
+
+TEMPLATE_RESPONSES = {
+    GREETING: [
+        "Hi there! I'm WalMate, your shopping assistant. What are you looking for today?",
+        "Hello! Tell me what you're shopping for and I'll find the best options for you.",
+    ],
+    THANKS: [
+        "You're welcome! Let me know if there's anything else I can help you find.",
+        "Happy to help! Anything else you'd like to shop for?",
+    ],
+    FAREWELL: [
+        "Goodbye! Come back anytime you need shopping help.",
+        "See you soon! Happy shopping.",
+    ],
+}
+
+# Seed examples for the linear model used when the rules are not conclusive
+SEED_EXAMPLES = {
+    GREETING: [
+        "hi", "hello there", "hey how are you", "good morning walmate",
+        "hey what's up", "hello, how is it going", "hi, who are you",
+        "hey there, nice to meet you",
+    ],
+    THANKS: [
+        "thanks", "thank you so much", "thanks, that was helpful",
+        "great thanks a lot", "appreciate the help", "that's perfect thank you",
+        "awesome, thanks for the suggestions",
+    ],
+    FAREWELL: [
+        "bye", "goodbye, see you later", "that's all for now, bye",
+        "see you tomorrow", "ok bye take care", "i'm done, good night",
+    ],
+    SHOPPING: [
+        "suggest me pants under 500", "show me black t-shirts",
+        "i need running shoes", "recommend a cotton shirt for office",
+        "women's dresses for a party", "cheapest hoodie you have",
+        "jeans in size 32", "what jackets are good for winter",
+        "show shirts", "do you have kurtas", "compare nike and puma t-shirts",
+        "something warm under 2000",
+    ],
+}
+
+# Cached linear model: (labels, weights, bias)
+_intent_model = None
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def extract_product_codes(text: str) -> List[str]:
+    """Return explicit product codes (PID004 style) mentioned in the text"""
+    codes = []
+    for number in PRODUCT_CODE_PATTERN.findall(text):
+        code = f"PID{int(number):03d}"
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+def is_pure_lookup(text: str) -> bool:
+    """True when the message only names product codes plus filler words"""
+    remainder = PRODUCT_CODE_PATTERN.sub(" ", text.lower())
+    words = re.findall(r"[a-z']+", remainder)
+    return all(word.replace("'", "") in LOOKUP_FILLER_WORDS for word in words)
+
+
+def _train_intent_model(embeddings):
+    import numpy as np
+
+    labels = list(SEED_EXAMPLES.keys())
+    texts, targets = [], []
+    for idx, label in enumerate(labels):
+        texts.extend(SEED_EXAMPLES[label])
+        targets.extend([idx] * len(SEED_EXAMPLES[label]))
+
+    features = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-12
+    one_hot = np.eye(len(labels), dtype=np.float32)[targets]
+
+    # Multinomial logistic regression trained with plain gradient descent
+    weights = np.zeros((features.shape[1], len(labels)), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    for _ in range(CONFIG["INTENT_TRAINING_STEPS"]):
+        logits = features @ weights + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        grad = (probs - one_hot) / len(texts)
+        weights -= CONFIG["INTENT_LEARNING_RATE"] * (features.T @ grad + 1e-3 * weights)
+        bias -= CONFIG["INTENT_LEARNING_RATE"] * grad.sum(axis=0)
+
+    return labels, weights, bias
+
+
+class IntentClassifier:
+    @staticmethod
+    def classify_rules(text: str) -> Optional[Tuple[str, List[str]]]:
+        normalized = normalize_text(text)
+        if GREETING_PATTERN.match(normalized):
+            return GREETING, []
+        if THANKS_PATTERN.match(normalized):
+            return THANKS, []
+        if FAREWELL_PATTERN.match(normalized):
+            return FAREWELL, []
+
+        codes = extract_product_codes(normalized)
+        if codes and is_pure_lookup(normalized):
+            return PRODUCT_LOOKUP, codes
+        return None
+
+    @staticmethod
+    def classify_model(text: str, embeddings) -> Tuple[str, float]:
+        global _intent_model
+        import numpy as np
+
+        if _intent_model is None:
+            _intent_model = _train_intent_model(embeddings)
+            logger.info("Intent model trained on seed examples")
+
+        labels, weights, bias = _intent_model
+        vector = np.asarray(embeddings.embed_query(normalize_text(text)), dtype=np.float32)
+        vector /= np.linalg.norm(vector) + 1e-12
+        logits = vector @ weights + bias
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        return labels[best], float(probs[best])
+
+    @staticmethod
+    def classify(text: str, load_embeddings: Optional[Callable] = None) -> Tuple[str, float, List[str]]:
+        """Classify a chat message, returning (intent, confidence, product_codes).
+
+        Rules are checked first; the linear model only runs when the rules are
+        not conclusive, and `load_embeddings` is only called then. Anything
+        uncertain is treated as a shopping question so it still reaches the LLM.
+        """
+        ruled = IntentClassifier.classify_rules(text)
+        if ruled:
+            intent, codes = ruled
+            return intent, 1.0, codes
+
+        # Long messages are almost always real questions, skip the model
+        if load_embeddings is None or len(text.split()) > CONFIG["INTENT_MAX_MODEL_WORDS"]:
+            return SHOPPING, 0.0, []
+
+        try:
+            intent, confidence = IntentClassifier.classify_model(text, load_embeddings())
+        except Exception as e:
+            logger.error(f"Intent model failed: {str(e)}")
+            return SHOPPING, 0.0, []
+
+        if intent != SHOPPING and confidence < CONFIG["INTENT_CONFIDENCE_THRESHOLD"]:
+            return SHOPPING, confidence, []
+        return intent, confidence, []
+
+    @staticmethod
+    def template_answer(intent: str) -> str:
+        return random.choice(TEMPLATE_RESPONSES[intent])
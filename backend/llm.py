@@ -0,0 +1,149 @@
+# llm.py
+
+import hashlib
+import json
+import re
+import time
+import urllib.request
+from typing import Iterator, List
+
+from config import CONFIG, logger
+
+# Cached backend instance, rebuilt when CONFIG["LLM_BACKEND"] changes
+_backend = None
+
+
+class LLMBackend:
+    """Interface for the chat model used by ChatSystem.
+
+    Backends receive the fully rendered prompt and return the raw answer
+    text, including any [RECOMMENDED: ...] section.
+    """
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        yield self.generate(prompt)
+
+
+class GroqBackend(LLMBackend):
+    name = "groq"
+
+    def __init__(self):
+        from langchain_groq import ChatGroq
+
+        self.llm = ChatGroq(
+            groq_api_key=CONFIG["GROQ_API_KEY"],
+            model_name=CONFIG["LLM_MODEL_NAME"]
+        )
+
+    def generate(self, prompt: str) -> str:
+        return self.llm.invoke(prompt).content
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.llm.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Talks to a local server exposing /v1/chat/completions (vLLM, llama.cpp, Ollama...)"""
+    name = "openai_compatible"
+
+    def __init__(self):
+        self.url = CONFIG["LLM_BASE_URL"].rstrip("/") + "/chat/completions"
+        self.headers = {"Content-Type": "application/json"}
+        if CONFIG["LLM_API_KEY"]:
+            self.headers["Authorization"] = f"Bearer {CONFIG['LLM_API_KEY']}"
+
+    def _request(self, prompt: str, stream: bool):
+        payload = {
+            "model": CONFIG["LLM_MODEL_NAME"],
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        }
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), headers=self.headers, method="POST"
+        )
+        return urllib.request.urlopen(request, timeout=CONFIG["LLM_REQUEST_TIMEOUT"])
+
+    def generate(self, prompt: str) -> str:
+        with self._request(prompt, stream=False) as resp:
+            body = json.load(resp)
+        return body["choices"][0]["message"]["content"]
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        with self._request(prompt, stream=True) as resp:
+            for raw_line in resp:
+                line = raw_line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic stand-in for load tests and offline benchmarks.
+
+    Sleeps for FAKE_LLM_LATENCY_MS before the first token, then emits tokens
+    at FAKE_LLM_TOKENS_PER_SEC. Recommendations are picked from the product
+    codes present in the retrieved context, seeded by the prompt text, so the
+    same prompt always yields the same answer. Only the <context> section is
+    scanned: the instructions around it carry example codes such as PID123.
+    """
+    name = "fake"
+
+    def __init__(self):
+        self.latency = CONFIG["FAKE_LLM_LATENCY_MS"] / 1000.0
+        self.tokens_per_sec = CONFIG["FAKE_LLM_TOKENS_PER_SEC"]
+        self.recommend_count = CONFIG["FAKE_LLM_RECOMMEND_COUNT"]
+
+    def _tokens(self, prompt: str) -> List[str]:
+        seed = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+        context = re.search(r"<context>(.*?)</context>", prompt, re.S)
+        codes = list(dict.fromkeys(re.findall(r"\bPID\d{3}\b", context.group(1)))) if context else []
+
+        words = ["Here", " are", " a", " few", " options", " that", " match", " what", " you're",
+                 " looking", " for", "."]
+        words += [" Each", " one", " is", " popular", " with", " our", " customers", "."] * (seed % 3)
+        tokens = list(words)
+        if codes and self.recommend_count > 0:
+            start = seed % len(codes)
+            picked = [codes[(start + i) % len(codes)] for i in range(min(self.recommend_count, len(codes)))]
+            tokens.append(f"\n\n[RECOMMENDED: {', '.join(picked)}]")
+        return tokens
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        time.sleep(self.latency)
+        delay = 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        for token in self._tokens(prompt):
+            if delay:
+                time.sleep(delay)
+            yield token
+
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
+
+
+LLM_BACKENDS = {
+    GroqBackend.name: GroqBackend,
+    OpenAICompatibleBackend.name: OpenAICompatibleBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    name = CONFIG["LLM_BACKEND"]
+    if _backend is None or _backend.name != name:
+        if name not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {name}")
+        _backend = LLM_BACKENDS[name]()
+        logger.info(f"Using LLM backend: {name}")
+    return _backend
@@ -0,0 +1,373 @@
+"""Background email delivery: durable outbox, pooled SMTP connections, retries.
+
+queue_email() appends a message to the outbox file and returns at once.
+A delivery thread in each worker process claims due messages (a lease
+keeps the other processes off them), sends them over pooled SMTP
+connections and removes them from the outbox, or schedules a retry with
+exponential backoff. Messages left in the outbox by a crash or restart
+are retried once their lease expires. After EMAIL_MAX_ATTEMPTS a message
+stays in the outbox marked "failed".
+
+Usage (from backend/):
+    python mailer.py status                        # outbox contents
+    python mailer.py send-test you@example.com     # queue a message and deliver it
+    python mailer.py retry                         # requeue failed messages
+
+Testing against a local stand-in SMTP server (pip install aiosmtpd):
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_STARTTLS=false python mailer.py send-test you@example.com
+"""
+
+import argparse
+import json
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import make_msgid
+
+from config import CONFIG, logger
+from metrics import Counter, Gauge
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+EMAILS = Counter("walmate_emails_total", "Outgoing emails by outcome")
+EMAIL_OUTBOX_DEPTH = Gauge("walmate_email_outbox_depth", "Messages waiting in the email outbox")
+SMTP_CONNECTIONS = Counter("walmate_smtp_connections_total", "SMTP connections opened")
+
+mailer = None
+mailer_lock = threading.Lock()
+
+
+@contextmanager
+def locked_file(path):
+    """Exclusive lock on <path>.lock, shared by every process using `path`"""
+    with open(f"{path}.lock", "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class Outbox:
+    """Message id -> message, in a JSON file shared by all worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # file locks don't exclude threads of one process
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def edit(self):
+        """Read-modify-write of the outbox; the yielded dict is saved on exit"""
+        with self.lock, locked_file(self.path):
+            messages = self.read()
+            yield messages
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(messages, f, indent=2)
+            os.replace(tmp_path, self.path)
+            EMAIL_OUTBOX_DEPTH.set(sum(m["status"] == "pending" for m in messages.values()))
+
+
+class SMTPPool:
+    """Reusable logged-in SMTP connections, at most `size` in use at once.
+
+    Connections idle for longer than `idle_seconds` are replaced rather than
+    reused, since servers drop idle clients. A connection that raised is
+    closed instead of being returned to the pool.
+    """
+
+    def __init__(self, host, port, username=None, password=None, starttls=True, size=2, timeout=10,
+                 idle_seconds=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.size = size
+        self.idle = []  # (connection, last used)
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        SMTP_CONNECTIONS.inc()
+        return connection
+
+    @staticmethod
+    def discard(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def checkout(self):
+        with self.lock:
+            while self.idle:
+                connection, last_used = self.idle.pop()
+                if time.monotonic() - last_used < self.idle_seconds:
+                    return connection
+                self.discard(connection)
+        return self.connect()
+
+    @contextmanager
+    def connection(self):
+        with self.slots:
+            connection = self.checkout()
+            try:
+                yield connection
+            except BaseException:
+                self.discard(connection)
+                raise
+            with self.lock:
+                self.idle.append((connection, time.monotonic()))
+
+    def send(self, message):
+        try:
+            with self.connection() as connection:
+                connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # A pooled connection the server had already closed; retry once on a fresh one
+            with self.connection() as connection:
+                connection.send_message(message)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+
+def build_message(message):
+    mime = MIMEMultipart()
+    mime['From'] = CONFIG["EMAIL_FROM"]
+    mime['To'] = message["to"]
+    mime['Subject'] = message["subject"]
+    # Kept across retries so a duplicate delivery can be recognized
+    mime['Message-ID'] = message["message_id"]
+    mime.attach(MIMEText(message["body"], 'plain'))
+    return mime
+
+
+class Mailer:
+    def __init__(self, outbox, pool, max_attempts=6, retry_base=5.0, retry_max=600.0, lease_seconds=120.0,
+                 poll_seconds=5.0, batch_size=20):
+        self.outbox = outbox
+        self.pool = pool
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="smtp")
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def queue(self, to_email, subject, body):
+        """Write a message to the outbox and wake the delivery thread; returns its id"""
+        message_id = uuid.uuid4().hex
+        with self.outbox.edit() as messages:
+            messages[message_id] = {
+                "to": to_email,
+                "subject": subject,
+                "body": body,
+                "message_id": make_msgid(),
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": time.time(),
+                "lease_until": 0,
+                "created_at": datetime.now().isoformat(),
+                "last_error": None
+            }
+        EMAILS.inc(result="queued")
+        self.start()
+        self.wake.set()
+        return message_id
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None and not self.stopped:
+                self.thread = threading.Thread(target=self._run, name="mailer", daemon=True)
+                self.thread.start()
+
+    def backoff(self, attempts):
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def claim(self):
+        """Lease up to batch_size due messages; returns them and the seconds until the next one is due"""
+        now = time.time()
+        with self.outbox.edit() as messages:
+            waiting = [(message["next_attempt_at"], message_id) for message_id, message in messages.items()
+                       if message["status"] == "pending" and message["lease_until"] <= now]
+            due = sorted(item for item in waiting if item[0] <= now)[:self.batch_size]
+            claimed = []
+            for _, message_id in due:
+                messages[message_id]["lease_until"] = now + self.lease_seconds
+                claimed.append((message_id, dict(messages[message_id])))
+        upcoming = [at for at, message_id in waiting if at > now]
+        return claimed, min(upcoming) - now if upcoming else self.poll_seconds
+
+    def deliver(self, message):
+        try:
+            self.pool.send(build_message(message))
+            return None
+        except (smtplib.SMTPException, OSError) as e:
+            return str(e) or type(e).__name__
+
+    def deliver_due(self):
+        """Send every due message once; returns seconds until the next delivery attempt"""
+        claimed, wait = self.claim()
+        if not claimed:
+            return wait
+        errors = list(self.executor.map(self.deliver, [message for _, message in claimed]))
+
+        with self.outbox.edit() as messages:
+            for (message_id, _), error in zip(claimed, errors):
+                message = messages.get(message_id)
+                if message is None:
+                    continue
+                if error is None:
+                    del messages[message_id]
+                    EMAILS.inc(result="sent")
+                    continue
+                message["attempts"] += 1
+                message["last_error"] = error
+                message["lease_until"] = 0
+                if message["attempts"] >= self.max_attempts:
+                    message["status"] = "failed"
+                    EMAILS.inc(result="failed")
+                    logger.error(f"Giving up on email to {message['to']} after {message['attempts']} attempts: {error}")
+                else:
+                    message["next_attempt_at"] = time.time() + self.backoff(message["attempts"])
+                    EMAILS.inc(result="retried")
+                    logger.warning(f"Email to {message['to']} failed (attempt {message['attempts']}): {error}")
+        # More may be due already
+        return 0
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                wait = self.deliver_due()
+            except Exception as e:
+                logger.error(f"Email delivery pass failed: {str(e)}")
+                wait = self.poll_seconds
+            # Also poll, so messages queued by other processes are picked up
+            if wait > 0 and self.wake.wait(min(wait, self.poll_seconds)):
+                self.wake.clear()
+
+    def close(self):
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.pool.timeout + 5)
+        self.executor.shutdown(wait=False)
+        self.pool.close()
+
+
+def get_mailer():
+    global mailer
+    with mailer_lock:
+        if mailer is None:
+            if not CONFIG["SMTP_SERVER"]:
+                raise RuntimeError("SMTP_SERVER is not configured")
+            mailer = Mailer(
+                Outbox(CONFIG["EMAIL_OUTBOX_FILE"]),
+                SMTPPool(
+                    CONFIG["SMTP_SERVER"], CONFIG["SMTP_PORT"], CONFIG["SMTP_USERNAME"], CONFIG["SMTP_PASSWORD"],
+                    starttls=CONFIG["SMTP_STARTTLS"], size=CONFIG["SMTP_POOL_SIZE"],
+                    timeout=CONFIG["SMTP_TIMEOUT_SECONDS"], idle_seconds=CONFIG["SMTP_IDLE_SECONDS"]
+                ),
+                max_attempts=CONFIG["EMAIL_MAX_ATTEMPTS"],
+                retry_base=CONFIG["EMAIL_RETRY_BASE_SECONDS"],
+                retry_max=CONFIG["EMAIL_RETRY_MAX_SECONDS"],
+                lease_seconds=CONFIG["EMAIL_LEASE_SECONDS"],
+                poll_seconds=CONFIG["EMAIL_POLL_SECONDS"]
+            )
+        return mailer
+
+
+def queue_email(to_email, subject, body):
+    return get_mailer().queue(to_email, subject, body)
+
+
+def start_mailer():
+    """Start delivering whatever an earlier run left in the outbox"""
+    if CONFIG["SMTP_SERVER"]:
+        get_mailer().start()
+
+
+def close_mailer():
+    if mailer is not None:
+        mailer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and drive the email outbox")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list queued and failed messages")
+    test_parser = sub.add_parser("send-test", help="queue a test message and wait for it to be delivered")
+    test_parser.add_argument("to")
+    test_parser.add_argument("--timeout", type=float, default=30)
+    sub.add_parser("retry", help="requeue failed messages")
+    args = parser.parse_args()
+
+    outbox = Outbox(CONFIG["EMAIL_OUTBOX_FILE"])
+    if args.command == "status":
+        for message_id, message in outbox.read().items():
+            print(f"{message_id}  {message['status']:<8} attempts={message['attempts']}  {message['to']}  "
+                  f"{message['subject']!r}  {message['last_error'] or ''}")
+    elif args.command == "retry":
+        with outbox.edit() as messages:
+            failed = [m for m in messages.values() if m["status"] == "failed"]
+            for message in failed:
+                message.update(status="pending", attempts=0, next_attempt_at=time.time(), lease_until=0)
+        print(f"Requeued {len(failed)} messages")
+    elif args.command == "send-test":
+        message_id = queue_email(args.to, "WalMate test email", "This is a test message from WalMate.")
+        deadline = time.monotonic() + args.timeout
+        while message_id in outbox.read() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        message = outbox.read().get(message_id)
+        print("Delivered" if message is None else f"Not delivered yet: {message['last_error']}")
+        close_mailer()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from timing import profiled_thread, record_span, request_spans
+
+# Registry of every metric, rendered in order by render_metrics()
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_format_labels(key)} {value}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1.0, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = [(key, dict(state, counts=list(state["counts"]))) for key, state in self.values.items()]
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {state['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("walmate_stage_seconds", "Duration of each stage of request handling")
+STORAGE_SECONDS = Histogram(
+    "walmate_storage_seconds", "Duration of JSON storage reads and writes",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+CACHE_REQUESTS = Counter("walmate_cache_requests_total", "Cache lookups by cache and result")
+HTTP_IN_FLIGHT = Gauge("walmate_http_in_flight", "HTTP requests currently being handled")
+HTTP_REQUEST_SECONDS = Histogram("walmate_http_request_seconds", "End-to-end HTTP request duration")
+
+
+@contextmanager
+def _timed(histogram, timing_name, **labels):
+    start = time.perf_counter()
+    try:
+        with profiled_thread():
+            yield
+    finally:
+        duration = time.perf_counter() - start
+        histogram.observe(duration, **labels)
+        record_span(timing_name, duration)
+
+
+def span(stage):
+    """Time one stage of request handling, e.g. `with span("retrieval"):`"""
+    return _timed(STAGE_SECONDS, stage, stage=stage)
+
+
+def storage_span(op, filename):
+    name = Path(filename).name
+    return _timed(STORAGE_SECONDS, f"{op}_{Path(filename).stem}", op=op, file=name)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _route_group(scope):
+    """Path template of the route that handled a request, e.g. /api/products/{product_id}.
+
+    The router records the matched route in the scope while dispatching, so
+    this is read once the request is done. Labels never come from the raw
+    path, so scanners and arbitrary ids can't grow the label set; requests
+    no route matched share one label.
+    """
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Tracks in-flight requests and request latency, and optionally adds a
+    Server-Timing header built from the spans recorded during the request.
+    """
+
+    def __init__(self, app, server_timing=False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans = []
+        token = request_spans.set(spans)
+        start = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+                if self.server_timing:
+                    entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in spans]
+                    entries.append(f"total;dur={(time.perf_counter() - start) * 1000:.2f}")
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", ", ".join(entries).encode())
+                    ]
+            await send(message)
+
+        # Not labelled by route: the route is only known once the router has run
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"], path=_route_group(scope), status=status_code[0]
+            )
+            request_spans.reset(token)
@@ -0,0 +1,86 @@
+"""Rewrite chat history so recommendations are stored as product id references.
+
+Older entries embed full product dicts under "recommendations". This
+replaces them with "product_ids", the format ChatSystem.add_to_history
+writes; history reads hydrate the products from the catalog. Ids were
+reassigned between catalogs, so an id is only kept when the current
+product with that id has the recorded name and description. Other
+products stay under "recommendations" as frozen snapshots, cut down to
+the fields a product card shows; their stale "id" and the rest are
+dropped. Empty "recommendations" lists are dropped too. The catalog
+those entries were written against is unknown, so unlike new entries they
+get no "catalog_version". Entries already in the new format are left
+alone, so the migration can be re-run safely.
+
+Usage (from backend/):
+    python migrate_chat_history.py --dry-run      # report the size change only
+    python migrate_chat_history.py
+"""
+
+import argparse
+import json
+import os
+
+from catalog import get_product_store
+from chat import frozen_recommendations, history_product_ids
+from config import CONFIG
+
+# What the frontend's product card shows of a product
+SNAPSHOT_FIELDS = ("name", "description", "price", "imageUrl", "material")
+
+
+def migrate_entry(item, store):
+    if "recommendations" not in item or "product_ids" in item:
+        return item, False
+    migrated = {key: value for key, value in item.items() if key != "recommendations"}
+    if not item["recommendations"]:
+        return migrated, True
+    migrated["product_ids"] = history_product_ids(item, store)
+    frozen = [{field: product[field] for field in SNAPSHOT_FIELDS if field in product}
+              for product in frozen_recommendations(item, store)]
+    if frozen:
+        migrated["recommendations"] = frozen
+    return migrated, True
+
+
+def migrate_history(all_history, store=None):
+    """(migrated history, number of entries rewritten)"""
+    store = store or get_product_store()
+    rewritten = 0
+    migrated = {}
+    for chat_id, history in all_history.items():
+        migrated[chat_id] = []
+        for item in history:
+            item, changed = migrate_entry(item, store)
+            migrated[chat_id].append(item)
+            rewritten += changed
+    return migrated, rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store chat recommendations as product id references")
+    parser.add_argument("--file", default=CONFIG["CHAT_HISTORY_FILE"])
+    parser.add_argument("--dry-run", action="store_true", help="report the size change without writing")
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        all_history = json.load(f)
+    migrated, rewritten = migrate_history(all_history)
+
+    # Same layout as AuthSystem.save_db
+    payload = json.dumps(migrated, indent=2)
+    before = os.path.getsize(args.file)
+    after = len(payload.encode())
+    print(f"{rewritten} entries rewritten; {before} -> {after} bytes ({100 * (before - after) / max(before, 1):.1f}% smaller)")
+    if args.dry_run or not rewritten:
+        return
+
+    tmp_path = f"{args.file}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(payload)
+    os.replace(tmp_path, args.file)
+    print(f"Wrote {args.file}")
+
+
+if __name__ == "__main__":
+    main()
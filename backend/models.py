@@ -49,6 +49,8 @@ class MessageResponse(BaseModel):
 class ChatHistoryItem(BaseModel):
     prompt: str
     response: str
+    product_ids: List[str] = []
+    recommendations: List[Dict[str, Any]] = []
 
 
 class ChatSession(BaseModel):
@@ -56,7 +58,43 @@ class ChatSession(BaseModel):
     history: List[ChatHistoryItem]
 
 
+class ChatSessionSummary(BaseModel):
+    chat_id: str
+    title: str
+    turns: int
+    created_at: Optional[str] = None
+    last_message_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+class ChatSessionSummaries(BaseModel):
+    sessions: List[ChatSessionSummary]
+    total: int
+    page: int
+    page_size: int
+
+
 class Preferences(BaseModel):
     size: str
     colors: List[str]
     categories: List[str]
+
+
+class ProductSearchResponse(BaseModel):
+    products: List[Dict[str, Any]]
+    total: int
+    page: int
+    page_size: int
+    facets: Dict[str, Dict[str, int]]
+
+
+class AutocompleteSuggestion(BaseModel):
+    text: str
+    field: str
+    count: int
+    product_id: str
+
+
+class AutocompleteResponse(BaseModel):
+    query: str
+    suggestions: List[AutocompleteSuggestion]
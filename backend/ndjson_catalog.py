@@ -0,0 +1,207 @@
+"""NDJSON product catalog: one product per line plus a byte-offset index.
+
+The catalog streams into ProductStore line by line, so the raw file is
+never held in memory. The sidecar indexes (<catalog>.idx, a sorted NumPy
+array of (id, offset) pairs, and <catalog>.codes.idx, the same keyed by a
+hash of the lowercased product code) let a single product be read through
+mmap without parsing the rest of the file.
+
+Usage (from backend/):
+    python ndjson_catalog.py convert data/products.json data/products.ndjson
+    python ndjson_catalog.py index data/products.ndjson
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+
+import numpy as np
+
+INDEX_SUFFIX = ".idx"
+CODE_INDEX_SUFFIX = ".codes.idx"
+INDEX_DTYPE = np.dtype([("id", "<i8"), ("offset", "<i8")])
+
+
+def code_key(code):
+    """Case-insensitive product code hash, stable across processes (unlike hash())"""
+    digest = hashlib.blake2b(str(code).strip().lower().encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def is_ndjson(path):
+    return str(path).endswith((".ndjson", ".jsonl"))
+
+
+def iter_ndjson(path):
+    """Yield one product dict per non-blank line"""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    separators = re.compile(r"[\s,]*")
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        position = separators.match(buffer).end()
+        if buffer[position:position + 1] != "[":
+            raise ValueError(f"{path} is not a JSON array")
+        position += 1
+        while True:
+            position = separators.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The next element runs past the buffer; keep the tail and read more
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield item
+
+
+def write_ndjson(records, path):
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def save_index(keys, offsets, path):
+    index = np.empty(len(keys), dtype=INDEX_DTYPE)
+    index["id"] = keys
+    index["offset"] = offsets
+    index.sort(order="id", kind="stable")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, index)
+    os.replace(tmp_path, path)
+
+
+def build_offset_index(path):
+    """Scan the catalog once and write <path>.idx and <path>.codes.idx;
+    products without an integer id or a product code are left out of the
+    respective index"""
+    ids, id_offsets = [], []
+    codes, code_offsets = [], []
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                product = json.loads(line)
+                product_id = product.get("id")
+                if isinstance(product_id, int) or str(product_id).isdigit():
+                    ids.append(int(product_id))
+                    id_offsets.append(offset)
+                if product.get("product_code"):
+                    codes.append(code_key(product["product_code"]))
+                    code_offsets.append(offset)
+            offset += len(line)
+
+    save_index(codes, code_offsets, f"{path}{CODE_INDEX_SUFFIX}")
+    save_index(ids, id_offsets, f"{path}{INDEX_SUFFIX}")
+    return len(ids)
+
+
+class OffsetIndex:
+    """Reads single products from an NDJSON catalog through mmap, by id or
+    by product code.
+
+    The indexes are rebuilt when either is missing or older than the
+    catalog. They and the catalog are memory-mapped, so lookups touch only
+    the pages they need.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        index_paths = [self.path + INDEX_SUFFIX, self.path + CODE_INDEX_SUFFIX]
+        catalog_mtime = os.path.getmtime(self.path)
+        if not all(os.path.exists(index_path) and os.path.getmtime(index_path) >= catalog_mtime
+                   for index_path in index_paths):
+            build_offset_index(self.path)
+        self.mtime = os.path.getmtime(self.path)
+        self.index, self.code_index = (np.load(index_path, mmap_mode="r") for index_path in index_paths)
+        self.lock = threading.Lock()
+        with open(self.path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(self.path) else b""
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def _offsets(index, key):
+        keys = index["id"]
+        start = int(np.searchsorted(keys, key, side="left"))
+        end = int(np.searchsorted(keys, key, side="right"))
+        return [int(offset) for offset in index["offset"][start:end]]
+
+    def offset(self, product_id):
+        product_id = str(product_id)
+        if not product_id.isdigit() or str(int(product_id)) != product_id:
+            return None
+        offsets = self._offsets(self.index, int(product_id))
+        return offsets[0] if offsets else None
+
+    def _line(self, offset):
+        with self.lock:
+            end = self.data.find(b"\n", offset)
+            line = self.data[offset:end if end >= 0 else len(self.data)]
+        return json.loads(line)
+
+    def read(self, product_id):
+        """The product dict for an id, or None"""
+        offset = self.offset(product_id)
+        if offset is None:
+            return None
+        return self._line(offset)
+
+    def read_code(self, code):
+        """The product dict for a product code (any case), or None"""
+        code = str(code).strip().lower()
+        for offset in self._offsets(self.code_index, code_key(code)):
+            product = self._line(offset)
+            # Hashes can collide; the stored code decides
+            if str(product.get("product_code", "")).strip().lower() == code:
+                return product
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and index NDJSON product catalogs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert_parser = sub.add_parser("convert", help="convert a products.json array to NDJSON and index it")
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("destination")
+    index_parser = sub.add_parser("index", help="(re)build the offset indexes of an NDJSON catalog")
+    index_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        count = write_ndjson(iter_json_array(args.source), args.destination)
+        build_offset_index(args.destination)
+        print(f"Wrote {count} products to {args.destination} (+{INDEX_SUFFIX}, {CODE_INDEX_SUFFIX})")
+        print(f"Set PRODUCTS_FILE={args.destination} to use it")
+    elif args.command == "index":
+        print(f"Indexed {build_offset_index(args.path)} products in {args.path}{INDEX_SUFFIX}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# passwords.py
+
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CONFIG, logger
+from metrics import Histogram
+
+PASSWORD_HASH_SECONDS = Histogram("walmate_password_hash_seconds", "Time spent hashing or verifying a password")
+
+SCRYPT_PREFIX = "scrypt"
+
+
+def b64(data):
+    return base64.b64encode(data).decode()
+
+
+class PasswordHasher:
+    """Salted scrypt password hashes, computed in a bounded thread pool.
+
+    Hashes are stored as "scrypt$n$r$p$salt$hash" so the cost can be raised
+    later; hashes made at an older cost, and legacy unsalted SHA-256 hex
+    digests, still verify and report needs_rehash(). hashlib.scrypt releases
+    the GIL, so threads give real parallelism, and `workers` caps both CPU
+    use and memory (128 * r * n bytes per hash in progress).
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=2):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    def _scrypt(self, password, salt, n, r, p):
+        start = time.perf_counter()
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=128 * r * (n + p) + 1024 * 1024)
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start)
+        return digest
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._scrypt(password, salt, self.n, self.r, self.p)
+        return f"{SCRYPT_PREFIX}${self.n}${self.r}${self.p}${b64(salt)}${b64(digest)}"
+
+    def verify(self, password, stored):
+        """False for a wrong password, and for a stored hash that can't be parsed"""
+        if not stored.startswith(f"{SCRYPT_PREFIX}$"):
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, stored)
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            computed = self._scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(computed, base64.b64decode(digest))
+        except (ValueError, MemoryError):
+            # Bad field count, non-int or out-of-range params, or broken base64 (binascii.Error is a ValueError)
+            logger.error("Stored password hash is malformed")
+            return False
+
+    def needs_rehash(self, stored):
+        return not stored.startswith(f"{SCRYPT_PREFIX}${self.n}${self.r}${self.p}$")
+
+    async def run(self, fn, *args):
+        """Run `fn`, which hashes or verifies passwords, in the pool instead of on the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+
+
+password_hasher = PasswordHasher(
+    n=CONFIG["PASSWORD_SCRYPT_N"],
+    r=CONFIG["PASSWORD_SCRYPT_R"],
+    p=CONFIG["PASSWORD_SCRYPT_P"],
+    workers=CONFIG["PASSWORD_HASH_WORKERS"]
+)
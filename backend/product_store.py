@@ -0,0 +1,555 @@
+# product_store.py
+
+import hashlib
+import json
+import sys
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+from text_index import TextIndex
+
+TEXT_FIELDS = ("product_code", "description", "imageUrl")
+CATEGORICAL_FIELDS = ("name", "material", "durability", "category")
+PRODUCT_FIELDS = ("id", "product_code", "name", "description", "price", "material", "durability",
+                  "category", "imageUrl")
+KNOWN_FIELDS = frozenset(PRODUCT_FIELDS)
+# Search facet -> categorical column ("name" holds the brand, e.g. "Nike")
+FACET_FIELDS = {"category": "category", "material": "material", "brand": "name"}
+# Set bits per byte value, for counting rows in a packed bitmap on NumPy < 2.0
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+def popcount(bitmaps):
+    """Set bits in a packed bitmap, or per row of a stack of them"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitmaps.view(np.uint64)).sum(axis=-1, dtype=np.int64)
+    return POPCOUNT[bitmaps].sum(axis=-1, dtype=np.int64)
+
+
+def normalize_text(value):
+    """Collapse runs of whitespace and strip, e.g. "100% Cotton  " -> "100% Cotton" """
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def normalize_product(record, categories=None):
+    """One record as ProductStore.view(row).to_dict() would return it, without
+    building a store and its indexes (for single reads off an NDJSON catalog)"""
+    get = record.get
+    code = normalize_text(get("product_code"))
+    product_id = get("id")
+    price = get("price", 0)
+    product = {
+        "id": int(product_id) if isinstance(product_id, int) or str(product_id).isdigit() else str(product_id),
+        "product_code": code,
+        "name": normalize_text(get("name")),
+        "description": normalize_text(get("description")),
+        "price": price if isinstance(price, int) else float(price),
+        "material": normalize_text(get("material")),
+        "durability": normalize_text(get("durability")),
+        "category": normalize_text(get("category") or (categories or {}).get(code, "")),
+        "imageUrl": normalize_text(get("imageUrl")),
+    }
+    product.update((key, value) for key, value in record.items() if key not in KNOWN_FIELDS)
+    return product
+
+
+class StringColumn:
+    """Variable-length strings packed into one UTF-8 buffer plus an offsets array.
+
+    Entries are NUL-terminated, so a substring search over the whole buffer
+    can't match across two entries. Values are appended one at a time and
+    packed by finish().
+    """
+
+    def __init__(self, values=()):
+        self.buffer = bytearray()
+        self.ends = array("q")
+        for value in values:
+            self.append(value)
+        self.finish()
+
+    def append(self, value):
+        buffer = self.buffer
+        buffer += value.encode()
+        buffer.append(0)
+        self.ends.append(len(buffer))
+
+    def finish(self):
+        self.blob = bytes(self.buffer)
+        self.lower_blob = None
+        self.offsets = np.zeros(len(self.ends) + 1, dtype=np.int64)
+        self.offsets[1:] = np.frombuffer(self.ends, dtype=np.int64) if self.ends else []
+        self.buffer = bytearray()
+        self.ends = array("q")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.blob[self.offsets[row]:self.offsets[row + 1] - 1].decode()
+
+    def find_first(self, needle, ignore_case=True):
+        """Row of the first entry containing `needle`, or None"""
+        if ignore_case and self.lower_blob is None:
+            self.lower_blob = self.blob.lower()
+        haystack = self.lower_blob if ignore_case else self.blob
+        position = haystack.find((needle.lower() if ignore_case else needle).encode())
+        if position < 0:
+            return None
+        return int(np.searchsorted(self.offsets, position, side="right")) - 1
+
+
+def row_index_dtype(count):
+    return np.int32 if count < 2 ** 31 else np.int64
+
+
+class CategoricalColumn:
+    """Each distinct value is stored once (interned); rows hold small integer codes.
+
+    Values are normalized per distinct raw value rather than per row, and
+    raw values that normalize to the same string share a code.
+    """
+
+    def __init__(self, values=(), normalize=normalize_text):
+        self.normalize = normalize
+        self.raw_lookup = {}
+        self.raw_codes = array("q")
+        for value in values:
+            self.append(value)
+        self.finish()
+
+    def append(self, value):
+        self.raw_codes.append(self.raw_lookup.setdefault(value, len(self.raw_lookup)))
+
+    def finish(self):
+        self.categories = []
+        self.lookup = {}
+        remap = np.empty(len(self.raw_lookup), dtype=np.int64)
+        for raw_code, value in enumerate(self.raw_lookup):
+            value = self.normalize(value)
+            if value not in self.lookup:
+                self.lookup[value] = len(self.categories)
+                self.categories.append(sys.intern(value))
+            remap[raw_code] = self.lookup[value]
+        raw_codes = np.frombuffer(self.raw_codes, dtype=np.int64) if self.raw_codes else np.empty(0, np.int64)
+        self.codes = remap[raw_codes].astype(np.min_scalar_type(max(len(self.categories) - 1, 0)))
+        self.raw_lookup = {}
+        self.raw_codes = array("q")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.categories[self.codes[row]]
+
+    def mask(self, values):
+        wanted = [self.lookup[value] for value in values if value in self.lookup]
+        return np.isin(self.codes, wanted)
+
+    def counts(self, rows=None):
+        codes = self.codes if rows is None else self.codes[rows]
+        counts = np.bincount(codes, minlength=len(self.categories))
+        return {self.categories[code]: int(count) for code, count in enumerate(counts) if count}
+
+    def sort_keys(self):
+        """Per-row rank of the value in sorted order, for vectorized sorting"""
+        ranks = np.empty(len(self.categories), dtype=np.int64)
+        ranks[np.argsort(np.asarray(self.categories, dtype=object))] = np.arange(len(self.categories))
+        return ranks[self.codes]
+
+
+class ProductStore:
+    """Columnar product catalog.
+
+    ids and prices are NumPy arrays, brand/material/durability/category are
+    categorical columns, and the free-text fields are packed string columns.
+    A product costs a few dozen bytes instead of a dict of Python strings;
+    products are materialized on demand as ProductView objects. Any other
+    keys a record has (e.g. "features", "stock") are kept as-is in a sparse
+    row -> dict map, so products round-trip without losing fields. `records`
+    is consumed in one pass, so it can be a stream from an NDJSON file.
+    """
+
+    def __init__(self, records, categories=None):
+        categories = categories or {}
+        raw_ids = []
+        prices = []
+        code_hashes = array("q")
+        self.extras = {}  # row -> fields outside PRODUCT_FIELDS
+        self.text = {field: StringColumn() for field in TEXT_FIELDS}
+        self.categorical = {field: CategoricalColumn() for field in CATEGORICAL_FIELDS}
+
+        # Bound methods hoisted out of the loop; this runs once per product
+        text_appends = [(field, self.text[field].append) for field in TEXT_FIELDS[1:]]
+        categorical_appends = [(field, self.categorical[field].append) for field in CATEGORICAL_FIELDS[:-1]]
+        append_code = self.text["product_code"].append
+        append_category = self.categorical["category"].append
+        extras = self.extras
+        for row, record in enumerate(records):
+            get = record.get
+            if not KNOWN_FIELDS.issuperset(record):
+                extras[row] = {key: value for key, value in record.items() if key not in KNOWN_FIELDS}
+            raw_ids.append(get("id"))
+            prices.append(get("price", 0))
+            code = normalize_text(get("product_code"))
+            code_hashes.append(hash(code.lower()))
+            append_code(code)
+            for field, append in text_appends:
+                append(normalize_text(get(field)))
+            for field, append in categorical_appends:
+                append(get(field))
+            append_category(get("category") or categories.get(code, ""))
+
+        for column in list(self.text.values()) + list(self.categorical.values()):
+            column.finish()
+
+        count = len(raw_ids)
+        index_dtype = row_index_dtype(count)
+        if all(isinstance(value, int) or str(value).isdigit() for value in raw_ids):
+            self.ids = np.fromiter((int(value) for value in raw_ids), dtype=np.int64, count=count)
+            self.id_rows = None
+            self.id_sorter = np.argsort(self.ids, kind="stable").astype(index_dtype)
+        else:
+            # Non-numeric ids (e.g. the placeholder catalog) fall back to a dict
+            self.ids = np.asarray([str(value) for value in raw_ids], dtype=object)
+            self.id_rows = {value: row for row, value in enumerate(self.ids)}
+            self.id_sorter = None
+
+        integral = all(isinstance(price, int) for price in prices)
+        self.prices = np.asarray(prices, dtype=np.int64 if integral else np.float64)
+
+        # Case-insensitive code lookup through a sorted array of string hashes
+        code_hashes = np.frombuffer(code_hashes, dtype=np.int64) if code_hashes else np.empty(0, np.int64)
+        self.code_sorter = np.argsort(code_hashes, kind="stable").astype(index_dtype)
+        self.sorted_code_hashes = code_hashes[self.code_sorter]
+        self.version = self.fingerprint()
+        self.facets = FacetIndex(self)
+        self.text_index = TextIndex(self)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def fingerprint(self):
+        """Short hash of every column; stored product references record it as the catalog version"""
+        digest = hashlib.sha256()
+        digest.update(self.ids.tobytes() if self.id_rows is None else "\0".join(self.ids).encode())
+        digest.update(self.prices.tobytes())
+        for column in self.text.values():
+            digest.update(column.blob)
+        for column in self.categorical.values():
+            digest.update("\0".join(column.categories).encode())
+            digest.update(column.codes.tobytes())
+        if self.extras:
+            digest.update(json.dumps(sorted(self.extras.items()), sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:12]
+
+    def value(self, row, field):
+        if field == "id":
+            value = self.ids[row]
+            return value.item() if hasattr(value, "item") else value
+        if field == "price":
+            return self.prices[row].item()
+        if field in self.text:
+            return self.text[field][row]
+        if field in self.categorical:
+            return self.categorical[field][row]
+        extra = self.extras.get(row)
+        if extra is not None and field in extra:
+            return extra[field]
+        raise KeyError(field)
+
+    def fields(self, row):
+        """PRODUCT_FIELDS followed by the row's extra fields"""
+        extra = self.extras.get(row)
+        return PRODUCT_FIELDS + tuple(extra) if extra else PRODUCT_FIELDS
+
+    def view(self, row):
+        return ProductView(self, int(row))
+
+    def to_records(self, rows=None):
+        rows = range(len(self)) if rows is None else rows
+        return [self.view(row).to_dict() for row in rows]
+
+    def row_for_id(self, product_id):
+        """Row of an exact id ("12" or 12), or None"""
+        if self.id_rows is not None:
+            return self.id_rows.get(str(product_id))
+        product_id = str(product_id)
+        if not product_id.isdigit() or str(int(product_id)) != product_id:
+            return None
+        position = np.searchsorted(self.ids, int(product_id), sorter=self.id_sorter)
+        if position < len(self) and self.ids[self.id_sorter[position]] == int(product_id):
+            return int(self.id_sorter[position])
+        return None
+
+    def row_for_code(self, code, ignore_case=False):
+        """Row of an exact product code, or None"""
+        target = hash(code.lower())
+        start = np.searchsorted(self.sorted_code_hashes, target, side="left")
+        end = np.searchsorted(self.sorted_code_hashes, target, side="right")
+        for row in self.code_sorter[start:end]:
+            stored = self.text["product_code"][row]
+            if stored == code or (ignore_case and stored.lower() == code.lower()):
+                return int(row)
+        return None
+
+    def find(self, query):
+        """Row for an id or product code, else the first product whose code
+        contains `query`, else the first product of the brand or description
+        that best matches it (typos allowed); None when nothing matches"""
+        row = self.row_for_id(query)
+        if row is None:
+            row = self.row_for_code(query, ignore_case=True)
+        if row is None:
+            row = self.text["product_code"].find_first(query)
+        if row is None:
+            entry = self.text_index.match(query)
+            row = int(self.text_index.rows[entry]) if entry is not None else None
+        return row
+
+    def filter_rows(self, price_min=None, price_max=None, **categorical_values):
+        """Rows matching a price range and, per categorical column, any of the given values"""
+        mask = np.ones(len(self), dtype=bool)
+        if price_min is not None:
+            mask &= self.prices >= price_min
+        if price_max is not None:
+            mask &= self.prices <= price_max
+        for field, values in categorical_values.items():
+            if values:
+                mask &= self.categorical[field].mask(values)
+        return np.flatnonzero(mask)
+
+    def sort_rows(self, rows, by="price", descending=False):
+        """Stable vectorized sort of `rows` by price, id or a categorical column"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if by == "price":
+            keys = self.prices[rows]
+        elif by == "id" and self.id_rows is None:
+            keys = self.ids[rows]
+        elif by in self.categorical:
+            keys = self.categorical[by].sort_keys()[rows]
+        else:
+            raise ValueError(f"Cannot sort products by {by}")
+        order = np.argsort(-keys if descending else keys, kind="stable")
+        return rows[order]
+
+
+class FacetIndex:
+    """Packed bitmaps (np.packbits layout) per facet value, built with the store.
+
+    A search ANDs the bitmaps of the selected values with a price-range
+    bitmap, counts facet values by popcount over n/64 words, and walks a
+    cached sort order (or the bitmap itself) in chunks only as far as the
+    requested page. Bitmaps are padded to whole 64-bit words; each facet
+    value costs about n/8 bytes. Facet values match case-insensitively.
+    """
+    WALK_CHUNK = 4096
+
+    def __init__(self, store):
+        self.store = store
+        self.count = len(store)
+        self.byte_count = (self.count + 63) // 64 * 8
+        self.bitmaps = {}
+        self.folded = {}  # facet -> casefolded value -> codes of the values that fold to it
+        for facet, field in FACET_FIELDS.items():
+            column = store.categorical[field]
+            bitmaps = [self.pack(column.codes == code) for code in range(len(column.categories))]
+            self.bitmaps[facet] = np.stack(bitmaps) if bitmaps else np.zeros((0, self.byte_count), dtype=np.uint8)
+            folded = self.folded[facet] = {}
+            for code, value in enumerate(column.categories):
+                folded.setdefault(value.casefold(), []).append(code)
+        self.all_rows = self.pack(np.ones(self.count, dtype=bool))
+        index_dtype = row_index_dtype(self.count)
+        self.price_sorter = np.argsort(store.prices, kind="stable").astype(index_dtype)
+        self.sorted_prices = store.prices[self.price_sorter]
+        self.orders = {}
+
+    def pack(self, mask):
+        bitmap = np.zeros(self.byte_count, dtype=np.uint8)
+        packed = np.packbits(mask)
+        bitmap[:len(packed)] = packed
+        return bitmap
+
+    def rows_bitmap(self, rows):
+        mask = np.zeros(self.count, dtype=bool)
+        mask[rows] = True
+        return self.pack(mask)
+
+    def value_bitmap(self, facet, values):
+        """Rows whose facet value is any of `values`"""
+        folded = self.folded[facet]
+        codes = [code for value in values for code in folded.get(normalize_text(value).casefold(), ())]
+        if not codes:
+            return np.zeros_like(self.all_rows)
+        return np.bitwise_or.reduce(self.bitmaps[facet][codes], axis=0)
+
+    def price_bitmap(self, price_min=None, price_max=None):
+        start = 0 if price_min is None else np.searchsorted(self.sorted_prices, price_min, side="left")
+        end = self.count if price_max is None else np.searchsorted(self.sorted_prices, price_max, side="right")
+        return self.rows_bitmap(self.price_sorter[start:end])
+
+    def counts(self, facet, bitmap):
+        """Facet value -> number of rows in `bitmap` that have it"""
+        counts = popcount(self.bitmaps[facet] & bitmap)
+        categories = self.store.categorical[FACET_FIELDS[facet]].categories
+        return {categories[code]: int(count) for code, count in enumerate(counts) if count}
+
+    def order(self, by, descending=False):
+        """All rows sorted by `by`, computed once per catalog load"""
+        key = (by, descending)
+        if key not in self.orders:
+            rows = self.store.sort_rows(np.arange(self.count), by, descending)
+            self.orders[key] = rows.astype(row_index_dtype(self.count))
+        return self.orders[key]
+
+    def search(self, filters=None, price_min=None, price_max=None, sort=None, descending=False,
+               offset=0, limit=20):
+        """One page of matching rows, the total match count and facet counts.
+
+        `filters` maps a facet to the values to accept; values within a
+        facet are ORed and facets are ANDed. Each facet's counts apply every
+        filter except its own, so the UI can show what selecting another
+        value would add. `sort` is None (catalog order), "price", "id" or a facet.
+        """
+        selected = {facet: self.value_bitmap(facet, values) for facet, values in (filters or {}).items() if values}
+        price = None if price_min is None and price_max is None else self.price_bitmap(price_min, price_max)
+
+        def combined(skip=None):
+            bitmap = self.all_rows if price is None else price
+            for facet, facet_bitmap in selected.items():
+                if facet != skip:
+                    bitmap = bitmap & facet_bitmap
+            return bitmap
+
+        matches = combined()
+        facets = {facet: self.counts(facet, combined(facet) if facet in selected else matches)
+                  for facet in FACET_FIELDS}
+        order = self.order(FACET_FIELDS.get(sort, sort), descending) if sort else None
+
+        if matches is self.all_rows:
+            total = self.count
+            rows = order[offset:offset + limit] if order is not None else np.arange(offset, min(offset + limit, total))
+        else:
+            total = int(popcount(matches))
+            rows = self.page(matches, order, offset, limit)
+        return rows, total, facets
+
+    def page(self, bitmap, order, offset, limit):
+        """Rows offset..offset+limit of `bitmap`, in `order` or row order.
+
+        Walks WALK_CHUNK rows at a time and stops once the page is filled,
+        so a page near the start costs about the same at any catalog size.
+        """
+        wanted = offset + limit
+        found = []
+        hits = 0
+        for start in range(0, self.count, self.WALK_CHUNK):
+            if order is not None:
+                rows = order[start:start + self.WALK_CHUNK]
+                rows = rows[(bitmap[rows >> 3] >> (7 - (rows & 7))) & 1 == 1]
+            else:
+                chunk = np.unpackbits(bitmap[start >> 3:(start + self.WALK_CHUNK) >> 3])
+                rows = np.flatnonzero(chunk[:self.count - start]) + start
+            found.append(rows)
+            hits += len(rows)
+            if hits >= wanted:
+                break
+        rows = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        return rows[offset:wanted]
+
+
+class ProductView(Mapping):
+    """Read-only dict-like view of one product row; fields are read lazily"""
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, field):
+        return self._store.value(self._row, field)
+
+    def __iter__(self):
+        return iter(self._store.fields(self._row))
+
+    def __len__(self):
+        return len(self._store.fields(self._row))
+
+    def __getattr__(self, field):
+        try:
+            return self._store.value(self._row, field)
+        except KeyError:
+            raise AttributeError(field) from None
+
+    def __repr__(self):
+        return f"ProductView({self.to_dict()!r})"
+
+    def to_dict(self):
+        return {field: self[field] for field in self._store.fields(self._row)}
+
+
+class ProductsById(Mapping):
+    """str(id) -> ProductView over the current store"""
+
+    def __init__(self):
+        self.store = None
+
+    def __getitem__(self, product_id):
+        row = self.store.row_for_id(product_id) if self.store is not None else None
+        if row is None:
+            raise KeyError(product_id)
+        return self.store.view(row)
+
+    def __iter__(self):
+        if self.store is not None:
+            yield from (str(self.store.value(row, "id")) for row in range(len(self.store)))
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else 0
+
+
+class ProductCodeMap(Mapping):
+    """Maps an id, a product code ("PID001") or its numeric part ("001") to
+    the product's id string, without materializing a dict per product"""
+
+    def __init__(self):
+        self.store = None
+        self.length = None  # (store, key count), counted once per store
+
+    def __getitem__(self, key):
+        if self.store is not None:
+            key = str(key)
+            row = self.store.row_for_id(key)
+            if row is None:
+                row = self.store.row_for_code(key)
+            if row is None and key.isdigit():
+                row = self.store.row_for_code(f"PID{key}")
+            if row is not None:
+                return str(self.store.value(row, "id"))
+        raise KeyError(key)
+
+    def __iter__(self):
+        if self.store is None:
+            return
+        seen = set()
+        for row in range(len(self.store)):
+            product_id = str(self.store.value(row, "id"))
+            code = self.store.value(row, "product_code")
+            keys = [product_id]
+            if code:
+                keys.append(code)
+                if code.startswith("PID"):
+                    keys.append(code[3:])
+            for key in keys:
+                # A key another product already claimed resolves to that product
+                if key not in seen and self[key] == product_id:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        if self.store is None:
+            return 0
+        if self.length is None or self.length[0] is not self.store:
+            self.length = (self.store, sum(1 for _ in self))
+        return self.length[1]
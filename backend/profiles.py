@@ -0,0 +1,83 @@
+"""List, open and request per-request profiles written by ProfilingMiddleware.
+
+Usage (from backend/):
+    python profiles.py list [--limit 20]
+    python profiles.py open <request-id or file>   # latest match
+    python profiles.py sign                        # X-Profile-Request header value
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import webbrowser
+from datetime import datetime
+from pathlib import Path
+
+from config import CONFIG
+from profiling import PROFILE_SUFFIX, sign_profile_request
+
+
+def recent_profiles(limit=None):
+    profile_dir = Path(CONFIG["PROFILING_DIR"])
+    if not profile_dir.exists():
+        return []
+    files = sorted(profile_dir.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return files[:limit] if limit else files
+
+
+def list_profiles(limit):
+    files = recent_profiles(limit)
+    if not files:
+        print(f"No profiles in {CONFIG['PROFILING_DIR']}")
+        return
+    for path in files:
+        try:
+            with open(path) as f:
+                name = json.load(f).get("name", "")
+        except (OSError, ValueError):
+            name = "(unreadable)"
+        modified = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{modified}  {path.stat().st_size / 1024:8.1f} KiB  {path.name}  {name}")
+
+
+def open_profile(target):
+    path = Path(target)
+    if not path.exists():
+        matches = [p for p in recent_profiles() if target in p.name]
+        if not matches:
+            sys.exit(f"No profile matching '{target}'")
+        path = matches[0]
+
+    # The speedscope CLI (npm install -g speedscope) opens local files directly
+    if shutil.which("speedscope"):
+        subprocess.run(["speedscope", str(path)])
+    else:
+        print(f"Profile: {path.resolve()}")
+        print("Drag it into https://www.speedscope.app to view the flamegraph.")
+        webbrowser.open("https://www.speedscope.app")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-request profiles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="list recent profiles, newest first")
+    list_parser.add_argument("--limit", type=int, default=20)
+    open_parser = sub.add_parser("open", help="open a profile in speedscope")
+    open_parser.add_argument("target", help="request id, part of a file name, or a path")
+    sub.add_parser("sign", help="print a signed X-Profile-Request header value")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_profiles(args.limit)
+    elif args.command == "open":
+        open_profile(args.target)
+    elif args.command == "sign":
+        if not CONFIG["PROFILING_SECRET"]:
+            sys.exit("PROFILING_SECRET is not set")
+        print(f"X-Profile-Request: {sign_profile_request()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# profiling.py
+
+import hashlib
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from config import CONFIG, logger
+from timing import active_profiler
+
+PROFILE_HEADER = b"x-profile-request"
+REQUEST_ID_HEADER = b"x-request-id"
+PROFILE_SUFFIX = ".speedscope.json"
+
+# Frames at the top of an idle thread's stack; such samples are dropped
+IDLE_FUNCTIONS = {"wait", "select", "poll", "_worker", "accept", "_wait_for_tstate_lock"}
+
+
+def sign_profile_request(timestamp=None, secret=None):
+    """Header value an admin sends to force profiling: "<unix ts>:<hmac-sha256>" """
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    secret = secret or CONFIG["PROFILING_SECRET"]
+    digest = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}:{digest}"
+
+
+def verify_profile_request(value):
+    """Check a raw header value; anything that isn't a current, correctly signed ASCII value is unsigned"""
+    secret = CONFIG["PROFILING_SECRET"]
+    if not secret:
+        return False
+    timestamp, _, _ = value.partition(b":")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > CONFIG["PROFILING_SIGNATURE_TTL_SECONDS"]:
+        return False
+    # Compared as bytes: compare_digest rejects non-ASCII str
+    return hmac.compare_digest(sign_profile_request(int(timestamp), secret).encode(), value)
+
+
+def prune_profiles(directory, max_files):
+    """Delete the oldest profiles in `directory` beyond the newest `max_files`"""
+    profiles = sorted(Path(directory).glob(f"*{PROFILE_SUFFIX}"), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:max(0, len(profiles) - max_files)]:
+        path.unlink(missing_ok=True)
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler writing a speedscope file.
+
+    A daemon thread snapshots stacks with sys._current_frames() every
+    `interval` seconds, keeping only the threads working on this request:
+    the event loop thread that handles it, and thread-pool workers while
+    they run one of its span() stages (see timing.profiled_thread). The loop also
+    runs other requests, so a loop sample is only kept when `anchor`, a
+    frame of this request's task, is on the stack. Each thread becomes a
+    separate profile in the output, so the event loop and the worker
+    running the chat call both show up. Only the profiled request pays for
+    sampling; the file is written from the sampler thread, which then
+    deletes the oldest profiles beyond PROFILING_MAX_FILES.
+    """
+
+    def __init__(self, request_id, path, interval, max_seconds):
+        self.request_id = request_id
+        self.path = path
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stop_event = threading.Event()
+        self.frames = []
+        self.frame_index = {}
+        self.samples = {}  # thread name -> list of (stack, weight)
+        self.threads = set()  # idents of the threads working on the request
+        self.loop_thread = None
+        self.anchor = None
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self, anchor=None):
+        """Start sampling; called on the event loop, from the request's task whose frame is `anchor`"""
+        self.started = time.perf_counter()
+        self.loop_thread = threading.get_ident()
+        self.anchor = anchor
+        self.threads.add(self.loop_thread)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _frame_id(self, frame):
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        if key not in self.frame_index:
+            self.frame_index[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return self.frame_index[key]
+
+    def _sample(self, weight):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        frames = sys._current_frames()
+        for ident in list(self.threads):
+            frame = frames.get(ident)
+            if frame is None or frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            stack = []
+            anchored = False
+            while frame is not None:
+                anchored = anchored or frame is self.anchor
+                stack.append(self._frame_id(frame))
+                frame = frame.f_back
+            if ident == self.loop_thread and self.anchor is not None and not anchored:
+                # The loop is running another request's task
+                continue
+            stack.reverse()
+            self.samples.setdefault(names.get(ident, str(ident)), []).append((stack, weight))
+
+    def _run(self):
+        last = time.perf_counter()
+        deadline = last + self.max_seconds
+        while not self.stop_event.wait(self.interval) and time.perf_counter() < deadline:
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+        self.anchor = None
+        try:
+            self._write(time.perf_counter() - self.started)
+            prune_profiles(self.path.parent, CONFIG["PROFILING_MAX_FILES"])
+        except Exception as e:
+            logger.error(f"Failed to write profile {self.path}: {str(e)}")
+
+    def _write(self, duration):
+        profiles = []
+        for thread_name, samples in self.samples.items():
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weight for _, weight in samples),
+                "samples": [stack for stack, _ in samples],
+                "weights": [weight for _, weight in samples],
+            })
+        payload = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"request {self.request_id} ({duration * 1000:.1f} ms)",
+            "exporter": "walmate-profiling",
+            "shared": {"frames": self.frames},
+            "profiles": profiles,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(payload, f)
+        logger.info(f"Profile for request {self.request_id} written to {self.path}")
+
+
+class ProfilingMiddleware:
+    """Profiles a request when it carries a valid signed X-Profile-Request
+    header or is picked by PROFILING_SAMPLE_RATE. Unprofiled requests only
+    pay for one random() call and a header scan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        forced = PROFILE_HEADER in headers and verify_profile_request(headers[PROFILE_HEADER])
+        if not forced and not (CONFIG["PROFILING_SAMPLE_RATE"] > 0
+                               and random.random() < CONFIG["PROFILING_SAMPLE_RATE"]):
+            await self.app(scope, receive, send)
+            return
+
+        raw_id = headers.get(REQUEST_ID_HEADER, b"").decode() or uuid.uuid4().hex
+        request_id = re.sub(r"[^A-Za-z0-9_.-]", "_", raw_id)[:64]
+        path = Path(CONFIG["PROFILING_DIR"]) / f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}{PROFILE_SUFFIX}"
+        profiler = SamplingProfiler(
+            request_id, path,
+            interval=CONFIG["PROFILING_INTERVAL_MS"] / 1000.0,
+            max_seconds=CONFIG["PROFILING_MAX_SECONDS"]
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", request_id.encode())
+                ]
+            await send(message)
+
+        # This coroutine's frame is on the loop's stack whenever the request's task runs
+        profiler.start(anchor=sys._getframe())
+        token = active_profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            active_profiler.reset(token)
+            profiler.stop()
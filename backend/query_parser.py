@@ -0,0 +1,76 @@
+# query_parser.py
+
+import re
+
+# Garment keyword -> words in a shopper's query that ask for it. Category
+# names ("Men’s Jackets & Hoodies") are matched against the same table, so
+# a new h.txt section is routable as long as its name uses these words.
+GARMENT_SYNONYMS = {
+    "t-shirt": ["t-shirt", "t-shirts", "t shirt", "t shirts", "tshirt", "tshirts", "tee", "tees", "polo", "polos"],
+    "shirt": ["shirt", "shirts", "formal shirt", "oxford"],
+    "jeans": ["jeans", "jean", "denim", "denims", "jeggings", "jegging"],
+    "pants": ["pants", "pant", "trousers", "trouser", "chinos", "chino", "joggers", "cargo", "cargos"],
+    "jacket": ["jacket", "jackets", "bomber", "coat", "coats", "windcheater", "puffer", "blazer"],
+    "hoodie": ["hoodie", "hoodies", "sweatshirt", "sweatshirts", "hooded"],
+    "top": ["top", "tops", "blouse", "blouses", "crop top"],
+    "dress": ["dress", "dresses", "gown", "gowns", "frock"],
+    "kurta": ["kurta", "kurtas", "kurti", "kurtis", "ethnic", "anarkali", "salwar", "palazzo"],
+}
+
+GENDER_SYNONYMS = {
+    "women": ["women", "woman", "womens", "ladies", "lady", "girl", "girls", "female", "her"],
+    "men": ["men", "man", "mens", "gents", "boy", "boys", "male", "him"],
+}
+
+# Compound words first so "t-shirt" isn't also read as "shirt"
+_GARMENT_PATTERNS = sorted(
+    ((garment, word) for garment, words in GARMENT_SYNONYMS.items() for word in words),
+    key=lambda item: -len(item[1])
+)
+
+
+def _normalize(text):
+    return text.lower().replace("’", "'").replace("'s", "s")
+
+
+def parse_category_constraints(text):
+    """Garments and genders a query asks for, e.g. "black tees for men" ->
+    ({"t-shirt"}, {"men"})"""
+    text = _normalize(text)
+    garments = set()
+    for garment, word in _GARMENT_PATTERNS:
+        pattern = rf"(?<![\w-]){re.escape(word)}(?![\w-])"
+        if re.search(pattern, text):
+            garments.add(garment)
+            text = re.sub(pattern, " ", text)
+
+    genders = {
+        gender for gender, words in GENDER_SYNONYMS.items()
+        if re.search(rf"\b(?:{'|'.join(words)})\b", text)
+    }
+    return garments, genders
+
+
+def category_attributes(category):
+    """Garments and gender ("men", "women" or "unisex") a catalog category covers"""
+    garments, genders = parse_category_constraints(category)
+    if "unisex" in _normalize(category):
+        return garments, "unisex"
+    return garments, next(iter(genders), "unisex")
+
+
+def match_categories(text, categories):
+    """Categories a query is restricted to, or [] when it names no garment or gender"""
+    garments, genders = parse_category_constraints(text)
+    if not garments and not genders:
+        return []
+
+    matches = []
+    for category in categories:
+        category_garments, category_gender = category_attributes(category)
+        if garments and not garments & category_garments:
+            continue
+        if genders and category_gender != "unisex" and category_gender not in genders:
+            continue
+        matches.append(category)
+    return matches
@@ -0,0 +1,229 @@
+# resilience.py
+
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import logger
+from timing import profiled_thread
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+
+class LatencyTracker:
+    """Rolling window of recent call durations used to pick the hedge delay"""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, duration):
+        with self.lock:
+            self.samples.append(duration)
+
+    def percentile(self, pct):
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker.
+
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `recovery_timeout` seconds have passed; then a single trial call is
+    let through and its outcome decides whether the breaker closes again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class ResilientCall:
+    """Runs a blocking call with a deadline, a circuit breaker and optional hedging.
+
+    Calls run on a bounded thread pool so the caller can give up at the
+    deadline even though the underlying request cannot be cancelled. When
+    hedging is enabled, a second identical request is fired once the first
+    has been running longer than the tracked p-th percentile latency, and
+    whichever finishes first wins. stream() gives iterators the same
+    deadline and breaker, without hedging. Pool tasks run in a copy of the
+    caller's context, so they stay part of the caller's request profile.
+    """
+
+    def __init__(self, name, timeout, breaker, max_workers=16, hedge_enabled=False,
+                 hedge_percentile=95, hedge_min_samples=20, hedge_default_delay=None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker
+        self.tracker = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+
+    def hedge_delay(self):
+        if not self.hedge_enabled:
+            return None
+        if len(self.tracker) >= self.hedge_min_samples:
+            return self.tracker.percentile(self.hedge_percentile)
+        return self.hedge_default_delay
+
+    def _submit(self, fn, *args):
+        # Each task gets its own copy: a context can't be entered by two threads at once
+        return self.executor.submit(contextvars.copy_context().run, self._in_profile, fn, *args)
+
+    @staticmethod
+    def _in_profile(fn, *args):
+        with profiled_thread():
+            return fn(*args)
+
+    def _timed(self, fn, args):
+        start = time.monotonic()
+        result = fn(*args)
+        self.tracker.record(time.monotonic() - start)
+        return result
+
+    def call(self, fn, *args):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        deadline = time.monotonic() + self.timeout
+        pending = {self._submit(self._timed, fn, args)}
+        hedge_at = self.hedge_delay()
+        hedged = False
+        last_error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = remaining
+            if hedge_at is not None and not hedged:
+                wait_for = min(remaining, max(0.0, hedge_at - (self.timeout - remaining)))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                self.breaker.record_success()
+                return result
+
+            # Fire the hedge when the first call is slow, or retry once if it failed fast
+            if hedge_at is not None and not hedged and (pending or last_error is not None):
+                hedged = True
+                logger.info(f"Hedging '{self.name}' call after {hedge_at:.2f}s")
+                pending.add(self._submit(self._timed, fn, args))
+
+        self.breaker.record_failure()
+        if pending:
+            raise DeadlineExceededError(f"'{self.name}' call exceeded {self.timeout:.1f}s deadline")
+        raise last_error
+
+    def stream(self, fn, *args):
+        """Yield the items of fn(*args), produced on the pool, until the deadline.
+
+        The deadline is checked while waiting for each item, so a source that
+        stalls before its first item or between items is cut off too. Closing
+        the generator early counts as a success, since the caller went away
+        rather than the call failing.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        deadline = time.monotonic() + self.timeout
+        items = queue.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for item in fn(*args):
+                    if stop.is_set():
+                        return
+                    items.put(("item", item))
+            except Exception as e:
+                items.put(("error", e))
+            else:
+                items.put(("end", None))
+
+        self._submit(produce)
+        try:
+            while True:
+                try:
+                    kind, value = items.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise DeadlineExceededError(f"'{self.name}' stream exceeded {self.timeout:.1f}s deadline")
+                if kind == "end":
+                    break
+                if kind == "error":
+                    raise value
+                yield value
+        except GeneratorExit:
+            self.breaker.record_success()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            # The source can't be interrupted mid-item; it stops at its next one
+            stop.set()
+        self.breaker.record_success()
@@ -0,0 +1,209 @@
+"""Precomputed "similar products" table.
+
+For every product, the row numbers of its K nearest neighbors by product
+embedding, computed with batched matrix multiplies over a per-product
+vector index. That is VECTOR_INDEX_DIR itself when it was built with
+build_index.py --source products; otherwise (the default text index, or
+none at all) one document per product is embedded from the product store
+into VECTOR_INDEX_DIR/products, and re-embedded incrementally when the
+catalog changes. The table is a (products x K) int array saved next to
+that index as similar.npy, so a lookup is a single row read. It is
+rebuilt when the catalog's product codes or the index version change.
+
+Usage (from backend/):
+    python similar_products.py build            # precompute for VECTOR_INDEX_DIR
+    python similar_products.py build --k 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from catalog import get_product_store, product_document_text
+from config import CONFIG, logger
+from product_store import row_index_dtype
+from vector_index import (MANIFEST_FILE, IndexedDocument, NumpyVectorIndex,
+                          atomic_save_npy, atomic_write_json,
+                          load_product_vectors, update_vector_index)
+
+SIMILAR_FILE = "similar.npy"
+SIMILAR_MANIFEST_FILE = "similar.json"
+PRODUCT_VECTORS_DIR = "products"  # Under VECTOR_INDEX_DIR, when that isn't per-product
+
+similar_table = None
+similar_key = None  # (store, index manifest mtime, index dir) the table was loaded for
+similar_lock = threading.Lock()
+
+
+def catalog_fingerprint(store):
+    """Changes when products are added, removed or reordered"""
+    return hashlib.sha256(store.text["product_code"].blob).hexdigest()[:16]
+
+
+def index_version(manifest):
+    # A rebuilt index starts again at version 1, so its build time is part of the version
+    return f"{manifest.get('built_at')}/v{manifest.get('version', 1)}"
+
+
+def product_vectors_dir(index_dir=None):
+    """The per-product index the table is computed from: `index_dir` when it
+    holds one document per product, else its products/ subdirectory"""
+    index_dir = Path(index_dir or CONFIG["VECTOR_INDEX_DIR"])
+    try:
+        with open(index_dir / MANIFEST_FILE) as f:
+            if "content_hashes" in json.load(f):
+                return index_dir
+    except (OSError, ValueError):
+        pass
+    return index_dir / PRODUCT_VECTORS_DIR
+
+
+def store_documents(store):
+    """One document per product code, as build_index.py --source products embeds them"""
+    documents = {}
+    for product in store.to_records():
+        code = product["product_code"]
+        if code and code not in documents:
+            documents[code] = IndexedDocument(
+                product_document_text(product),
+                {"source": "store", "product_code": code, "category": product["category"]}
+            )
+    return list(documents.values())
+
+
+def ensure_product_vectors(store, index_dir=None):
+    """Directory of a per-product index covering `store`, embedding the
+    products first when there is none and upserting those that changed"""
+    vectors_dir = product_vectors_dir(index_dir)
+    if vectors_dir.name != PRODUCT_VECTORS_DIR:
+        # Built by build_index.py --source products, which also keeps it up to date
+        return vectors_dir
+
+    from chat import get_embeddings
+
+    documents = store_documents(store)
+    try:
+        if not NumpyVectorIndex.exists(vectors_dir):
+            logger.info(f"No per-product vectors for similar products, embedding {len(documents)} products")
+            NumpyVectorIndex.build(documents, get_embeddings(), vectors_dir, extra_manifest={"source": "products"})
+        else:
+            summary = update_vector_index(vectors_dir, documents, None, dry_run=True)
+            if summary["added"] or summary["changed"] or summary["removed"]:
+                update_vector_index(vectors_dir, documents, get_embeddings())
+    except (ImportError, RuntimeError, OSError) as e:
+        raise ValueError(f"Could not embed products: {str(e)}") from e
+    return vectors_dir
+
+
+def nearest_neighbors(matrix, k, batch_size=1024):
+    """Rows of the k most similar rows to each row of a normalized matrix, best
+    first and excluding the row itself; one matrix multiply per batch of rows"""
+    count = len(matrix)
+    k = min(k, count - 1)
+    neighbors = np.empty((count, max(k, 0)), dtype=row_index_dtype(count))
+    if k <= 0:
+        return neighbors
+    for start in range(0, count, batch_size):
+        end = min(start + batch_size, count)
+        scores = matrix[start:end] @ matrix.T
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+        neighbors[start:end] = np.take_along_axis(candidates, order, axis=1)
+    return neighbors
+
+
+def build_similar_products(store, index_dir=None, k=None):
+    """Compute and save the table for the current catalog; products the index
+    doesn't cover get a row of -1"""
+    index_dir = Path(index_dir or CONFIG["VECTOR_INDEX_DIR"])
+    k = k or CONFIG["SIMILAR_PRODUCTS_K"]
+    start = time.time()
+    codes, matrix, manifest = load_product_vectors(index_dir)
+
+    vector_rows, store_rows = [], []
+    for vector_row, code in enumerate(codes):
+        row = store.row_for_code(code)
+        if row is not None:
+            vector_rows.append(vector_row)
+            store_rows.append(row)
+    store_rows = np.asarray(store_rows, dtype=np.int64)
+
+    neighbors = nearest_neighbors(matrix[vector_rows], k)
+    table = np.full((len(store), k), -1, dtype=row_index_dtype(len(store)))
+    table[store_rows, :neighbors.shape[1]] = store_rows[neighbors]
+
+    atomic_save_npy(index_dir / SIMILAR_FILE, table)
+    atomic_write_json(index_dir / SIMILAR_MANIFEST_FILE, {
+        "catalog": catalog_fingerprint(store),
+        "index_version": index_version(manifest),
+        "k": k,
+        "count": len(store_rows),
+        "build_seconds": round(time.time() - start, 3),
+    }, indent=2)
+    logger.info(f"Built similar products for {len(store_rows)} products in {time.time() - start:.2f}s")
+    return table
+
+
+def load_similar_products(store, index_dir=None, k=None):
+    """The saved table if it matches the catalog and index, else a freshly built one"""
+    index_dir = Path(index_dir or CONFIG["VECTOR_INDEX_DIR"])
+    k = k or CONFIG["SIMILAR_PRODUCTS_K"]
+    try:
+        with open(index_dir / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        with open(index_dir / SIMILAR_MANIFEST_FILE) as f:
+            similar_manifest = json.load(f)
+        if similar_manifest.get("catalog") == catalog_fingerprint(store) and \
+                similar_manifest.get("index_version") == index_version(manifest) and similar_manifest.get("k") == k:
+            return np.load(index_dir / SIMILAR_FILE, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    return build_similar_products(store, index_dir, k)
+
+
+def get_similar_products(store):
+    """The table for `store`, reloaded when the per-product index changes"""
+    global similar_table, similar_key
+    with similar_lock:
+        if similar_key is None or similar_key[0] is not store:
+            # Embeds the catalog on first use, or the products changed since
+            vectors_dir = ensure_product_vectors(store)
+        else:
+            vectors_dir = similar_key[2]
+        try:
+            mtime = os.path.getmtime(vectors_dir / MANIFEST_FILE)
+        except OSError:
+            raise ValueError(f"No per-product vector index in {vectors_dir}") from None
+        if similar_key is None or similar_key[0] is not store or similar_key[1] != mtime:
+            similar_table = load_similar_products(store, vectors_dir)
+            similar_key = (store, mtime, vectors_dir)
+        return similar_table
+
+
+def similar_rows(store, row, limit):
+    return [int(neighbor) for neighbor in get_similar_products(store)[row][:limit] if neighbor >= 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the similar products table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="compute the table for the current catalog and index")
+    build_parser.add_argument("--index-dir", default=CONFIG["VECTOR_INDEX_DIR"])
+    build_parser.add_argument("--k", type=int, default=CONFIG["SIMILAR_PRODUCTS_K"])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        store = get_product_store()
+        vectors_dir = ensure_product_vectors(store, args.index_dir)
+        table = build_similar_products(store, vectors_dir, args.k)
+        print(f"Wrote {table.shape[0]} x {table.shape[1]} neighbors to {vectors_dir / SIMILAR_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# conftest.py
+#
+# Run from backend/: python -m pytest tests
+#
+# CONFIG is read from the environment when config.py is first imported, so
+# the data directory and backend settings are pointed at a scratch copy here,
+# before any test module imports the backend.
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_scratch = Path(tempfile.mkdtemp(prefix="walmate-tests-"))
+shutil.copytree(BACKEND_DIR / "data", _scratch / "data")
+os.environ.update({
+    "DATA_DIR": str(_scratch / "data"),
+    "TEXT_FILE": str(BACKEND_DIR / "h.txt"),
+    "VECTOR_INDEX_DIR": str(_scratch / "index"),
+    "PROFILING_DIR": str(_scratch / "profiles"),
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_LATENCY_MS": "0",
+    "FAKE_LLM_TOKENS_PER_SEC": "0",
+    "USER_WRITE_BEHIND_SECONDS": "0",
+    "PASSWORD_SCRYPT_N": "1024",
+})
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """CONFIG, with any keys a test sets restored afterwards"""
+    from config import CONFIG
+
+    def set_config(**values):
+        for key, value in values.items():
+            monkeypatch.setitem(CONFIG, key, value)
+        return CONFIG
+
+    return set_config
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+def controller(**overrides):
+    settings = dict(max_concurrent=1, max_queue=1, queue_timeout=0.05, user_rate=0.0, user_burst=3,
+                    global_rate=0.0, global_burst=100)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def test_token_bucket_refund_is_capped_at_capacity():
+    bucket = TokenBucket(rate=0.0, capacity=1)
+    assert bucket.try_acquire()[0]
+    assert not bucket.try_acquire()[0]
+    bucket.refund()
+    bucket.refund()
+    assert bucket.tokens == 1
+
+
+def test_user_rate_limit_returns_429():
+    async def scenario():
+        admission = controller(max_concurrent=10, user_burst=1)
+        await admission.acquire("user:a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("user:a")
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_full_rejection_refunds_tokens():
+    async def scenario():
+        admission = controller(max_queue=0)
+        await admission.acquire("user:a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("user:b")
+        assert rejected.value.status_code == 503
+        assert admission.user_buckets["user:b"].tokens == 3
+        assert admission.global_bucket.tokens == 99
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejection_refunds_tokens():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("user:a")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("user:b")
+        assert admission.user_buckets["user:b"].tokens == 3
+        assert not admission.waiters
+
+    asyncio.run(scenario())
+
+
+def test_global_rate_rejection_refunds_user_token():
+    async def scenario():
+        admission = controller(global_burst=0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("user:a")
+        assert rejected.value.status_code == 503
+        assert admission.user_buckets["user:a"].tokens == 3
+
+    asyncio.run(scenario())
+
+
+def test_release_hands_slot_to_oldest_waiter():
+    async def scenario():
+        admission = controller(max_queue=2, queue_timeout=5)
+        await admission.acquire("user:a")
+        order = []
+
+        async def waiter(name):
+            await admission.acquire(f"user:{name}")
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ("b", "c")]
+        await asyncio.sleep(0.01)
+        admission.release()
+        await asyncio.sleep(0.01)
+        admission.release()
+        await asyncio.gather(*tasks)
+        assert order == ["b", "c"]
+        assert admission.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_shed_responses_carry_cors_headers(monkeypatch):
+    from app import app, chat_admission
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(chat_admission, "global_bucket", TokenBucket(rate=0.0, capacity=0))
+    response = TestClient(app).post("/api/chat", json={"message": "hi"},
+                                    headers={"Origin": "http://localhost:3000"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"]
+    assert response.headers["access-control-allow-origin"]
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
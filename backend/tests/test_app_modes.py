@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+PROBE = """
+import json, sys
+import app
+print(json.dumps({"routes": sorted(app.app.openapi()["paths"]), "modules": sorted(sys.modules)}))
+"""
+
+
+def import_app(mode):
+    env = dict(os.environ, APP_MODE=mode, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def test_lite_mode_serves_catalog_without_chat_or_ml_imports():
+    lite = import_app("lite")
+    assert "/api/products/{product_id}" in lite["routes"]
+    assert "/api/chat" not in lite["routes"]
+    assert not {"langchain", "langchain_core", "torch", "sentence_transformers"} & set(lite["modules"])
+
+
+def test_full_mode_mounts_chat_without_loading_models_at_import():
+    full = import_app("full")
+    assert "/api/chat" in full["routes"]
+    assert not {"torch", "sentence_transformers"} & set(full["modules"])
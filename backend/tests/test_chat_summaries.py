@@ -0,0 +1,63 @@
+import uuid
+
+import chat
+import pytest
+from auth import AuthSystem
+from config import CONFIG
+
+
+@pytest.fixture
+def username():
+    return f"user-{uuid.uuid4().hex[:8]}"
+
+
+def test_new_turns_update_title_and_count(username):
+    chat.save_user_chat_id(username, "chat_a")
+    chat.update_chat_summary(username, "chat_a")
+    chat.update_chat_summary(username, "chat_a", "show me black t-shirts under 500 for the summer holidays")
+    chat.update_chat_summary(username, "chat_a", "and jeans?")
+    summary, = chat.get_chat_summaries(username)
+    assert summary["turns"] == 2
+    assert summary["title"] == chat.chat_title("show me black t-shirts under 500 for the summer holidays")
+    assert len(summary["title"]) <= CONFIG["CHAT_TITLE_LENGTH"]
+
+
+def test_chats_predating_the_index_are_summarized_once(username, monkeypatch):
+    history = AuthSystem.load_db(CONFIG["CHAT_HISTORY_FILE"])
+    history["chat_old"] = [{"prompt": "hoodies", "response": "..."}, {"prompt": "in red", "response": "..."}]
+    AuthSystem.write_db(CONFIG["CHAT_HISTORY_FILE"], history)
+    # Written directly: save_user_chat_id() would add the summary itself
+    sessions = AuthSystem.load_db(CONFIG["CHAT_SESSIONS_FILE"])
+    sessions[username] = ["chat_old"]
+    AuthSystem.write_db(CONFIG["CHAT_SESSIONS_FILE"], sessions)
+
+    summary, = chat.get_chat_summaries(username)
+    assert (summary["title"], summary["turns"]) == ("hoodies", 2)
+
+    monkeypatch.setattr(chat, "summarize_history", lambda *args: pytest.fail("summarized again"))
+    assert chat.get_chat_summaries(username) == [summary]
+
+
+def test_deleted_chat_summary_is_dropped(username):
+    chat.save_user_chat_id(username, "chat_b")
+    chat.update_chat_summary(username, "chat_b", "shirts")
+    chat.delete_chat_summary(username, "chat_b")
+    assert "chat_b" not in AuthSystem.load_db(CONFIG["CHAT_SUMMARIES_FILE"]).get(username, {})
+
+
+def test_summaries_endpoint_sorts_and_pages(username):
+    import app as app_module
+    from fastapi.testclient import TestClient
+
+    for i, prompt in enumerate(["b", "c", "a"]):
+        chat.save_user_chat_id(username, f"chat_{i}")
+        chat.update_chat_summary(username, f"chat_{i}", prompt)
+    app_module.app.dependency_overrides[app_module.verify_token] = lambda: username
+    try:
+        response = TestClient(app_module.app).get("/api/chat-sessions/summaries",
+                                                  params={"sort": "title", "order": "asc", "page_size": 2})
+    finally:
+        app_module.app.dependency_overrides.clear()
+    body = response.json()
+    assert body["total"] == 3
+    assert [session["title"] for session in body["sessions"]] == ["a", "b"]
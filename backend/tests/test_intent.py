@@ -0,0 +1,66 @@
+import chat
+import intent
+import pytest
+from intent import (FAREWELL, GREETING, PRODUCT_LOOKUP, SHOPPING, THANKS,
+                    IntentClassifier)
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("Hi there!", GREETING),
+    ("good morning walmate", GREETING),
+    ("thanks", THANKS),
+    ("Thank you so much!", THANKS),
+    ("ok, thanks a lot", THANKS),
+    ("perfect thank you buddy", THANKS),
+    ("bye for now", FAREWELL),
+])
+def test_rules(text, expected):
+    assert IntentClassifier.classify(text) == (expected, 1.0, [])
+
+
+@pytest.mark.parametrize("text", ["ok", "okay", "great", "cool!", "perfect", "thanks but show me jeans"])
+def test_acknowledgements_are_not_thanks(text):
+    assert IntentClassifier.classify_rules(text) is None
+
+
+def test_product_codes_are_looked_up_only_without_other_words():
+    assert IntentClassifier.classify("show me pid 4 and PID-012") == (PRODUCT_LOOKUP, 1.0, ["PID004", "PID012"])
+    assert IntentClassifier.classify("is PID004 good for winter")[0] == SHOPPING
+
+
+def test_rules_answer_without_loading_embeddings():
+    def load_embeddings():
+        raise AssertionError("embeddings loaded")
+
+    assert IntentClassifier.classify("hello", load_embeddings)[0] == GREETING
+    assert IntentClassifier.classify("a long question " * 10, load_embeddings)[0] == SHOPPING
+
+
+def test_model_runs_when_rules_are_inconclusive(monkeypatch):
+    monkeypatch.setattr(IntentClassifier, "classify_model", staticmethod(lambda text, embeddings: (FAREWELL, 0.99)))
+    assert IntentClassifier.classify("catch you later", lambda: object()) == (FAREWELL, 0.99, [])
+
+
+def test_unsure_model_falls_back_to_shopping(config, monkeypatch):
+    config(INTENT_CONFIDENCE_THRESHOLD=0.8)
+    monkeypatch.setattr(IntentClassifier, "classify_model", staticmethod(lambda text, embeddings: (THANKS, 0.5)))
+    assert IntentClassifier.classify("ok", lambda: object())[0] == SHOPPING
+
+
+def test_embeddings_failure_falls_back_to_shopping():
+    def load_embeddings():
+        raise RuntimeError("model missing")
+
+    assert IntentClassifier.classify("catch you later", load_embeddings)[0] == SHOPPING
+
+
+def test_route_intent_loads_embeddings_only_for_the_model(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(chat, "get_embeddings", lambda: loaded.append(True) or object())
+    monkeypatch.setattr(intent, "_intent_model", None)
+    monkeypatch.setattr(IntentClassifier, "classify_model", staticmethod(lambda text, embeddings: (SHOPPING, 0.9)))
+
+    assert chat.ChatSystem.route_intent("hello")["product_ids"] == []
+    assert not loaded
+    assert chat.ChatSystem.route_intent("something comfy") is None
+    assert loaded
@@ -0,0 +1,30 @@
+from chat import DEFAULT_PROMPT_TEMPLATE
+from llm import FakeBackend
+
+
+def render(context):
+    return DEFAULT_PROMPT_TEMPLATE.format(preferences="", context=context, input="warm jackets?")
+
+
+def recommended(answer):
+    marker = "[RECOMMENDED:"
+    if marker not in answer:
+        return []
+    return [code.strip() for code in answer.split(marker)[1].rstrip("]").split(",")]
+
+
+def test_fake_recommends_only_codes_from_context():
+    answer = FakeBackend().generate(render("PID010: Wool coat\nPID011: Down jacket"))
+    codes = recommended(answer)
+    assert codes and set(codes) <= {"PID010", "PID011"}
+
+
+def test_fake_ignores_example_codes_in_instructions():
+    # The template's own [RECOMMENDED: PID123, PID456] example must not leak through
+    assert "PID123" in render("")
+    assert recommended(FakeBackend().generate(render("No matching products."))) == []
+
+
+def test_fake_is_deterministic():
+    prompt = render("PID001 PID002 PID003 PID004")
+    assert FakeBackend().generate(prompt) == FakeBackend().generate(prompt)
@@ -0,0 +1,122 @@
+import smtplib
+import time
+
+import mailer as mailer_module
+import pytest
+from mailer import Mailer, Outbox, SMTPPool
+
+
+class FakePool:
+    size = 2
+    timeout = 1
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.sent = []
+
+    def send(self, message):
+        if self.fail:
+            self.fail -= 1
+            raise smtplib.SMTPRecipientsRefused({})
+        self.sent.append(message["To"])
+
+    def close(self):
+        pass
+
+
+class FakeSMTP:
+    opened = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.opened.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, message):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("gone")
+        self.sent.append(message)
+
+    def quit(self):
+        self.closed = True
+
+    close = quit
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox.json"))
+
+
+def make_mailer(outbox, pool, **options):
+    mail = Mailer(outbox, pool, retry_base=60, **options)
+    mail.stopped = True  # No delivery thread; tests drive deliver_due()
+    return mail
+
+
+def test_queued_message_is_delivered_and_removed(outbox):
+    pool = FakePool()
+    mail = make_mailer(outbox, pool)
+    mail.queue("ann@example.com", "Hi", "Body")
+    assert len(outbox.read()) == 1
+    assert mail.deliver_due() == 0
+    assert pool.sent == ["ann@example.com"]
+    assert outbox.read() == {}
+
+
+def test_failed_delivery_backs_off_then_gives_up(outbox):
+    mail = make_mailer(outbox, FakePool(fail=2), max_attempts=2)
+    message_id = mail.queue("ann@example.com", "Hi", "Body")
+    mail.deliver_due()
+    message = outbox.read()[message_id]
+    assert (message["status"], message["attempts"]) == ("pending", 1)
+    assert message["next_attempt_at"] > time.time() + 20
+    assert mail.claim()[0] == []
+
+    with outbox.edit() as messages:
+        messages[message_id]["next_attempt_at"] = 0
+    mail.deliver_due()
+    assert outbox.read()[message_id]["status"] == "failed"
+
+
+def test_leased_messages_are_not_claimed_twice(outbox):
+    mail = make_mailer(outbox, FakePool(), lease_seconds=60)
+    other = make_mailer(outbox, FakePool())
+    message_id = mail.queue("ann@example.com", "Hi", "Body")
+    assert [claimed for claimed, _ in mail.claim()[0]] == [message_id]
+    assert other.claim()[0] == []
+
+    with outbox.edit() as messages:
+        messages[message_id]["lease_until"] = 0  # Lease expired, e.g. the worker crashed
+    assert [claimed for claimed, _ in other.claim()[0]] == [message_id]
+
+
+def test_pool_reuses_connections_and_replaces_dropped_ones(monkeypatch):
+    FakeSMTP.opened = []
+    monkeypatch.setattr(mailer_module.smtplib, "SMTP", FakeSMTP)
+    pool = SMTPPool("localhost", 25, size=1)
+    message = mailer_module.build_message({"to": "a@example.com", "subject": "s", "body": "b", "message_id": "<1@x>"})
+
+    pool.send(message)
+    pool.send(message)
+    assert len(FakeSMTP.opened) == 1
+
+    FakeSMTP.opened[0].closed = True  # The server dropped the idle connection
+    pool.send(message)
+    assert len(FakeSMTP.opened) == 2 and len(FakeSMTP.opened[1].sent) == 1
+
+
+def test_idle_connections_expire(monkeypatch):
+    FakeSMTP.opened = []
+    monkeypatch.setattr(mailer_module.smtplib, "SMTP", FakeSMTP)
+    pool = SMTPPool("localhost", 25, idle_seconds=0)
+    message = mailer_module.build_message({"to": "a@example.com", "subject": "s", "body": "b", "message_id": "<1@x>"})
+    pool.send(message)
+    pool.send(message)
+    assert len(FakeSMTP.opened) == 2 and FakeSMTP.opened[0].closed
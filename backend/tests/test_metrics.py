@@ -0,0 +1,68 @@
+import metrics
+import pytest
+from metrics import Counter, Histogram, MetricsMiddleware, render_metrics, span
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry, so test metrics don't leak into the app's /metrics"""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    return metrics.REGISTRY
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    histogram = Histogram("test_seconds", "Test", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage="x")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="x",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="x"} 4' in lines
+
+
+def test_label_values_are_escaped(registry):
+    counter = Counter("test_total", "Test")
+    counter.inc(path='a"b\\c')
+    assert 'test_total{path="a\\"b\\\\c"} 1.0' in render_metrics()
+
+
+def app_with_route(server_timing):
+    def product(request):
+        with span("retrieval"):
+            pass
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/items/{item_id}", product)])
+    app.add_middleware(MetricsMiddleware, server_timing=server_timing)
+    return app
+
+
+def test_server_timing_lists_spans_of_the_request():
+    response = TestClient(app_with_route(server_timing=True)).get("/items/1")
+    names = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert names == ["retrieval", "total"]
+    assert "server-timing" not in TestClient(app_with_route(server_timing=False)).get("/items/1").headers
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(app_with_route(server_timing=False))
+    for item_id in range(3):
+        client.get(f"/items/{item_id}")
+    client.get("/no/such/path")
+    rendered = metrics.HTTP_REQUEST_SECONDS.render()
+    assert any('path="/items/{item_id}"' in line for line in rendered)
+    assert any('path="unmatched"' in line for line in rendered)
+    assert not any('path="/items/1"' in line for line in rendered)
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from app import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE walmate_http_request_seconds histogram" in response.text
@@ -0,0 +1,49 @@
+import json
+import os
+
+import chat
+from catalog import get_product_store
+from migrate_chat_history import SNAPSHOT_FIELDS, migrate_entry, migrate_history
+
+
+def legacy_entry(*products):
+    return {"prompt": "shirts?", "response": "Here you go", "recommendations": list(products)}
+
+
+def test_matching_products_become_ids_and_stale_ones_are_trimmed():
+    store = get_product_store()
+    current = store.to_records([0])[0]
+    stale = {"id": current["id"], "name": "Gone", "description": "Old catalog item", "price": 10,
+             "imageUrl": "/img.png", "material": "Cotton", "category": "Shirts"}
+    migrated, rewritten = migrate_entry(legacy_entry(dict(current), stale), store)
+    assert rewritten
+    assert migrated["product_ids"] == [str(current["id"])]
+    assert migrated["recommendations"] == [{field: stale[field] for field in SNAPSHOT_FIELDS}]
+
+
+def test_empty_recommendations_are_dropped():
+    migrated, rewritten = migrate_entry(legacy_entry(), get_product_store())
+    assert rewritten
+    assert "recommendations" not in migrated and "product_ids" not in migrated
+
+
+def test_migrated_entries_hydrate_like_legacy_ones():
+    store = get_product_store()
+    current = store.to_records([1])[0]
+    stale = {"id": 999999, "name": "Gone", "description": "Old", "price": 10, "category": "Shirts"}
+    legacy = legacy_entry(dict(current), stale)
+    migrated, _ = migrate_entry(legacy, store)
+    before, after = chat.ChatSystem.hydrate_history([legacy, migrated])
+    assert after["product_ids"] == before["product_ids"]
+    assert [p["name"] for p in after["recommendations"]] == [p["name"] for p in before["recommendations"]]
+
+
+def test_shipped_history_shrinks_and_migration_is_idempotent(config):
+    with open(os.path.join(config()["DATA_DIR"], "chat_history.json")) as f:
+        history = json.load(f)
+    migrated, rewritten = migrate_history(history)
+    assert rewritten > 0
+    assert len(json.dumps(migrated, indent=2)) < len(json.dumps(history, indent=2))
+    assert not any("category" in product or "id" in product
+                   for items in migrated.values() for item in items for product in item.get("recommendations", []))
+    assert migrate_history(migrated) == (migrated, 0)
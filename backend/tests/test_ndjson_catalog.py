@@ -0,0 +1,104 @@
+import json
+import os
+
+import catalog
+import pytest
+from ndjson_catalog import (CODE_INDEX_SUFFIX, INDEX_SUFFIX, OffsetIndex,
+                            build_offset_index, iter_json_array, iter_ndjson,
+                            write_ndjson)
+from product_store import ProductStore, normalize_product
+
+
+@pytest.fixture
+def products(config):
+    with open(os.path.join(config()["DATA_DIR"], "products.json")) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def ndjson_catalog(tmp_path, products, config, monkeypatch):
+    path = tmp_path / "products.ndjson"
+    write_ndjson(products, path)
+    build_offset_index(path)
+    config(PRODUCTS_FILE=str(path), CATALOG_RESIDENT=False)
+    monkeypatch.setattr(catalog, "offset_index", None)
+    return path
+
+
+def test_iter_json_array_across_chunk_boundaries(tmp_path, products):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps(products, indent=2))
+    assert list(iter_json_array(path, chunk_size=64)) == products
+
+
+def test_iter_json_array_rejects_non_array(tmp_path):
+    path = tmp_path / "object.json"
+    path.write_text('{"id": 1}')
+    with pytest.raises(ValueError):
+        list(iter_json_array(path))
+
+
+def test_ndjson_round_trip(ndjson_catalog, products):
+    assert list(iter_ndjson(ndjson_catalog)) == products
+
+
+def test_offset_index_reads_ids_and_codes(ndjson_catalog, products):
+    index = OffsetIndex(ndjson_catalog)
+    assert len(index) == len(products)
+    assert index.read(products[4]["id"]) == products[4]
+    assert index.read("05") is None
+    assert index.read_code(products[4]["product_code"].lower()) == products[4]
+    assert index.read_code("PID999") is None
+
+
+def test_offset_index_rebuilds_when_catalog_changes(ndjson_catalog, products):
+    write_ndjson(products[:3], ndjson_catalog)
+    stale = os.path.getmtime(ndjson_catalog) - 10
+    for suffix in (INDEX_SUFFIX, CODE_INDEX_SUFFIX):
+        os.utime(f"{ndjson_catalog}{suffix}", (stale, stale))
+    index = OffsetIndex(ndjson_catalog)
+    assert len(index) == 3
+    assert index.read(products[10]["id"]) is None
+
+
+def test_read_product_matches_resident_catalog(ndjson_catalog, products):
+    store = ProductStore(catalog.with_image_urls([dict(p) for p in products]), catalog.text_categories())
+    for row, product in enumerate(products):
+        assert catalog.read_product(str(product["id"])) == store.view(row).to_dict()
+
+
+def test_normalize_product_matches_store_view(products):
+    records = [dict(product, material=f" {product.get('material', '')}  ") for product in products[:20]]
+    records[3]["stock"] = 5
+    store = ProductStore([dict(record) for record in records])
+    for row, record in enumerate(records):
+        assert normalize_product(record) == store.view(row).to_dict()
+
+
+def test_read_product_resolves_codes_without_building_a_store(ndjson_catalog, products, monkeypatch):
+    calls = []
+    text_categories = catalog.text_categories
+    monkeypatch.setattr(catalog, "categories_cache", None)
+    monkeypatch.setattr(catalog, "text_categories", lambda *args: calls.append(args) or text_categories(*args))
+    monkeypatch.setattr(catalog, "ProductStore", None)
+
+    expected = products[3]["id"]
+    for key in (" 4 ", products[3]["product_code"], products[3]["product_code"].lower(), "004"):
+        assert catalog.read_product(key)["id"] == expected
+    assert catalog.read_product("99999") is None
+    assert len(calls) == 1
+
+
+def test_missing_id_is_404_without_loading_the_catalog(ndjson_catalog, monkeypatch):
+    from app import app
+    from fastapi.testclient import TestClient
+
+    def no_full_load():
+        raise AssertionError("full catalog loaded")
+
+    client = TestClient(app)
+    monkeypatch.setattr("app.get_product_store", no_full_load)
+    assert client.get("/api/products/PID004").json()["id"] == 4
+    assert client.get("/api/products/99999").status_code == 404
+    assert catalog.is_indexed_key("pid12")
+    assert not catalog.is_indexed_key("nike")
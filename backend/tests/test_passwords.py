@@ -0,0 +1,71 @@
+import hashlib
+import uuid
+
+import pytest
+from auth import AuthSystem
+from config import CONFIG
+from passwords import PasswordHasher, password_hasher
+
+
+@pytest.fixture
+def user(config):
+    """Adds a verified user to the users file; returns a function setting their stored hash"""
+    filename = config()["USER_DB_FILE"]
+    username = f"user-{uuid.uuid4().hex[:8]}"
+
+    def with_hash(password_hash):
+        users = AuthSystem.load_db(filename)
+        users[username] = {"email": f"{username}@example.com", "password_hash": password_hash, "verified": True}
+        AuthSystem.write_db(filename, users)
+        return username
+
+    return with_hash
+
+
+def stored_hash(username):
+    return AuthSystem.load_db(CONFIG["USER_DB_FILE"])[username]["password_hash"]
+
+
+def test_hash_round_trip_is_salted():
+    first, second = password_hasher.hash("hunter2"), password_hasher.hash("hunter2")
+    assert first != second
+    assert password_hasher.verify("hunter2", first)
+    assert not password_hasher.verify("hunter3", first)
+    assert not password_hasher.needs_rehash(first)
+
+
+def test_legacy_and_lower_cost_hashes_verify_and_need_rehash():
+    legacy = hashlib.sha256(b"hunter2").hexdigest()
+    assert password_hasher.verify("hunter2", legacy)
+    assert password_hasher.needs_rehash(legacy)
+
+    cheaper = PasswordHasher(n=password_hasher.n // 2, workers=1).hash("hunter2")
+    assert password_hasher.verify("hunter2", cheaper)
+    assert password_hasher.needs_rehash(cheaper)
+
+
+@pytest.mark.parametrize("stored", [
+    "scrypt$1024$8$1$c2FsdA==",
+    "scrypt$n$8$1$c2FsdA==$ZGlnZXN0",
+    "scrypt$1000$8$1$c2FsdA==$ZGlnZXN0",
+    "scrypt$1024$8$1$not base64!$ZGlnZXN0",
+])
+def test_malformed_hash_fails_verification(stored):
+    assert password_hasher.verify("hunter2", stored) is False
+
+
+def test_login_upgrades_legacy_hash(user):
+    username = user(hashlib.sha256(b"hunter2").hexdigest())
+    assert AuthSystem.authenticate_user(username, "hunter2")[0]
+    upgraded = stored_hash(username)
+    assert not password_hasher.needs_rehash(upgraded)
+    assert AuthSystem.authenticate_user(username, "hunter2")[0]
+
+
+def test_login_with_malformed_hash_is_rejected_not_an_error(user):
+    from app import app
+    from fastapi.testclient import TestClient
+
+    username = user("scrypt$1024$8$1$c2FsdA==")
+    response = TestClient(app).post("/api/login", json={"username": username, "password": "hunter2"})
+    assert response.status_code == 401
@@ -0,0 +1,102 @@
+import random
+
+import numpy as np
+import pytest
+from product_store import FacetIndex, ProductCodeMap, ProductStore
+
+BRANDS = ["Nike", "Adidas", "Puma", "H&M", "Zara"]
+MATERIALS = ["100% Cotton", "Polyester", "Denim", "Wool"]
+CATEGORIES = ["T-Shirts", "Jeans", "Jackets", "Dresses"]
+
+
+def synthetic_records(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i + 1,
+            "product_code": f"PID{i + 1:03d}",
+            "name": rng.choice(BRANDS),
+            "description": f"Item {i}",
+            "price": rng.randint(100, 5000),
+            "material": rng.choice(MATERIALS) + " " * rng.randint(0, 2),
+            "durability": "Everyday",
+            "category": rng.choice(CATEGORIES),
+            "imageUrl": "",
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(scope="module")
+def large_store():
+    # More rows than one walk chunk, and not a multiple of 8
+    return ProductStore(synthetic_records(FacetIndex.WALK_CHUNK * 2 + 13))
+
+
+def expected_search(store, filters, price_min, price_max, sort, descending):
+    rows = store.filter_rows(price_min, price_max,
+                             **{"name" if facet == "brand" else facet: values for facet, values in filters.items()})
+    return store.sort_rows(rows, sort, descending) if sort else rows
+
+
+@pytest.mark.parametrize("sort,descending", [(None, False), ("price", False), ("price", True), ("brand", False)])
+@pytest.mark.parametrize("offset", [0, 37, 5000, 100000])
+def test_facet_search_pages_match_full_filter_and_sort(large_store, sort, descending, offset):
+    filters = {"brand": ["Nike", "Puma"], "material": ["Denim"]}
+    rows, total, _ = large_store.facets.search(filters, price_min=500, price_max=4000, sort=sort,
+                                               descending=descending, offset=offset, limit=25)
+    expected = expected_search(large_store, filters, 500, 4000, {"brand": "name"}.get(sort, sort), descending)
+    assert total == len(expected)
+    assert list(rows) == list(expected[offset:offset + 25])
+
+
+def test_facet_search_stops_walking_once_page_is_full(large_store, monkeypatch):
+    walked = []
+    original = np.unpackbits
+
+    def counting_unpackbits(bitmap, *args, **kwargs):
+        walked.append(len(bitmap))
+        return original(bitmap, *args, **kwargs)
+
+    monkeypatch.setattr(np, "unpackbits", counting_unpackbits)
+    large_store.facets.search({"brand": ["Nike"]}, limit=10)
+    assert len(walked) == 1
+
+
+def test_facet_values_match_case_insensitively(large_store):
+    _, exact, _ = large_store.facets.search({"brand": ["Nike"], "material": ["Denim"]})
+    _, folded, _ = large_store.facets.search({"brand": ["nIKE"], "material": [" denim "]})
+    assert folded == exact > 0
+
+
+def test_facet_counts_exclude_own_filter(large_store):
+    _, total, facets = large_store.facets.search({"brand": ["Nike"]})
+    assert facets["brand"]["Nike"] == total
+    assert sum(facets["brand"].values()) == len(large_store)
+    assert sum(facets["material"].values()) == total
+
+
+def test_store_normalizes_whitespace_and_keeps_extra_fields():
+    store = ProductStore([{"id": 1, "product_code": "PID001", "material": "Wool  ", "price": 10,
+                           "features": ["warm"], "stock": 3}])
+    product = store.view(0).to_dict()
+    assert product["material"] == "Wool"
+    assert product["features"] == ["warm"] and product["stock"] == 3
+
+
+def test_product_code_map_len_matches_iteration():
+    code_map = ProductCodeMap()
+    code_map.store = ProductStore(synthetic_records(50))
+    keys = list(code_map)
+    assert len(keys) == len(set(keys)) == len(code_map)
+    assert code_map["PID007"] == code_map["007"] == code_map["7"] == "7"
+
+
+def test_filter_and_sort_match_plain_python():
+    records = synthetic_records(300)
+    store = ProductStore([dict(record) for record in records])
+    rows = store.sort_rows(store.filter_rows(1000, 3000, name=["Zara", "Puma"]), "price", descending=True)
+    expected = sorted((i for i, r in enumerate(records) if 1000 <= r["price"] <= 3000 and r["name"] in ("Zara", "Puma")),
+                      key=lambda i: -records[i]["price"])
+    assert list(rows) == expected
+    assert store.row_for_id("42") == 41 and store.row_for_id("042") is None
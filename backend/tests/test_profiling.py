@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+import timing
+from profiling import (PROFILE_SUFFIX, SamplingProfiler, prune_profiles,
+                       sign_profile_request, verify_profile_request)
+from resilience import CircuitBreaker, ResilientCall
+
+request_var = ContextVar("request_var", default=None)
+
+
+def profiler(tmp_path):
+    return SamplingProfiler("req", tmp_path / f"req{PROFILE_SUFFIX}", interval=0.001, max_seconds=5)
+
+
+def sample_names(sampler):
+    return {sampler.frames[i]["name"] for samples in sampler.samples.values() for stack, _ in samples for i in stack}
+
+
+def test_signed_header_verifies_only_while_fresh(config):
+    config(PROFILING_SECRET="s3cret")
+    assert verify_profile_request(sign_profile_request().encode())
+    assert not verify_profile_request(sign_profile_request(time.time() - 3600).encode())
+    assert not verify_profile_request(sign_profile_request(secret="other").encode())
+
+
+def test_loop_samples_need_the_request_frame(tmp_path):
+    def request_handler(sampler):
+        sampler._sample(1.0)
+
+    def other_request(sampler):
+        sampler._sample(1.0)
+
+    sampler = profiler(tmp_path)
+    sampler.loop_thread = threading.get_ident()
+    sampler.threads.add(sampler.loop_thread)
+    sampler.anchor = sys._getframe()
+    request_handler(sampler)
+    assert "request_handler" in sample_names(sampler)
+
+    sampler = profiler(tmp_path)
+    sampler.loop_thread = threading.get_ident()
+    sampler.threads.add(sampler.loop_thread)
+    sampler.anchor = object()
+    other_request(sampler)
+    assert sampler.samples == {}
+
+
+def test_resilient_calls_run_in_the_callers_context():
+    call = ResilientCall("ctx", timeout=1.0, breaker=CircuitBreaker("ctx"), max_workers=2)
+    token = request_var.set("request-1")
+    try:
+        assert call.call(request_var.get) == "request-1"
+        assert list(call.stream(lambda: iter([request_var.get()]))) == ["request-1"]
+    finally:
+        request_var.reset(token)
+
+
+def test_resilient_calls_join_the_active_profile(tmp_path):
+    sampler = profiler(tmp_path)
+    seen = []
+    call = ResilientCall("prof", timeout=1.0, breaker=CircuitBreaker("prof"), max_workers=2)
+    token = timing.active_profiler.set(sampler)
+    try:
+        call.call(lambda: seen.append(threading.get_ident() in sampler.threads))
+    finally:
+        timing.active_profiler.reset(token)
+    assert seen == [True]
+    assert sampler.threads == set()
+
+
+def test_prune_keeps_newest_profiles(tmp_path):
+    for i in range(5):
+        path = tmp_path / f"{i}{PROFILE_SUFFIX}"
+        path.write_text("{}")
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / "notes.txt").write_text("")
+    prune_profiles(tmp_path, 2)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"3{PROFILE_SUFFIX}", f"4{PROFILE_SUFFIX}", "notes.txt"]
+
+
+def wait_for_profiles(directory, suffix):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        names = [path.name for path in directory.glob(f"*{PROFILE_SUFFIX}")]
+        if any(name.endswith(suffix) for name in names):
+            return names
+        time.sleep(0.01)
+    return names
+
+
+def test_profiled_requests_write_capped_profiles(config, tmp_path):
+    from app import app
+    from fastapi.testclient import TestClient
+
+    config(PROFILING_SECRET="s3cret", PROFILING_DIR=str(tmp_path), PROFILING_MAX_FILES=1)
+    client = TestClient(app)
+    for request_id in ("first", "second"):
+        response = client.get("/api/products/PID001", headers={
+            "X-Profile-Request": sign_profile_request(), "X-Request-Id": request_id})
+        assert response.headers["x-profile-id"] == request_id
+        names = wait_for_profiles(tmp_path, f"{request_id}{PROFILE_SUFFIX}")
+        assert len(names) == 1 and names[0].endswith(f"{request_id}{PROFILE_SUFFIX}")
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+from resilience import (CircuitBreaker, CircuitOpenError, DeadlineExceededError,
+                        ResilientCall)
+
+
+def guard(timeout=1.0, **overrides):
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.05)
+    return ResilientCall("test", timeout=timeout, breaker=breaker, max_workers=4, **overrides)
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_call_enforces_deadline():
+    call = guard(timeout=0.05)
+    with pytest.raises(DeadlineExceededError):
+        call.call(time.sleep, 0.5)
+    assert call.breaker.failures == 1
+
+
+def test_call_raises_when_circuit_open():
+    call = guard()
+    call.breaker.record_failure()
+    call.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        call.call(lambda: "never")
+
+
+def test_hedge_answers_when_first_call_is_slow():
+    calls = []
+
+    def slow_then_fast():
+        calls.append(None)
+        time.sleep(0.5 if len(calls) == 1 else 0.0)
+        return len(calls)
+
+    call = guard(timeout=1.0, hedge_enabled=True, hedge_min_samples=100, hedge_default_delay=0.02)
+    start = time.monotonic()
+    assert call.call(slow_then_fast) == 2
+    assert time.monotonic() - start < 0.4
+
+
+def test_hedge_retries_a_fast_failure_once():
+    calls = []
+
+    def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise ConnectionError("reset")
+        return "ok"
+
+    call = guard(hedge_enabled=True, hedge_min_samples=100, hedge_default_delay=0.5)
+    assert call.call(flaky) == "ok"
+    assert call.breaker.failures == 0
+
+
+def test_hedge_delay_follows_tracked_percentile():
+    call = guard(hedge_enabled=True, hedge_min_samples=10, hedge_percentile=90, hedge_default_delay=1.0)
+    assert call.hedge_delay() == 1.0
+    for ms in range(1, 11):
+        call.tracker.record(ms / 1000)
+    assert call.hedge_delay() == pytest.approx(0.009)
+
+
+def test_stream_yields_items_and_records_success():
+    call = guard()
+    assert list(call.stream(lambda: iter(["a", "b"]))) == ["a", "b"]
+    assert call.breaker.failures == 0
+
+
+def test_stream_cuts_off_source_stalled_before_first_item():
+    release = threading.Event()
+
+    def stalled():
+        release.wait(2)
+        yield "late"
+
+    call = guard(timeout=0.05)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        list(call.stream(stalled))
+    assert time.monotonic() - start < 0.5
+    assert call.breaker.failures == 1
+    release.set()
+
+
+def test_stream_cuts_off_source_stalled_between_items():
+    release = threading.Event()
+
+    def stalls_after_first():
+        yield "first"
+        release.wait(2)
+        yield "late"
+
+    call = guard(timeout=0.1)
+    received = []
+    with pytest.raises(DeadlineExceededError):
+        for item in call.stream(stalls_after_first):
+            received.append(item)
+    assert received == ["first"]
+    release.set()
+
+
+def test_stream_source_error_counts_as_failure():
+    def broken():
+        yield "a"
+        raise RuntimeError("backend down")
+
+    call = guard()
+    with pytest.raises(RuntimeError):
+        list(call.stream(broken))
+    assert call.breaker.failures == 1
+
+
+def test_stream_closed_early_counts_as_success():
+    call = guard()
+    call.breaker.record_failure()
+    tokens = call.stream(lambda: iter(["a", "b", "c"]))
+    assert next(tokens) == "a"
+    tokens.close()
+    assert call.breaker.failures == 0
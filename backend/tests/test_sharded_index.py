@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from query_parser import match_categories, parse_category_constraints
+from vector_index import (IndexedDocument, NumpyVectorIndex,
+                          ShardedVectorIndex, normalize_rows)
+
+CATEGORIES = ["Men’s Jeans", "Women’s Dresses", "Men’s Jackets & Hoodies"]
+
+
+@pytest.fixture
+def corpus():
+    """30 documents per category, clustered around one direction per category"""
+    rng = np.random.default_rng(5)
+    centers = normalize_rows(rng.standard_normal((len(CATEGORIES), 24)).astype(np.float32))
+    rows, docs = [], []
+    for c, category in enumerate(CATEGORIES):
+        for i in range(30):
+            rows.append(centers[c] + 0.2 * rng.standard_normal(24))
+            docs.append(IndexedDocument(f"{category} {i}", {"category": category, "product_code": f"PID{c}{i:02d}"}))
+    return np.asarray(rows, dtype=np.float32), docs, centers
+
+
+def build(corpus, index_dir, **options):
+    matrix, docs, _ = corpus
+    ShardedVectorIndex.build_from_vectors(matrix, docs, index_dir)
+    return ShardedVectorIndex.load(index_dir, **options)
+
+
+def categories_of(index, shard_names):
+    return [index.categories[name] for name in shard_names]
+
+
+def test_query_parser_reads_garments_and_genders():
+    assert parse_category_constraints("black tees for men") == ({"t-shirt"}, {"men"})
+    assert match_categories("women's party dress", CATEGORIES) == ["Women’s Dresses"]
+    assert match_categories("something warm", CATEGORIES) == []
+
+
+def test_routes_by_named_category_then_centroid_then_everything(corpus, tmp_path):
+    _, _, centers = corpus
+    index = build(corpus, tmp_path, min_similarity=0.5, margin=0.05)
+    assert categories_of(index, index.route("slim jeans for men", centers[1])) == ["Men’s Jeans"]
+    assert categories_of(index, index.route("something warm", centers[2])) == ["Men’s Jackets & Hoodies"]
+    # Orthogonal to every centroid: no shard is a good guess
+    basis, _ = np.linalg.qr(index.centroids.T)
+    unrelated = np.ones(24, dtype=np.float32) - basis @ (basis.T @ np.ones(24, dtype=np.float32))
+    assert len(index.route("something warm", unrelated)) == len(CATEGORIES)
+
+
+def test_search_across_all_shards_matches_one_flat_index(corpus, tmp_path):
+    matrix, docs, _ = corpus
+    index = build(corpus, tmp_path / "sharded")
+    flat = NumpyVectorIndex.build_from_vectors(matrix, docs, tmp_path / "flat")
+    query = matrix[17] + matrix[45]
+    sharded_hits = [index.document(name, i).page_content for name, i, _ in index.search(query, 5)]
+    flat_hits = [docs[i].page_content for i, _ in flat.search(query, 5)]
+    assert sharded_hits == flat_hits
+
+
+def test_least_recently_used_shards_are_closed(corpus, tmp_path):
+    index = build(corpus, tmp_path, cache_bytes=1)
+    for name in index.shard_names:
+        index.shard(name)
+    assert list(index.loaded) == [index.shard_names[-1]]
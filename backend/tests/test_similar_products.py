@@ -0,0 +1,88 @@
+import zlib
+
+import chat
+import numpy as np
+import pytest
+import similar_products
+from product_store import ProductStore
+from vector_index import IndexedDocument, NumpyVectorIndex
+
+
+class WordHashEmbeddings:
+    """Bag-of-words vectors: products sharing words end up close"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i, zlib.crc32(word.encode()) % 64] += 1
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def records(descriptions):
+    return [{"id": i + 1, "product_code": f"PID{i + 1:03d}", "name": "Brand", "description": description,
+             "price": 100} for i, description in enumerate(descriptions)]
+
+
+DESCRIPTIONS = ["red cotton shirt", "red cotton tee shirt", "blue denim jeans", "blue slim denim jeans",
+                "wool winter coat", "warm wool winter jacket"]
+
+
+@pytest.fixture
+def embeddings(config, tmp_path, monkeypatch):
+    config(VECTOR_INDEX_DIR=str(tmp_path / "index"), SIMILAR_PRODUCTS_K=3)
+    monkeypatch.setattr(similar_products, "similar_key", None)
+    fake = WordHashEmbeddings()
+    monkeypatch.setattr(chat, "get_embeddings", lambda: fake)
+    return fake
+
+
+def test_nearest_neighbors_excludes_self_and_orders_by_similarity():
+    matrix = np.asarray([[1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9]], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    neighbors = similar_products.nearest_neighbors(matrix, 2, batch_size=3)
+    assert neighbors[:, 0].tolist() == [1, 0, 3, 2]
+    assert all(row not in neighbors[row] for row in range(4))
+
+
+def test_similar_products_work_without_a_per_product_index(embeddings):
+    store = ProductStore(records(DESCRIPTIONS))
+    assert similar_products.similar_rows(store, 0, 1) == [1]
+    assert similar_products.similar_rows(store, 2, 1) == [3]
+    assert embeddings.embedded == len(DESCRIPTIONS)
+
+
+def test_text_sourced_index_gets_product_vectors_alongside(embeddings, config):
+    index_dir = config()["VECTOR_INDEX_DIR"]
+    NumpyVectorIndex.build([IndexedDocument("chunk one"), IndexedDocument("chunk two")], embeddings, index_dir,
+                           extra_manifest={"source": "text"})
+    store = ProductStore(records(DESCRIPTIONS))
+    assert similar_products.similar_rows(store, 4, 1) == [5]
+    assert similar_products.product_vectors_dir().name == similar_products.PRODUCT_VECTORS_DIR
+
+
+def test_catalog_change_embeds_only_changed_products(embeddings):
+    similar_products.similar_rows(ProductStore(records(DESCRIPTIONS)), 0, 1)
+    embedded = embeddings.embedded
+
+    changed = DESCRIPTIONS[:-1] + ["red cotton polo shirt"]
+    store = ProductStore(records(changed))
+    assert 5 in similar_products.similar_rows(store, 0, 2)
+    assert embeddings.embedded == embedded + 1
+
+
+def test_similar_endpoint_on_default_install(embeddings):
+    from app import app
+    from fastapi.testclient import TestClient
+
+    response = TestClient(app).get("/api/products/PID001/similar?limit=3")
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert all(product["product_code"] != "PID001" for product in response.json())
@@ -0,0 +1,57 @@
+import pytest
+from product_store import ProductStore
+from text_index import TOP_K
+
+
+def record(i, name, description):
+    return {"id": i, "product_code": f"PID{i:03d}", "name": name, "description": description, "price": 100}
+
+
+@pytest.fixture(scope="module")
+def store():
+    records = []
+    # Many popular "tee" entries that fill every "te" trie node's top list...
+    for n in range(TOP_K + 8):
+        for _ in range(3):
+            records.append(record(len(records) + 1, "Zara", f"Basic tee {n}"))
+    # ...and rarer entries that only a multi-word query can reach
+    records.append(record(len(records) + 1, "Nike", "Alpha tee special"))
+    records.append(record(len(records) + 1, "Nike", "Alpha teal jacket"))
+    records.append(record(len(records) + 1, "Puma", "Alpha hoodie"))
+    return ProductStore(records)
+
+
+def texts(store, entries):
+    return [store.text_index.texts[entry] for entry in entries]
+
+
+def test_multi_word_completion_reaches_entries_beyond_top_k(store):
+    assert texts(store, store.text_index.complete("alpha te")) == ["Alpha teal jacket", "Alpha tee special"]
+
+
+def test_multi_word_completion_tolerates_typos_in_completed_words(store):
+    assert "Alpha tee special" in texts(store, store.text_index.complete("alpah tee"))
+
+
+def test_completion_ranks_exact_prefix_before_typos(store):
+    results = texts(store, store.text_index.complete("alpha hoo"))
+    assert results[0] == "Alpha hoodie"
+
+
+def test_completion_after_a_space_lists_entries_with_every_word(store):
+    assert set(texts(store, store.text_index.complete("alpha ", limit=10))) == {
+        "Alpha tee special", "Alpha teal jacket", "Alpha hoodie"}
+
+
+def test_single_word_prefix_prefers_popular_entries(store):
+    results = texts(store, store.text_index.complete("zar"))
+    assert results == ["Zara"]
+
+
+def test_no_completion_for_unknown_word(store):
+    assert store.text_index.complete("qqqq te") == []
+
+
+def test_match_tolerates_transposed_letters(store):
+    entry = store.text_index.match("nkie")
+    assert store.text_index.texts[entry] == "Nike"
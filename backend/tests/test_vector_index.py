@@ -0,0 +1,137 @@
+import importlib.util
+import zlib
+
+import numpy as np
+import pytest
+from vector_index import (HnswVectorIndex, IndexedDocument, NumpyVectorIndex,
+                          normalize_rows, update_vector_index)
+
+needs_hnswlib = pytest.mark.skipif(importlib.util.find_spec("hnswlib") is None, reason="hnswlib not installed")
+
+
+class CountingEmbeddings:
+    """Deterministic vectors per text, counting how many texts were embedded"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [np.random.default_rng(zlib.crc32(text.encode())).standard_normal(16).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def random_matrix(count, dim=32, seed=3):
+    return normalize_rows(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+def documents(count):
+    return [IndexedDocument(f"product {i}", {"product_code": f"PID{i:05d}"}) for i in range(count)]
+
+
+def test_numpy_index_matches_exact_cosine_search(tmp_path):
+    matrix = random_matrix(300)
+    index = NumpyVectorIndex.build_from_vectors(matrix * 3, documents(300), tmp_path)
+    query = random_matrix(1, seed=8)[0]
+    expected = np.argsort(-(matrix @ query))[:5]
+    assert [i for i, _ in index.search(query, 5)] == list(expected)
+    assert isinstance(NumpyVectorIndex.load(tmp_path).matrix, np.memmap)
+
+
+def test_float16_index_keeps_the_ranking(tmp_path):
+    matrix = random_matrix(300)
+    exact = NumpyVectorIndex.build_from_vectors(matrix, documents(300), tmp_path / "f32")
+    half = NumpyVectorIndex.build_from_vectors(matrix, documents(300), tmp_path / "f16", dtype="float16")
+    query = random_matrix(1, seed=8)[0]
+    assert [i for i, _ in half.search(query, 3)] == [i for i, _ in exact.search(query, 3)]
+
+
+def test_mmr_skips_near_duplicates(tmp_path):
+    base = random_matrix(2, seed=11)
+    matrix = np.vstack([base[0], base[0] + 1e-3, base[1]])
+    index = NumpyVectorIndex.build_from_vectors(matrix, documents(3), tmp_path)
+    query = base[0] + 0.3 * base[1]
+    assert {i for i, _ in index.search(query, 2)} == {0, 1}
+    picked = {i for i, _ in index.search_mmr(query, k=2, fetch_k=3, lambda_mult=0.3)}
+    assert 2 in picked and len(picked & {0, 1}) == 1
+
+
+@needs_hnswlib
+def test_hnsw_recall_against_brute_force(tmp_path):
+    matrix = random_matrix(2000)
+    docs = documents(len(matrix))
+    exact = NumpyVectorIndex.build_from_vectors(matrix, docs, tmp_path / "numpy")
+    approx = HnswVectorIndex.build_from_vectors(matrix, docs, tmp_path / "hnsw", ef=100)
+    queries = random_matrix(50, seed=4)
+    found = sum(len({i for i, _ in exact.search(q, 10)} & {i for i, _ in approx.search(q, 10)}) for q in queries)
+    assert found / (10 * len(queries)) > 0.9
+
+
+@needs_hnswlib
+def test_hnsw_round_trips_through_disk(tmp_path):
+    matrix = random_matrix(100)
+    HnswVectorIndex.build_from_vectors(matrix, documents(100), tmp_path)
+    index = HnswVectorIndex.load(tmp_path)
+    assert len(index) == 100
+    assert index.search(matrix[42], 1)[0][0] == 42
+    assert index.documents[42].metadata["product_code"] == "PID00042"
+
+
+@needs_hnswlib
+def test_hnsw_search_caps_k_at_index_size(tmp_path):
+    index = HnswVectorIndex.build_from_vectors(random_matrix(5), documents(5), tmp_path, ef=2)
+    assert len(index.search(random_matrix(1, seed=9)[0], 10)) == 5
+
+
+def catalog(texts):
+    return [IndexedDocument(text, {"product_code": code}) for code, text in texts.items()]
+
+
+def nearest_code(index, embeddings, text):
+    i, _ = index.search(embeddings.embed_query(text), 1)[0]
+    return index.documents[i].metadata["product_code"]
+
+
+@pytest.mark.parametrize("index_class", [NumpyVectorIndex, pytest.param(HnswVectorIndex, marks=needs_hnswlib)])
+def test_update_embeds_only_changed_products(tmp_path, index_class):
+    embeddings = CountingEmbeddings()
+    texts = {f"PID{i:03d}": f"product number {i}" for i in range(20)}
+    index_class.build(catalog(texts), embeddings, tmp_path)
+
+    texts["PID003"] = "product number 3, now in red"
+    texts["PID100"] = "a brand new product"
+    del texts["PID007"]
+    embedded = embeddings.embedded
+    summary = update_vector_index(tmp_path, catalog(texts), embeddings)
+    assert (summary["added"], summary["changed"], summary["removed"]) == (["PID100"], ["PID003"], ["PID007"])
+    assert summary["version"] == 2
+    assert embeddings.embedded == embedded + 2
+
+    index = index_class.load(tmp_path)
+    assert len(index) == 20
+    assert nearest_code(index, embeddings, "product number 3, now in red") == "PID003"
+    assert nearest_code(index, embeddings, "a brand new product") == "PID100"
+    assert "PID007" not in {index.documents[i].metadata["product_code"]
+                            for i, _ in index.search(embeddings.embed_query("product number 7"), 20)}
+
+
+def test_update_dry_run_and_unchanged_catalog_write_nothing(tmp_path):
+    embeddings = CountingEmbeddings()
+    texts = {f"PID{i:03d}": f"product number {i}" for i in range(5)}
+    NumpyVectorIndex.build(catalog(texts), embeddings, tmp_path)
+    embedded = embeddings.embedded
+
+    assert update_vector_index(tmp_path, catalog(texts), embeddings)["version"] == 1
+    texts["PID001"] = "changed"
+    assert update_vector_index(tmp_path, catalog(texts), embeddings, dry_run=True)["changed"] == ["PID001"]
+    assert update_vector_index(tmp_path, catalog(texts), embeddings)["version"] == 2
+    assert embeddings.embedded == embedded + 1
+
+
+def test_update_needs_one_document_per_product(tmp_path):
+    embeddings = CountingEmbeddings()
+    NumpyVectorIndex.build([IndexedDocument("chunk one"), IndexedDocument("chunk two")], embeddings, tmp_path)
+    with pytest.raises(ValueError):
+        update_vector_index(tmp_path, [IndexedDocument("chunk one")], embeddings)
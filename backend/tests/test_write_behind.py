@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+from auth import AuthSystem
+from write_behind import WriteBehindBuffer
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "users.json"
+    AuthSystem.write_db(path, {"ann": {"last_login": "old"}, "bob": {"last_login": "old"}})
+    return path
+
+
+def buffer(db, save=AuthSystem.write_db, interval=60):
+    return WriteBehindBuffer("test", db, load=AuthSystem.load_db, save=save, lock=threading.RLock(),
+                             interval=interval)
+
+
+def test_updates_coalesce_until_flush(db):
+    users = buffer(db)
+    users.set("ann", last_login="1")
+    users.set("ann", last_login="2")
+    assert AuthSystem.load_db(db)["ann"]["last_login"] == "old"
+    assert users.overlay("ann", {"last_login": "old"}) == {"last_login": "2"}
+    assert users.flush() == 1
+    assert AuthSystem.load_db(db)["ann"]["last_login"] == "2"
+    users.close()
+
+
+def test_updates_to_deleted_records_are_dropped(db):
+    users = buffer(db)
+    users.set("carl", last_login="1")
+    assert users.flush() == 0
+    assert "carl" not in AuthSystem.load_db(db)
+    users.close()
+
+
+def test_failed_flush_requeues_without_overriding_newer_updates(db):
+    def failing_save(filename, data):
+        raise OSError("disk full")
+
+    users = buffer(db, save=failing_save)
+    users.set("ann", last_login="1")
+    users.set("bob", last_login="1")
+    with pytest.raises(OSError):
+        users.flush()
+    users.set("bob", last_login="2")
+    users.save = AuthSystem.write_db
+    assert users.flush() == 2
+    records = AuthSystem.load_db(db)
+    assert (records["ann"]["last_login"], records["bob"]["last_login"]) == ("1", "2")
+    users.close()
+
+
+def test_write_through_when_disabled(db):
+    users = buffer(db, interval=0)
+    users.set("ann", last_login="now")
+    assert AuthSystem.load_db(db)["ann"]["last_login"] == "now"
+    assert users.thread is None
+
+
+def test_write_db_raises_where_save_db_logs(tmp_path):
+    missing = tmp_path / "missing" / "users.json"
+    AuthSystem.save_db(missing, {})
+    with pytest.raises(OSError):
+        AuthSystem.write_db(missing, {})
+
+
+def test_save_preferences_does_not_block_the_event_loop(config, monkeypatch):
+    import app as app_module
+    from fastapi.testclient import TestClient
+
+    on_loop = []
+    save = AuthSystem.save_preferences
+
+    def recording_save(*args):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return save(*args)
+
+    monkeypatch.setattr(AuthSystem, "save_preferences", recording_save)
+    app_module.app.dependency_overrides[app_module.verify_token] = lambda: "ghost"
+    try:
+        response = TestClient(app_module.app).post("/api/preferences",
+                                                   json={"size": "M", "colors": [], "categories": []})
+    finally:
+        app_module.app.dependency_overrides.clear()
+    assert response.status_code == 404
+    assert on_loop == [False]
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import chat
+import ws_chat
+from admission import AdmissionController
+from chat import ChatSystem
+from resilience import CircuitBreaker, ResilientCall
+
+
+class StalledBackend:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def stream(self, prompt):
+        time.sleep(self.delay)
+        yield "too late"
+
+
+def test_stream_response_falls_back_when_backend_stalls(config, monkeypatch):
+    config(INTENT_ROUTER_ENABLED=False)
+    guard = ResilientCall("llm", timeout=0.05, breaker=CircuitBreaker("llm"), max_workers=2)
+    monkeypatch.setattr(chat, "llm_guard", guard)
+    monkeypatch.setattr(ChatSystem, "prepare_prompt",
+                        staticmethod(lambda prompt, preferences: (StalledBackend(1.0), prompt, [])))
+
+    start = time.monotonic()
+    events = list(ChatSystem.stream_response("jackets", None))
+    assert time.monotonic() - start < 0.5
+    assert [kind for kind, _ in events] == ["done"]
+    assert events[0][1]["answer"].startswith("I'm having trouble")
+    assert guard.breaker.failures == 1
+
+
+def test_cancelled_turn_holds_admission_slot_until_worker_returns(monkeypatch):
+    worker_busy = threading.Event()
+    release = threading.Event()
+
+    def stream_response(prompt, preferences):
+        worker_busy.set()
+        release.wait(2)
+        yield "done", {"answer": "", "product_ids": [], "response_time": 0.0}
+
+    monkeypatch.setattr(ChatSystem, "stream_response", staticmethod(stream_response))
+
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=0.1, user_rate=1,
+                                         user_burst=10, global_rate=1, global_burst=10)
+        connection = ws_chat.ChatConnection(None, "alice", "chat", admission)
+        turn = asyncio.create_task(connection.answer("hello"))
+        while not worker_busy.is_set():
+            await asyncio.sleep(0.01)
+
+        turn.cancel()
+        await asyncio.sleep(0.05)
+        assert admission.in_flight == 1
+
+        release.set()
+        await asyncio.gather(turn, return_exceptions=True)
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,265 @@
+# text_index.py
+
+import heapq
+import re
+from collections import defaultdict
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+TOP_K = 32  # Best entries kept per trie node
+MIN_SIMILARITY = 0.4  # Trigram Jaccard similarity for a word to count as a fuzzy match
+
+
+def words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+def trigrams(word):
+    """Character trigrams of a word padded with "$", e.g. "tee" -> {"$te", "tee", "ee$"}"""
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token):
+    """Typos tolerated in a token: none for very short ones, up to two for long ones"""
+    return 0 if len(token) <= 2 else 1 if len(token) <= 5 else 2
+
+
+class TrieNode:
+    __slots__ = ("children", "word_id", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.word_id = None
+        self.top = ()
+
+
+class PrefixTrie:
+    """Trie over the vocabulary; each node keeps the TOP_K best entries that
+    contain a word with its prefix, so a completion never walks the subtree"""
+
+    def __init__(self, vocabulary, word_entries):
+        self.root = TrieNode()
+        for word_id, word in enumerate(vocabulary):
+            node = self.root
+            for char in word:
+                node = node.children.setdefault(char, TrieNode())
+            node.word_id = word_id
+        self._collect_top(self.root, word_entries)
+
+    def _collect_top(self, node, word_entries):
+        # Entry ids are ranks (0 = most products), so the best entries are the smallest ids
+        lists = [self._collect_top(child, word_entries) for child in node.children.values()]
+        if node.word_id is not None:
+            lists.append(word_entries(node.word_id)[:TOP_K].tolist())
+        top = []
+        for entry in heapq.merge(*lists):
+            if not top or top[-1] != entry:
+                top.append(entry)
+                if len(top) == TOP_K:
+                    break
+        node.top = tuple(top)
+        return node.top
+
+    def search(self, token, edits):
+        """(distance, node) for every node whose prefix is within `edits` edits of
+        `token`, counting a transposition as one edit. The first character must
+        match: first-letter typos are rare, and this prunes most of the trie."""
+        results = []
+        first_row = list(range(len(token) + 1))
+
+        def visit(node, char, previous_char, previous_row, before_previous_row):
+            row = [previous_row[0] + 1]
+            for i in range(1, len(token) + 1):
+                cost = token[i - 1] != char
+                distance = min(row[i - 1] + 1, previous_row[i] + 1, previous_row[i - 1] + cost)
+                if i > 1 and before_previous_row is not None and token[i - 1] == previous_char \
+                        and token[i - 2] == char:
+                    distance = min(distance, before_previous_row[i - 2] + 1)
+                row.append(distance)
+            if row[-1] <= edits:
+                results.append((row[-1], node))
+            if min(row) <= edits:
+                for next_char, child in node.children.items():
+                    visit(child, next_char, char, row, previous_row)
+
+        first = self.root.children.get(token[:1])
+        if first is not None:
+            visit(first, token[0], None, first_row, None)
+        return results
+
+
+class TextIndex:
+    """Typo-tolerant index over product brands and descriptions.
+
+    Every distinct brand or description is one entry, ranked by how many
+    products share it. Words map to the entries containing them, a
+    character-trigram index over the vocabulary finds misspelled words, and
+    a prefix trie completes the word being typed.
+    """
+
+    def __init__(self, store):
+        counts = defaultdict(int)
+        first_rows = {}
+        brands = store.categorical["name"]
+        codes, brand_rows, brand_counts = np.unique(brands.codes, return_index=True, return_counts=True)
+        for code, row, count in zip(codes.tolist(), brand_rows.tolist(), brand_counts.tolist()):
+            key = ("brand", brands.categories[code])
+            counts[key] += count
+            first_rows.setdefault(key, row)
+        descriptions = store.text["description"]
+        for row, description in enumerate(descriptions.blob.decode().split("\0")[:len(descriptions)]):
+            key = ("description", description)
+            counts[key] += 1
+            first_rows.setdefault(key, row)
+
+        # Rank entries by product count, then alphabetically
+        entries = sorted((key, count, first_rows[key]) for key, count in counts.items() if key[1])
+        entries.sort(key=lambda entry: -entry[1])
+        self.fields = [key[0] for key, _, _ in entries]
+        self.texts = [key[1] for key, _, _ in entries]
+        self.counts = np.asarray([count for _, count, _ in entries], dtype=np.int64)
+        self.rows = np.asarray([row for _, _, row in entries], dtype=np.int64)
+
+        # Entry -> word ids (CSR), then word -> entry ids sorted by rank
+        word_ids = {}
+        entry_words = []
+        entry_ends = []
+        for text in self.texts:
+            for word in dict.fromkeys(words(text)):
+                entry_words.append(word_ids.setdefault(word, len(word_ids)))
+            entry_ends.append(len(entry_words))
+        self.vocabulary = list(word_ids)
+        self.word_ids = word_ids
+        self.entry_words = np.asarray(entry_words, dtype=np.int32)
+        self.entry_offsets = np.zeros(len(self.texts) + 1, dtype=np.int64)
+        self.entry_offsets[1:] = entry_ends
+        entry_of = np.repeat(np.arange(len(self.texts), dtype=np.int32), np.diff(self.entry_offsets))
+        order = np.argsort(self.entry_words, kind="stable")
+        self.word_postings = entry_of[order]
+        self.word_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        self.word_offsets[1:] = np.cumsum(np.bincount(self.entry_words, minlength=len(self.vocabulary)))
+
+        grams = defaultdict(list)
+        for word_id, word in enumerate(self.vocabulary):
+            for gram in trigrams(word):
+                grams[gram].append(word_id)
+        self.trigram_words = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in grams.items()}
+        self.trigram_counts = np.asarray([len(trigrams(word)) for word in self.vocabulary], dtype=np.int64)
+
+        self.trie = PrefixTrie(self.vocabulary, self.word_entries)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def word_entries(self, word_id):
+        return self.word_postings[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]
+
+    def entry_word_ids(self, entry):
+        return self.entry_words[self.entry_offsets[entry]:self.entry_offsets[entry + 1]]
+
+    def similar_words(self, token):
+        """Vocabulary word id -> similarity in (0, 1] for words that could be `token` mistyped"""
+        matches = {}
+        token_grams = [gram for gram in trigrams(token) if gram in self.trigram_words]
+        if token_grams:
+            candidates = np.concatenate([self.trigram_words[gram] for gram in token_grams])
+            word_ids, shared = np.unique(candidates, return_counts=True)
+            union = len(trigrams(token)) + self.trigram_counts[word_ids] - shared
+            similarity = shared / union
+            keep = similarity >= MIN_SIMILARITY
+            matches = dict(zip(word_ids[keep].tolist(), similarity[keep].tolist()))
+        # Trigrams miss transpositions in short words ("nkie"); edit distance catches them
+        for distance, node in self.trie.search(token, max_edits(token)):
+            if node.word_id is not None:
+                word = self.vocabulary[node.word_id]
+                similarity = 1 - distance / max(len(token), len(word))
+                matches[node.word_id] = max(matches.get(node.word_id, 0), similarity)
+        return matches
+
+    def match(self, query):
+        """Entry that best matches `query` word by word, tolerating typos; None when
+        no word matches. Ties go to the entry shared by the most products."""
+        scores = []
+        for token in words(query):
+            matches = self.similar_words(token)
+            if not matches:
+                continue
+            word_ids = list(matches)
+            postings = [self.word_entries(word_id) for word_id in word_ids]
+            entries = np.concatenate(postings)
+            similarity = np.repeat([matches[word_id] for word_id in word_ids], [len(p) for p in postings])
+            # Best similarity per entry for this token
+            order = np.lexsort((-similarity, entries))
+            entries, similarity = entries[order], similarity[order]
+            first = np.ones(len(entries), dtype=bool)
+            first[1:] = entries[1:] != entries[:-1]
+            scores.append((entries[first], similarity[first]))
+        if not scores:
+            return None
+
+        entries, inverse = np.unique(np.concatenate([e for e, _ in scores]), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate([s for _, s in scores]))
+        return int(entries[np.argmax(totals)])
+
+    def complete(self, query, limit=8):
+        """Entries completing `query` as typed: earlier words must match (allowing
+        typos) and the last, possibly partial, word must prefix one of the entry's
+        words. Ranked by typos, then by number of products."""
+        tokens = words(query)
+        if not tokens:
+            return []
+        typing = not query[-1:].isspace()
+        prefix = tokens.pop() if typing else None
+
+        if not tokens:
+            # A single partial word: the trie nodes already hold the best entries
+            candidates = {}
+            for distance, node in self.trie.search(prefix, max_edits(prefix)):
+                for entry in node.top:
+                    if distance < candidates.get(entry, distance + 1):
+                        candidates[entry] = distance
+            return [entry for _, entry in sorted((d, e) for e, d in candidates.items())[:limit]]
+
+        # Entries containing every completed word, in rank order, before the
+        # prefix narrows them: a node's top entries needn't contain those words
+        entries = None
+        for token in tokens:
+            word_id = self.word_ids.get(token)
+            matches = [word_id] if word_id is not None else list(self.similar_words(token))
+            if not matches:
+                return []
+            postings = np.unique(np.concatenate([self.word_entries(match) for match in matches]))
+            entries = postings if entries is None else np.intersect1d(entries, postings, assume_unique=True)
+        if prefix is None:
+            return entries[:limit].tolist()
+
+        prefix_nodes = {}
+        for distance, node in self.trie.search(prefix, max_edits(prefix)):
+            prefix_nodes[node] = min(distance, prefix_nodes.get(node, distance))
+        results = []
+        exact = 0
+        for entry in entries.tolist():
+            distance = self.prefix_distance(entry, prefix_nodes)
+            if distance is None:
+                continue
+            results.append((distance, entry))
+            exact += distance == 0
+            if exact == limit:
+                # Later entries rank lower and can't beat these
+                break
+        return [entry for _, entry in sorted(results)[:limit]]
+
+    def prefix_distance(self, entry, prefix_nodes):
+        """Fewest typos with which the typed prefix (matched as `prefix_nodes`)
+        begins one of the entry's words; None when it begins none"""
+        best = None
+        for word_id in self.entry_word_ids(entry).tolist():
+            node = self.trie.root
+            for char in self.vocabulary[word_id]:
+                node = node.children[char]
+                distance = prefix_nodes.get(node)
+                if distance is not None and (best is None or distance < best):
+                    best = distance
+        return best
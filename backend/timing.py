@@ -0,0 +1,38 @@
+# timing.py
+#
+# Per-request timing state shared by MetricsMiddleware (Server-Timing spans)
+# and ProfilingMiddleware (which threads to sample), so neither middleware
+# imports the other.
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# Spans recorded during the current request, used for the Server-Timing header
+request_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+# Profiler of the request being handled, if it is profiled; copied into worker threads with the context
+active_profiler: ContextVar[Optional[Any]] = ContextVar("active_profiler", default=None)
+
+
+def record_span(name, duration):
+    """Add a span to the current request's Server-Timing header, if there is a request"""
+    spans = request_spans.get()
+    if spans is not None:
+        spans.append((name, duration))
+
+
+@contextmanager
+def profiled_thread():
+    """Include the current thread in the active request profile while the block runs"""
+    profiler = active_profiler.get()
+    ident = threading.get_ident()
+    if profiler is None or ident in profiler.threads:
+        yield
+        return
+    profiler.threads.add(ident)
+    try:
+        yield
+    finally:
+        profiler.threads.discard(ident)
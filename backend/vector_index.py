@@ -0,0 +1,731 @@
+# vector_index.py
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from config import CONFIG, logger
+from metrics import Counter, Gauge, record_cache
+from query_parser import match_categories
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.json"
+MANIFEST_FILE = "manifest.json"
+HNSW_FILE = "hnsw.bin"
+CENTROIDS_FILE = "centroids.npy"
+SHARDS_DIR = "shards"
+UNCATEGORIZED = "Uncategorized"
+
+SHARD_ROUTES = Counter("walmate_vector_shard_routes_total", "Vector queries by how their shards were chosen")
+SHARDS_LOADED_BYTES = Gauge("walmate_vector_shards_loaded_bytes", "On-disk size of the vector shards held open")
+
+
+class IndexedDocument:
+    """Minimal stand-in for a langchain Document: page_content plus metadata"""
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Optional[Dict[str, Any]] = None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def embed_documents(documents, embeddings, batch_size=256):
+    """Embed documents in batches into a normalized float32 matrix"""
+    texts = [doc.page_content for doc in documents]
+    vectors = [
+        np.asarray(embeddings.embed_documents(texts[i:i + batch_size]), dtype=np.float32)
+        for i in range(0, len(texts), batch_size)
+    ]
+    return normalize_rows(np.vstack(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+def normalize_query(query_vector):
+    query = np.asarray(query_vector, dtype=np.float32)
+    return query / max(float(np.linalg.norm(query)), 1e-12)
+
+
+def mmr_select(candidates, candidate_scores, candidate_vectors, k, lambda_mult):
+    """Maximal marginal relevance: [(candidate, score)] trading relevance for diversity"""
+    if len(candidates) == 0:
+        return []
+    selected = [0]
+    while len(selected) < min(k, len(candidates)):
+        similarity_to_selected = candidate_vectors @ candidate_vectors[selected].T
+        mmr = lambda_mult * candidate_scores - (1 - lambda_mult) * similarity_to_selected.max(axis=1)
+        mmr[selected] = -np.inf
+        selected.append(int(np.argmax(mmr)))
+    return [(int(candidates[i]), float(candidate_scores[i])) for i in selected]
+
+
+def document_key(doc):
+    return doc.metadata.get("product_code") or None
+
+
+def content_hash(doc):
+    """Hash of what gets embedded and returned; the source path is left out"""
+    metadata = {k: v for k, v in doc.metadata.items() if k != "source"}
+    payload = json.dumps([doc.page_content, metadata], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def content_hashes(documents):
+    """product_code -> content hash, or None unless there is exactly one document per product"""
+    hashes = {}
+    for doc in documents:
+        key = document_key(doc)
+        if not key or key in hashes:
+            return None
+        hashes[key] = content_hash(doc)
+    return hashes
+
+
+def diff_catalog(old_hashes, new_hashes):
+    """(added, changed, removed) product codes between two catalog versions"""
+    added = [key for key in new_hashes if key not in old_hashes]
+    changed = [key for key in new_hashes if key in old_hashes and old_hashes[key] != new_hashes[key]]
+    removed = [key for key in old_hashes if key not in new_hashes]
+    return added, changed, removed
+
+
+# Index files are replaced, never rewritten in place: workers may have the
+# old file memory-mapped, and truncating it under them would crash them
+def atomic_write_json(path, data, **kwargs):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def atomic_save_npy(path, array):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def write_index_metadata(index_dir, documents, manifest):
+    atomic_write_json(
+        Path(index_dir) / DOCUMENTS_FILE,
+        [{"page_content": d.page_content, "metadata": d.metadata} if d is not None else None for d in documents]
+    )
+    atomic_write_json(Path(index_dir) / MANIFEST_FILE, manifest, indent=2)
+
+
+def read_index_metadata(index_dir):
+    index_dir = Path(index_dir)
+    with open(index_dir / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    if manifest.get("embedding_model") != CONFIG["EMBEDDING_MODEL_NAME"]:
+        logger.warning(
+            f"Index in {index_dir} was built with {manifest.get('embedding_model')}, "
+            f"but {CONFIG['EMBEDDING_MODEL_NAME']} is configured"
+        )
+    with open(index_dir / DOCUMENTS_FILE) as f:
+        # None marks a deleted HNSW label
+        documents = [IndexedDocument(d["page_content"], d.get("metadata")) if d is not None else None
+                     for d in json.load(f)]
+    return documents, manifest
+
+
+def base_manifest(index_format, matrix, documents, start):
+    manifest = {
+        "format": index_format,
+        "version": 1,
+        "embedding_model": CONFIG["EMBEDDING_MODEL_NAME"],
+        "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(documents),
+        "built_at": datetime.now().isoformat(),
+        "build_seconds": round(time.time() - start, 3),
+    }
+    # Only per-product indexes can be updated incrementally (see update_vector_index)
+    hashes = content_hashes(documents)
+    if hashes is not None:
+        manifest["content_hashes"] = hashes
+    return manifest
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first, without a full sort"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class NumpyVectorIndex:
+    """Brute-force cosine index over normalized embeddings stored in a .npy file.
+
+    The embedding matrix is opened with np.load(mmap_mode='r'), so every
+    worker on a host maps the same page-cache pages instead of holding its
+    own copy, and loading takes milliseconds. A query is one matrix-vector
+    product followed by a partial sort.
+    """
+
+    def __init__(self, matrix, documents: List[IndexedDocument], manifest: Dict[str, Any], embeddings=None):
+        self.matrix = matrix
+        self.documents = documents
+        self.manifest = manifest
+        self.embeddings = embeddings  # embeds queries for the retriever
+
+    def __len__(self):
+        return len(self.documents)
+
+    @classmethod
+    def build(cls, documents, embeddings, index_dir, dtype="float32", extra_manifest=None):
+        """Embed documents and write embeddings.npy, documents.json and manifest.json"""
+        return cls.build_from_vectors(embed_documents(documents, embeddings), documents, index_dir,
+                                      embeddings, dtype, extra_manifest)
+
+    @classmethod
+    def build_from_vectors(cls, matrix, documents, index_dir, embeddings=None, dtype="float32", extra_manifest=None):
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        start = time.time()
+
+        matrix = normalize_rows(np.asarray(matrix, dtype=np.float32)).astype(dtype)
+        atomic_save_npy(index_dir / EMBEDDINGS_FILE, matrix)
+
+        manifest = base_manifest("numpy-brute-force", matrix, documents, start)
+        manifest["dtype"] = dtype
+        manifest.update(extra_manifest or {})
+        write_index_metadata(index_dir, documents, manifest)
+
+        logger.info(f"Built numpy index with {len(documents)} documents in {index_dir}")
+        return cls.load(index_dir, embeddings)
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None, mmap=True):
+        documents, manifest = read_index_metadata(index_dir)
+        matrix = np.load(Path(index_dir) / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None)
+        return cls(matrix, documents, manifest, embeddings)
+
+    @staticmethod
+    def exists(index_dir):
+        return (Path(index_dir) / EMBEDDINGS_FILE).exists() and (Path(index_dir) / MANIFEST_FILE).exists()
+
+    @classmethod
+    def apply_changes(cls, index_dir, manifest, documents, vectors, removed):
+        """Rewrite the index with `documents` upserted and `removed` deleted.
+
+        Unchanged rows are copied from the existing matrix, so only the
+        changed documents were embedded.
+        """
+        index = cls.load(index_dir)
+        replaced = set(removed) | {document_key(doc) for doc in documents}
+        keep = [i for i, doc in enumerate(index.documents) if document_key(doc) not in replaced]
+        parts = [np.asarray(index.matrix[keep], dtype=np.float32).reshape(len(keep), manifest["dimension"])]
+        if len(documents):
+            parts.append(normalize_rows(np.asarray(vectors, dtype=np.float32)))
+        matrix = np.vstack(parts).astype(manifest.get("dtype", "float32"))
+        kept_documents = [index.documents[i] for i in keep] + list(documents)
+        del index  # drop the old mapping before replacing the file
+
+        atomic_save_npy(Path(index_dir) / EMBEDDINGS_FILE, matrix)
+        atomic_write_json(Path(index_dir) / DOCUMENTS_FILE,
+                          [{"page_content": d.page_content, "metadata": d.metadata} for d in kept_documents])
+        manifest["count"] = len(kept_documents)
+
+    def centroid(self):
+        return normalize_rows(np.asarray(self.matrix, dtype=np.float32).mean(axis=0, keepdims=True))[0]
+
+    def scores(self, query_vector):
+        query = normalize_query(query_vector)
+        return np.asarray(self.matrix @ query.astype(self.matrix.dtype), dtype=np.float32)
+
+    def search(self, query_vector, k=4):
+        """Return [(document index, cosine score)] for the k nearest documents"""
+        scores = self.scores(query_vector)
+        return [(int(i), float(scores[i])) for i in top_k(scores, k)]
+
+    def search_mmr(self, query_vector, k=4, fetch_k=20, lambda_mult=0.5):
+        """Maximal marginal relevance over the fetch_k nearest documents"""
+        scores = self.scores(query_vector)
+        candidates = top_k(scores, fetch_k)
+        return mmr_select(candidates, scores[candidates], self.vectors(candidates), k, lambda_mult)
+
+    def vectors(self, ids):
+        return np.asarray(self.matrix[np.asarray(ids, dtype=np.int64)], dtype=np.float32)
+
+    def as_retriever(self, search_type="similarity", search_kwargs=None):
+        """Same signature as the langchain vector stores, so get_retriever works unchanged"""
+        if search_type not in ("similarity", "mmr"):
+            raise ValueError(f"Unsupported search type for the numpy index: {search_type}")
+        return IndexRetriever(self, search_type, search_kwargs or {})
+
+
+class HnswVectorIndex:
+    """Approximate nearest-neighbour index (hnswlib) for catalogs too large to scan.
+
+    Query cost grows roughly logarithmically with the catalog. M sets the
+    graph degree (memory and recall), ef_construction the build-time beam
+    and ef the query-time beam; raising ef trades latency for recall.
+    hnswlib is optional and only imported when this backend is used.
+    """
+
+    def __init__(self, index, documents: List[IndexedDocument], manifest: Dict[str, Any], embeddings=None):
+        self.index = index
+        self.documents = documents
+        self.manifest = manifest
+        self.embeddings = embeddings
+
+    def __len__(self):
+        # Deleted labels stay in self.documents as None
+        return self.manifest["count"]
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise RuntimeError("The hnsw vector index backend requires hnswlib (pip install hnswlib)") from e
+        return hnswlib
+
+    @classmethod
+    def build(cls, documents, embeddings, index_dir, m=16, ef_construction=200, ef=64, extra_manifest=None):
+        return cls.build_from_vectors(embed_documents(documents, embeddings), documents, index_dir,
+                                      embeddings, m, ef_construction, ef, extra_manifest)
+
+    @classmethod
+    def build_from_vectors(cls, matrix, documents, index_dir, embeddings=None, m=16, ef_construction=200, ef=64,
+                           extra_manifest=None, num_threads=-1):
+        hnswlib = cls._hnswlib()
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        start = time.time()
+
+        matrix = normalize_rows(np.asarray(matrix, dtype=np.float32))
+        index = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        index.init_index(max_elements=max(len(matrix), 1), ef_construction=ef_construction, M=m)
+        index.add_items(matrix, np.arange(len(matrix)), num_threads=num_threads)
+        cls._save_graph(index, index_dir)
+
+        manifest = base_manifest("hnsw", matrix, documents, start)
+        manifest.update({"m": m, "ef_construction": ef_construction, "ef": ef})
+        manifest.update(extra_manifest or {})
+        write_index_metadata(index_dir, documents, manifest)
+
+        logger.info(f"Built HNSW index with {len(documents)} documents in {index_dir}")
+        return cls.load(index_dir, embeddings)
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None, ef=None):
+        hnswlib = cls._hnswlib()
+        documents, manifest = read_index_metadata(index_dir)
+        index = hnswlib.Index(space="cosine", dim=manifest["dimension"])
+        index.load_index(str(Path(index_dir) / HNSW_FILE), max_elements=max(len(documents), 1))
+        index.set_ef(ef or manifest.get("ef", 64))
+        return cls(index, documents, manifest, embeddings)
+
+    @staticmethod
+    def _save_graph(index, index_dir):
+        tmp_path = f"{Path(index_dir) / HNSW_FILE}.tmp"
+        index.save_index(tmp_path)
+        os.replace(tmp_path, Path(index_dir) / HNSW_FILE)
+
+    @classmethod
+    def apply_changes(cls, index_dir, manifest, documents, vectors, removed):
+        """Upsert and delete in the existing graph.
+
+        Changed products keep their label and get their vector replaced,
+        removed ones are marked deleted (their slot stays as a tombstone),
+        and new ones are appended after resizing the graph.
+        """
+        index = cls.load(index_dir)
+        labels = {document_key(doc): label for label, doc in enumerate(index.documents) if doc is not None}
+        for key in removed:
+            if key in labels:
+                index.index.mark_deleted(labels[key])
+                index.documents[labels[key]] = None
+
+        upsert_labels = []
+        for doc in documents:
+            label = labels.get(document_key(doc))
+            if label is None:
+                label = len(index.documents)
+                index.documents.append(None)
+            index.documents[label] = doc
+            upsert_labels.append(label)
+        if len(index.documents) > index.index.get_max_elements():
+            index.index.resize_index(len(index.documents))
+        if upsert_labels:
+            index.index.add_items(normalize_rows(np.asarray(vectors, dtype=np.float32)), np.asarray(upsert_labels))
+
+        cls._save_graph(index.index, index_dir)
+        atomic_write_json(
+            Path(index_dir) / DOCUMENTS_FILE,
+            [{"page_content": d.page_content, "metadata": d.metadata} if d is not None else None
+             for d in index.documents]
+        )
+        manifest["count"] = sum(doc is not None for doc in index.documents)
+
+    def live_labels(self):
+        return [label for label, doc in enumerate(self.documents) if doc is not None]
+
+    def centroid(self):
+        return normalize_rows(self.vectors(self.live_labels()).mean(axis=0, keepdims=True))[0]
+
+    @staticmethod
+    def exists(index_dir):
+        return (Path(index_dir) / HNSW_FILE).exists() and (Path(index_dir) / MANIFEST_FILE).exists()
+
+    def set_ef(self, ef):
+        self.index.set_ef(ef)
+
+    def _knn(self, query_vector, k):
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # ef must be at least k for hnswlib to return k results
+        if self.index.ef < k:
+            self.index.set_ef(k)
+        labels, distances = self.index.knn_query(normalize_query(query_vector), k=k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+    def search(self, query_vector, k=4):
+        labels, scores = self._knn(query_vector, k)
+        return [(int(i), float(s)) for i, s in zip(labels, scores)]
+
+    def search_mmr(self, query_vector, k=4, fetch_k=20, lambda_mult=0.5):
+        candidates, scores = self._knn(query_vector, fetch_k)
+        if len(candidates) == 0:
+            return []
+        return mmr_select(candidates, scores, self.vectors(candidates), k, lambda_mult)
+
+    def vectors(self, ids):
+        return normalize_rows(np.asarray(self.index.get_items(list(ids)), dtype=np.float32))
+
+    def as_retriever(self, search_type="similarity", search_kwargs=None):
+        if search_type not in ("similarity", "mmr"):
+            raise ValueError(f"Unsupported search type for the HNSW index: {search_type}")
+        return IndexRetriever(self, search_type, search_kwargs or {})
+
+
+VECTOR_INDEXES = {
+    "numpy": NumpyVectorIndex,
+    "hnsw": HnswVectorIndex,
+}
+
+
+class IndexRetriever:
+    """Retriever with the same invoke(query) -> documents shape ChatSystem uses"""
+
+    def __init__(self, index, search_type, search_kwargs):
+        self.index = index
+        self.search_type = search_type
+        self.k = search_kwargs.get("k", 4)
+        self.fetch_k = search_kwargs.get("fetch_k", 20)
+        self.lambda_mult = search_kwargs.get("lambda_mult", 0.5)
+
+    def invoke(self, query):
+        query_vector = self.index.embeddings.embed_query(query)
+        if self.search_type == "mmr":
+            hits = self.index.search_mmr(query_vector, self.k, self.fetch_k, self.lambda_mult)
+        else:
+            hits = self.index.search(query_vector, self.k)
+        return [self.index.documents[i] for i, _ in hits]
+
+
+def directory_bytes(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def shard_slug(category):
+    return re.sub(r"[^a-z0-9]+", "-", category.lower().replace("’", "")).strip("-") or "shard"
+
+
+class ShardedVectorIndex:
+    """One numpy or HNSW index per catalog category, plus a centroid per shard.
+
+    A query goes to the shards whose category it names (query_parser), else
+    to the shards whose centroid is within `margin` of the closest one, else
+    to every shard. Shards are opened on first use and the least recently
+    used ones are closed once the open shards exceed `cache_bytes`.
+    """
+
+    def __init__(self, index_dir, manifest, centroids, embeddings=None, cache_bytes=256 * 2 ** 20,
+                 min_similarity=0.25, margin=0.05, load_options=None):
+        self.index_dir = Path(index_dir)
+        self.manifest = manifest
+        self.shard_names = list(manifest["shards"])
+        self.categories = {name: info["category"] for name, info in manifest["shards"].items()}
+        self.centroids = centroids
+        self.embeddings = embeddings
+        self.cache_bytes = cache_bytes
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.load_options = load_options or {}
+        self.loaded = OrderedDict()  # shard name -> index, least recently used first
+        self.loaded_bytes = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @classmethod
+    def build(cls, documents, embeddings, index_dir, shard_backend="numpy", build_options=None, extra_manifest=None):
+        return cls.build_from_vectors(embed_documents(documents, embeddings), documents, index_dir, embeddings,
+                                      shard_backend, build_options, extra_manifest)
+
+    @classmethod
+    def build_from_vectors(cls, matrix, documents, index_dir, embeddings=None, shard_backend="numpy",
+                           build_options=None, extra_manifest=None):
+        """Group documents by metadata["category"] and build one shard per group"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        start = time.time()
+        matrix = normalize_rows(np.asarray(matrix, dtype=np.float32))
+        shutil.rmtree(index_dir / SHARDS_DIR, ignore_errors=True)
+
+        groups = OrderedDict()
+        for row, doc in enumerate(documents):
+            groups.setdefault(doc.metadata.get("category") or UNCATEGORIZED, []).append(row)
+
+        shards = OrderedDict()
+        centroids = []
+        for category, rows in groups.items():
+            name = shard_slug(category)
+            shard_dir = index_dir / SHARDS_DIR / name
+            VECTOR_INDEXES[shard_backend].build_from_vectors(
+                matrix[rows], [documents[row] for row in rows], shard_dir, **(build_options or {})
+            )
+            shards[name] = {"category": category, "count": len(rows), "bytes": directory_bytes(shard_dir)}
+            centroids.append(normalize_rows(matrix[rows].mean(axis=0, keepdims=True))[0])
+        atomic_save_npy(index_dir / CENTROIDS_FILE, np.asarray(centroids, dtype=np.float32))
+
+        manifest = base_manifest("sharded", matrix, documents, start)
+        manifest.update({"shard_backend": shard_backend, "build_options": build_options or {}, "shards": shards})
+        if "content_hashes" in manifest:
+            manifest["shard_assignments"] = {
+                document_key(doc): shard_slug(doc.metadata.get("category") or UNCATEGORIZED) for doc in documents
+            }
+        manifest.update(extra_manifest or {})
+        atomic_write_json(index_dir / MANIFEST_FILE, manifest, indent=2)
+
+        logger.info(f"Built {len(shards)} {shard_backend} shards with {len(documents)} documents in {index_dir}")
+        return cls.load(index_dir, embeddings)
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None, **options):
+        """Read the manifest and centroids only; shards open on first use"""
+        index_dir = Path(index_dir)
+        with open(index_dir / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != "sharded":
+            raise ValueError(f"{index_dir} does not hold a sharded index")
+        centroids = np.load(index_dir / CENTROIDS_FILE)
+        return cls(index_dir, manifest, centroids, embeddings, **options)
+
+    @staticmethod
+    def exists(index_dir):
+        return (Path(index_dir) / CENTROIDS_FILE).exists() and (Path(index_dir) / MANIFEST_FILE).exists()
+
+    @classmethod
+    def apply_changes(cls, index_dir, manifest, documents, vectors, removed):
+        """Route upserts and deletes to the shards they touch and refresh those centroids.
+
+        A product whose category changed is deleted from its old shard and
+        upserted into the new one; shards left empty are dropped.
+        """
+        index_dir = Path(index_dir)
+        shard_class = VECTOR_INDEXES[manifest["shard_backend"]]
+        assignments = manifest["shard_assignments"]
+        old_centroids = dict(zip(manifest["shards"], np.load(index_dir / CENTROIDS_FILE)))
+
+        work = OrderedDict()  # shard name -> (documents, rows into vectors, removed keys)
+        for key in removed:
+            work.setdefault(assignments.pop(key), ([], [], []))[2].append(key)
+        for row, doc in enumerate(documents):
+            key = document_key(doc)
+            category = doc.metadata.get("category") or UNCATEGORIZED
+            name = shard_slug(category)
+            if assignments.get(key, name) != name:
+                work.setdefault(assignments[key], ([], [], []))[2].append(key)
+            assignments[key] = name
+            shard_docs, rows, _ = work.setdefault(name, ([], [], []))
+            shard_docs.append(doc)
+            rows.append(row)
+            manifest["shards"].setdefault(name, {"category": category, "count": 0, "bytes": 0})
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for name, (shard_docs, rows, shard_removed) in work.items():
+            shard_dir = index_dir / SHARDS_DIR / name
+            if shard_class.exists(shard_dir):
+                shard_manifest = apply_index_changes(shard_class, shard_dir, shard_docs, vectors[rows], shard_removed)
+            elif shard_docs:
+                shard_class.build_from_vectors(vectors[rows], shard_docs, shard_dir,
+                                               **manifest.get("build_options", {}))
+                shard_manifest = read_index_metadata(shard_dir)[1]
+            else:
+                continue
+
+            if shard_manifest["count"] == 0:
+                shutil.rmtree(shard_dir, ignore_errors=True)
+                del manifest["shards"][name]
+                old_centroids.pop(name, None)
+                continue
+            manifest["shards"][name].update(count=shard_manifest["count"], bytes=directory_bytes(shard_dir))
+            old_centroids[name] = shard_class.load(shard_dir).centroid()
+
+        atomic_save_npy(index_dir / CENTROIDS_FILE,
+                        np.asarray([old_centroids[name] for name in manifest["shards"]], dtype=np.float32))
+        manifest["count"] = sum(info["count"] for info in manifest["shards"].values())
+
+    def shard(self, name):
+        with self.lock:
+            record_cache("vector_shard", name in self.loaded)
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                return self.loaded[name]
+
+            shard_class = VECTOR_INDEXES[self.manifest["shard_backend"]]
+            index = shard_class.load(self.index_dir / SHARDS_DIR / name, self.embeddings, **self.load_options)
+            self.loaded[name] = index
+            self.loaded_bytes += self.manifest["shards"][name]["bytes"]
+
+            # Evict least recently used shards, never the one just opened
+            while self.loaded_bytes > self.cache_bytes and len(self.loaded) > 1:
+                evicted, _ = self.loaded.popitem(last=False)
+                self.loaded_bytes -= self.manifest["shards"][evicted]["bytes"]
+                logger.info(f"Evicted vector shard {evicted}")
+            SHARDS_LOADED_BYTES.set(self.loaded_bytes)
+            return index
+
+    def route(self, query, query_vector):
+        """Names of the shards a query should search"""
+        categories = match_categories(query, list(self.categories.values())) if query else []
+        if categories:
+            SHARD_ROUTES.inc(method="category")
+            return [name for name in self.shard_names if self.categories[name] in categories]
+
+        similarity = self.centroids @ normalize_query(query_vector)
+        best = float(similarity.max()) if len(similarity) else 0.0
+        if best >= self.min_similarity:
+            SHARD_ROUTES.inc(method="centroid")
+            return [name for name, score in zip(self.shard_names, similarity) if score >= best - self.margin]
+
+        SHARD_ROUTES.inc(method="all")
+        return list(self.shard_names)
+
+    def search(self, query_vector, k=4, shard_names=None):
+        """Return [(shard name, document index, score)] merged across shards, best first"""
+        hits = []
+        for name in shard_names or self.shard_names:
+            hits.extend((name, i, score) for i, score in self.shard(name).search(query_vector, k))
+        return sorted(hits, key=lambda hit: -hit[2])[:k]
+
+    def search_mmr(self, query_vector, k=4, fetch_k=20, lambda_mult=0.5, shard_names=None):
+        candidates = self.search(query_vector, fetch_k, shard_names)
+        if not candidates:
+            return []
+        candidate_vectors = np.vstack([self.shard(name).vectors([i]) for name, i, _ in candidates])
+        scores = np.asarray([score for _, _, score in candidates], dtype=np.float32)
+        picked = mmr_select(np.arange(len(candidates)), scores, candidate_vectors, k, lambda_mult)
+        return [candidates[position] for position, _ in picked]
+
+    def document(self, name, i):
+        return self.shard(name).documents[i]
+
+    def as_retriever(self, search_type="similarity", search_kwargs=None):
+        if search_type not in ("similarity", "mmr"):
+            raise ValueError(f"Unsupported search type for the sharded index: {search_type}")
+        return ShardedRetriever(self, search_type, search_kwargs or {})
+
+
+class ShardedRetriever(IndexRetriever):
+    def invoke(self, query):
+        query_vector = self.index.embeddings.embed_query(query)
+        shard_names = self.index.route(query, query_vector)
+        if self.search_type == "mmr":
+            hits = self.index.search_mmr(query_vector, self.k, self.fetch_k, self.lambda_mult, shard_names)
+        else:
+            hits = self.index.search(query_vector, self.k, shard_names)
+        return [self.index.document(name, i) for name, i, _ in hits]
+
+
+INDEX_FORMATS = {
+    "numpy-brute-force": NumpyVectorIndex,
+    "hnsw": HnswVectorIndex,
+    "sharded": ShardedVectorIndex,
+}
+
+
+def load_product_vectors(index_dir):
+    """(product codes, normalized vectors, manifest) from a per-product index of any format"""
+    index_dir = Path(index_dir)
+    with open(index_dir / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    if "content_hashes" not in manifest:
+        raise ValueError(f"{index_dir} does not hold one document per product; build it with --source products")
+    if manifest["format"] == "sharded":
+        shard_class = VECTOR_INDEXES[manifest["shard_backend"]]
+        indexes = [shard_class.load(index_dir / SHARDS_DIR / name) for name in manifest["shards"]]
+    else:
+        indexes = [INDEX_FORMATS[manifest["format"]].load(index_dir)]
+
+    codes, blocks = [], []
+    for index in indexes:
+        ids = [i for i, doc in enumerate(index.documents) if doc is not None]
+        if ids:
+            codes.extend(document_key(index.documents[i]) for i in ids)
+            blocks.append(index.vectors(ids))
+    matrix = np.vstack(blocks) if blocks else np.empty((0, manifest.get("dimension", 0)), dtype=np.float32)
+    return codes, normalize_rows(matrix), manifest
+
+
+def apply_index_changes(index_class, index_dir, documents, vectors, removed):
+    """Apply upserts and deletes to one index directory and bump its version"""
+    with open(Path(index_dir) / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    index_class.apply_changes(index_dir, manifest, documents, vectors, removed)
+
+    hashes = manifest.get("content_hashes", {})
+    for key in removed:
+        hashes.pop(key, None)
+    hashes.update({document_key(doc): content_hash(doc) for doc in documents})
+    manifest.update(content_hashes=hashes, version=manifest.get("version", 1) + 1,
+                    updated_at=datetime.now().isoformat())
+    # Written last: workers reload when the manifest changes
+    atomic_write_json(Path(index_dir) / MANIFEST_FILE, manifest, indent=2)
+    return manifest
+
+
+def update_vector_index(index_dir, documents, embeddings, dry_run=False):
+    """Embed and upsert only the products whose content hash changed since the index was built.
+
+    Returns the diff summary and the new index version.
+    """
+    with open(Path(index_dir) / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    old_hashes = manifest.get("content_hashes")
+    new_hashes = content_hashes(documents)
+    if old_hashes is None or new_hashes is None:
+        raise ValueError("Incremental updates need one document per product code; rebuild the index instead")
+
+    added, changed, removed = diff_catalog(old_hashes, new_hashes)
+    summary = {"added": added, "changed": changed, "removed": removed, "version": manifest.get("version", 1)}
+    if dry_run or not (added or changed or removed):
+        return summary
+
+    by_key = {document_key(doc): doc for doc in documents}
+    upserts = [by_key[key] for key in added + changed]
+    vectors = embed_documents(upserts, embeddings)
+    manifest = apply_index_changes(INDEX_FORMATS[manifest["format"]], index_dir, upserts, vectors, removed)
+    logger.info(f"Updated vector index in {index_dir} to version {manifest['version']}: "
+                f"{len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    summary["version"] = manifest["version"]
+    return summary
@@ -0,0 +1,109 @@
+# write_behind.py
+
+import atexit
+import threading
+
+from config import logger
+from metrics import Counter, Gauge
+
+WRITE_BEHIND_UPDATES = Counter("walmate_write_behind_updates_total", "Buffered record updates by outcome")
+WRITE_BEHIND_PENDING = Gauge("walmate_write_behind_pending", "Records with buffered updates not yet written")
+
+
+class WriteBehindBuffer:
+    """Coalesces low-value field updates to a JSON record file and writes them in batches.
+
+    set() only touches memory; repeated updates to the same record collapse
+    into one. A daemon thread flushes every `interval` seconds (sooner once
+    `max_pending` records are waiting), and close() flushes at shutdown. A
+    flush is one read-modify-write of the file under `lock`, which every
+    synchronous writer of the file must also hold, so a flush can't
+    overwrite their changes or be overwritten by them. Updates to records
+    deleted in the meantime are dropped.
+    """
+
+    def __init__(self, name, filename, load, save, lock, interval=5.0, max_pending=1000):
+        self.name = name
+        self.filename = filename
+        self.load = load
+        self.save = save
+        self.lock = lock
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}  # record key -> {field: value}
+        self.pending_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def set(self, key, **fields):
+        if self.interval <= 0:
+            # Write-behind disabled: write through
+            with self.pending_lock:
+                self.pending.setdefault(key, {}).update(fields)
+            self.flush()
+            return
+
+        with self.pending_lock:
+            WRITE_BEHIND_UPDATES.inc(buffer=self.name, result="coalesced" if key in self.pending else "queued")
+            self.pending.setdefault(key, {}).update(fields)
+            WRITE_BEHIND_PENDING.set(len(self.pending), buffer=self.name)
+            if self.thread is None and not self.stopped:
+                # Started on first use so each worker process gets its own thread
+                self.thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+            if len(self.pending) >= self.max_pending:
+                self.wake.set()
+
+    def overlay(self, key, record):
+        """`record` with its buffered updates applied, for reads that must see them"""
+        with self.pending_lock:
+            fields = self.pending.get(key)
+            return {**record, **fields} if fields else record
+
+    def flush(self):
+        """Write all buffered updates; returns the number of records updated"""
+        with self.pending_lock:
+            batch, self.pending = self.pending, {}
+            WRITE_BEHIND_PENDING.set(0, buffer=self.name)
+        if not batch:
+            return 0
+
+        try:
+            with self.lock:
+                records = self.load(self.filename)
+                applied = 0
+                for key, fields in batch.items():
+                    if key in records:
+                        records[key].update(fields)
+                        applied += 1
+                # An unreadable file loads as {}; never write that back
+                if applied:
+                    self.save(self.filename, records)
+        except Exception:
+            # Requeue for the next flush; updates made since then win
+            with self.pending_lock:
+                for key, fields in batch.items():
+                    self.pending[key] = {**fields, **self.pending.get(key, {})}
+                WRITE_BEHIND_PENDING.set(len(self.pending), buffer=self.name)
+            raise
+        WRITE_BEHIND_UPDATES.inc(len(batch), buffer=self.name, result="flushed")
+        return applied
+
+    def _run(self):
+        while not self.stopped:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush of {self.filename} failed: {str(e)}")
+
+    def close(self):
+        """Stop the flush thread and write whatever is still buffered"""
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=self.interval + 5)
+        self.flush()
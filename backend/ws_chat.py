@@ -0,0 +1,221 @@
+# ws_chat.py
+
+import asyncio
+import json
+import time
+from collections import deque
+
+from admission import AdmissionRejected
+from auth import get_user_preferences, token_username
+from chat import ChatSystem, generate_chat_id, get_user_chat_ids, save_user_chat_id
+from config import CONFIG, logger
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from metrics import Counter, Gauge
+
+WS_CHAT_CONNECTIONS = Gauge("walmate_ws_chat_connections", "Open /ws/chat connections")
+WS_CHAT_TURNS = Counter("walmate_ws_chat_turns_total", "Chat turns over /ws/chat by outcome")
+
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_GOING_AWAY = 1001
+
+
+class ChatConnection:
+    """One /ws/chat connection and the session state it keeps in memory.
+
+    The JWT is checked and chat ownership resolved once, at connect, and the
+    user's preferences and the chat's recent history are loaded then too and
+    kept for the life of the connection. A turn therefore costs no auth or
+    session reads, only the history append.
+
+    Everything sent to the client goes through a bounded queue drained by a
+    single sender task. When the client reads slowly the queue fills and
+    the LLM stream is paused rather than buffered without limit; tokens
+    queued in the meantime go out coalesced in one frame. The server pings
+    every WS_HEARTBEAT_SECONDS and drops clients that have sent nothing for
+    WS_HEARTBEAT_TIMEOUT_SECONDS, or that don't take a frame within
+    WS_SEND_TIMEOUT_SECONDS.
+
+    Messages are JSON text frames:
+        client: {"type": "message", "message": ...}, {"type": "history"}, {"type": "pong"}
+        server: {"type": "ready", "chat_id", "history"}, {"type": "token", "text"},
+                {"type": "done", "answer", "product_ids", "response_time", "chat_id"},
+                {"type": "history", "history"}, {"type": "ping"},
+                {"type": "error", "detail", "retry_after"}
+    The answer in "done" is final and replaces the streamed tokens.
+    """
+
+    def __init__(self, websocket: WebSocket, username, chat_id, admission):
+        self.websocket = websocket
+        self.username = username
+        self.chat_id = chat_id
+        self.admission = admission
+        self.preferences = None
+        self.history = deque(maxlen=CONFIG["WS_CHAT_HISTORY_TURNS"])
+        self.outbox = asyncio.Queue(maxsize=CONFIG["WS_SEND_QUEUE_SIZE"])
+        self.last_seen = time.monotonic()
+        self.turn = None
+
+    async def load_session(self):
+        self.preferences = await run_in_threadpool(get_user_preferences, self.username)
+        history = await run_in_threadpool(ChatSystem.load_chat_history, self.chat_id)
+        self.history.extend(history[-self.history.maxlen:])
+
+    def hydrated_history(self):
+        return ChatSystem.hydrate_history(list(self.history))
+
+    async def send(self, message):
+        # Waits while the queue is full: this is what pauses a turn for a slow client
+        await self.outbox.put(message)
+
+    async def sender(self):
+        carried = None
+        while True:
+            message = carried or await self.outbox.get()
+            carried = None
+            if message["type"] == "token":
+                text = [message["text"]]
+                while not self.outbox.empty():
+                    queued = self.outbox.get_nowait()
+                    if queued["type"] != "token":
+                        carried = queued
+                        break
+                    text.append(queued["text"])
+                message = {"type": "token", "text": "".join(text)}
+            try:
+                await asyncio.wait_for(self.websocket.send_text(json.dumps(message)),
+                                       timeout=CONFIG["WS_SEND_TIMEOUT_SECONDS"])
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping /ws/chat connection of {self.username}: client stopped reading")
+                return
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(CONFIG["WS_HEARTBEAT_SECONDS"])
+            if time.monotonic() - self.last_seen > CONFIG["WS_HEARTBEAT_TIMEOUT_SECONDS"]:
+                logger.info(f"Dropping /ws/chat connection of {self.username}: no heartbeat")
+                return
+            try:
+                self.outbox.put_nowait({"type": "ping"})
+            except asyncio.QueueFull:
+                # Frames are queued anyway; the send timeout catches a stuck client
+                pass
+
+    async def receiver(self):
+        while True:
+            try:
+                message = json.loads(await self.websocket.receive_text())
+            except WebSocketDisconnect:
+                return
+            except ValueError:
+                await self.send({"type": "error", "detail": "Messages must be JSON"})
+                continue
+            self.last_seen = time.monotonic()
+
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "message":
+                text = str(message.get("message") or "").strip()
+                if not text:
+                    await self.send({"type": "error", "detail": "Message is empty"})
+                elif self.turn is not None and not self.turn.done():
+                    await self.send({"type": "error", "detail": "Still answering the previous message"})
+                else:
+                    self.turn = asyncio.create_task(self.answer(text))
+            elif kind == "history":
+                await self.send({"type": "history", "history": self.hydrated_history()})
+            elif kind != "pong":
+                await self.send({"type": "error", "detail": f"Unknown message type: {kind}"})
+
+    async def answer(self, text):
+        try:
+            await self.admission.acquire(f"user:{self.username}")
+        except AdmissionRejected as e:
+            WS_CHAT_TURNS.inc(result="shed")
+            await self.send({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+            return
+
+        try:
+            events = ChatSystem.stream_response(text, self.preferences)
+            step = None
+            try:
+                while True:
+                    # Shielded so a cancelled turn can still wait for the worker below
+                    step = asyncio.ensure_future(run_in_threadpool(next, events))
+                    kind, value = await asyncio.shield(step)
+                    if kind == "done":
+                        response = value
+                        break
+                    await self.send({"type": "token", "text": value})
+            finally:
+                if step is not None and not step.done():
+                    # Cancelled while a worker thread is inside next(). The LLM
+                    # deadline bounds the wait, and the slot stays taken until
+                    # the worker is actually free.
+                    await asyncio.wait([step])
+                try:
+                    events.close()
+                except ValueError:
+                    # Still executing: only if this turn was cancelled twice
+                    pass
+        finally:
+            self.admission.release()
+
+        # Persisted before "done" so a client that drops right after still finds the turn
+        await run_in_threadpool(ChatSystem.add_to_history, self.chat_id, text, response["answer"],
+                                response["product_ids"], self.username)
+        entry = {"prompt": text, "response": response["answer"]}
+        if response["product_ids"]:
+            entry["product_ids"] = [str(product_id) for product_id in response["product_ids"]]
+        self.history.append(entry)
+
+        await self.send({
+            "type": "done",
+            "answer": response["answer"],
+            "product_ids": response["product_ids"],
+            "response_time": response["response_time"],
+            "chat_id": self.chat_id
+        })
+        WS_CHAT_TURNS.inc(result="answered")
+
+    async def run(self):
+        await self.load_session()
+        await self.websocket.send_text(json.dumps(
+            {"type": "ready", "chat_id": self.chat_id, "history": self.hydrated_history()}))
+
+        tasks = [asyncio.create_task(coro) for coro in (self.receiver(), self.sender(), self.heartbeat())]
+        try:
+            # Whichever stops first (disconnect, stuck client, missed heartbeats) ends the connection
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if self.turn is not None:
+                tasks.append(self.turn)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.websocket.close(code=CLOSE_GOING_AWAY)
+        except RuntimeError:
+            # Already closed by the client
+            pass
+
+
+async def serve_chat_connection(websocket: WebSocket, token, chat_id, admission):
+    username = token_username(token) if token else None
+    if username is None:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION, reason="Could not validate credentials")
+        return
+
+    if chat_id:
+        if chat_id not in await run_in_threadpool(get_user_chat_ids, username):
+            await websocket.close(code=CLOSE_POLICY_VIOLATION, reason="Chat not found")
+            return
+    else:
+        chat_id = generate_chat_id()
+        await run_in_threadpool(save_user_chat_id, username, chat_id)
+
+    await websocket.accept()
+    WS_CHAT_CONNECTIONS.inc()
+    try:
+        await ChatConnection(websocket, username, chat_id, admission).run()
+    finally:
+        WS_CHAT_CONNECTIONS.dec()